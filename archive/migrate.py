@@ -0,0 +1,125 @@
+# migrate.py
+"""
+Move an existing one-file-per-capture directory into the packed archive.
+
+    python -m archive.migrate [--src raw/screenshots] [--dst raw/archive] [--delete] [--dry-run]
+
+'.pending' captures are left alone (they still need processing). Files are
+appended in timestamp order; with --delete each loose file (and its
+metadata sidecar) is removed right after its image has been read back and
+checked against the original bytes.
+
+Re-running is idempotent: a file whose timestamp and size already match an
+archived entry is not appended again (with --delete it is checked against
+that entry and removed), so an interrupted or repeated run neither
+duplicates captures nor makes the backfill process them twice.
+"""
+import argparse
+import os
+import re
+import time
+
+from archive.segments import Archive, ts_to_ms
+from subfuncsInput.screenshot import capture_ms, capture_stem, metadata_paths, read_capture_metadata
+
+_CAPTURE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(_\d{3})?\.(png|jpg|jpeg)(\.enc)?$")
+
+
+def _loose_captures(src: str):
+    found = []
+    for fname in os.listdir(src):
+        if _CAPTURE_RE.match(fname):
+            found.append(os.path.join(src, fname))
+        elif re.match(r"^\d{4}-\d{2}-\d{2} \d{2}_\d{2}\.png$", fname):
+            # early captures were named 'YYYY-MM-DD HH_MM.png'
+            found.append(os.path.join(src, fname))
+    return sorted(found, key=_ts_ms)
+
+
+def _ts_ms(path: str) -> int:
+    stem = capture_stem(path)
+    if " " in stem:
+        day, hm = stem.split(" ")
+        return ts_to_ms(f"{day}_{hm.replace('_', '-')}-00")
+    return capture_ms(path)
+
+
+def _archived(archive: Archive, ts_ms: int, size: int):
+    """The archived entry for a capture with this timestamp and size, if any."""
+    return next((e for e in archive.range(ts_ms, ts_ms + 1) if e.length == size), None)
+
+
+def migrate(src: str, dst: str, delete: bool = False, dry_run: bool = False) -> int:
+    paths = _loose_captures(src)
+    if dry_run:
+        total = sum(os.path.getsize(p) for p in paths)
+        print(f"(MIG) would archive {len(paths)} files ({total / 1e6:.1f} MB) from {src} into {dst}")
+        return len(paths)
+
+    archive = Archive(dst)
+    t0 = time.perf_counter()
+    done = skipped = 0
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            ts_ms = _ts_ms(path)
+            entry = _archived(archive, ts_ms, len(data))
+            if entry is not None:
+                skipped += 1
+            else:
+                entry = archive.append(
+                    ts_ms,
+                    data,
+                    read_capture_metadata(path) or None,
+                    encrypted=".enc" in os.path.basename(path),
+                )
+        except Exception as e:
+            print(f"(MIG.e) failed to archive {path}: {e}")
+            continue
+
+        if delete:
+            if bytes(archive.read_image(entry)) != data:
+                print(f"(MIG.e) read-back mismatch for {path}; keeping the original")
+                continue
+            os.remove(path)
+            for sidecar in metadata_paths(path):
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+        done += 1
+        if done % 500 == 0:
+            print(f"(MIG) {done}/{len(paths)}")
+
+    archive.close()
+    print(f"(MIG.✓) archived {done}/{len(paths)} files ({skipped} already there) in {time.perf_counter() - t0:.1f}s")
+    return done
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--src", default="raw/screenshots")
+    ap.add_argument("--dst", default="raw/archive")
+    ap.add_argument("--delete", action="store_true", help="remove loose files once archived")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--retention-days", type=int, default=None, help="then drop days older than this")
+    ap.add_argument("--compact", action="store_true", help="then compact every archived day")
+    args = ap.parse_args()
+
+    migrate(args.src, args.dst, delete=args.delete, dry_run=args.dry_run)
+    if args.dry_run:
+        return
+
+    archive = Archive(args.dst)
+    if args.retention_days is not None:
+        removed = archive.apply_retention(args.retention_days)
+        print(f"(MIG) retention removed {len(removed)} segments")
+    if args.compact:
+        days = sorted({e.timestamp[:10] for e in archive.range()})
+        for day in days:
+            archive.compact(day)
+        print(f"(MIG) compacted {len(days)} days")
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
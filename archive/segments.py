@@ -0,0 +1,446 @@
+# segments.py
+"""
+Packed, indexed screenshot archive.
+
+Instead of one PNG per capture, images are appended to per-day segment files:
+
+    <root>/<YYYY-MM-DD>.<n>.dat   image bytes, each followed by its metadata JSON
+    <root>/<YYYY-MM-DD>.<n>.thm   small JPEG thumbnails
+    <root>/<YYYY-MM-DD>.<n>.idx   fixed-size index records (RECORD below)
+
+A segment rolls over at SEGMENT_MAX_BYTES. Index records are written last,
+so a crash mid-append leaves unreferenced bytes, never a dangling record.
+Compaction writes a new segment next to the old ones plus a
+'<segment>.replaces' note naming them; opening the archive finishes (or
+rolls back) a compaction that was interrupted.
+Timestamps are stored in milliseconds (from the capture name, see
+subfuncsInput.screenshot.capture_name) and duplicates are allowed, so
+captures in the same second, or of several monitors at once, all keep
+their own entry.
+
+Reads go through mmap; `read_image` returns a zero-copy memoryview.
+Encrypted captures ('.png.enc') are stored as-is with FLAG_ENCRYPTED, and
+their thumbnails/metadata are encrypted the same way.
+"""
+import bisect
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from PIL import Image
+
+from encryption.at_rest import DecryptingReader, EncryptingWriter
+from subfuncsInput.screenshot import capture_ms, metadata_paths, read_capture_metadata
+
+ARCHIVE_ROOT = "raw/archive"
+SEGMENT_MAX_BYTES = 512 * 1024 * 1024
+THUMB_SIZE = (320, 200)
+THUMB_QUALITY = 70
+
+# ts_ms, offset, length, meta_length, thumb_offset, thumb_length, flags
+RECORD = struct.Struct("<qQIIQIB3x")
+FLAG_ENCRYPTED = 1
+FLAG_DELETED = 2
+
+_SEGMENT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})\.(\d+)\.idx$")
+_REPLACES_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}\.\d+)\.replaces$")
+_COMPACT_TMP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}\.compact\.(dat|thm|idx)$")
+_EXTS = (".dat", ".thm", ".idx")
+_TS_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+
+def ts_to_ms(ts: str) -> int:
+    return int(datetime.strptime(ts, _TS_FORMAT).timestamp() * 1000)
+
+
+def ms_to_ts(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000).strftime(_TS_FORMAT)
+
+
+@dataclass
+class Entry:
+    segment: str
+    slot: int             # record number inside the segment's .idx
+    ts_ms: int
+    offset: int
+    length: int
+    meta_length: int
+    thumb_offset: int
+    thumb_length: int
+    flags: int
+
+    @property
+    def timestamp(self) -> str:
+        return ms_to_ts(self.ts_ms)
+
+    @property
+    def encrypted(self) -> bool:
+        return bool(self.flags & FLAG_ENCRYPTED)
+
+
+class _Segment:
+    def __init__(self, root: str, name: str):
+        self.name = name
+        self.base = os.path.join(root, name)
+        self.entries: List[Entry] = []
+        self.ts: List[int] = []     # sorted, parallel to self.entries
+        self._mmaps: Dict[str, mmap.mmap] = {}
+        self._load()
+
+    def _load(self) -> None:
+        entries = []
+        try:
+            with open(self.base + ".idx", "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raw = b""
+        usable = len(raw) - len(raw) % RECORD.size
+        if usable != len(raw):
+            # torn trailing record from a crash; drop it so new slots stay aligned
+            with open(self.base + ".idx", "r+b") as f:
+                f.truncate(usable)
+        for slot, rec in enumerate(RECORD.iter_unpack(raw[:usable])):
+            entries.append(Entry(self.name, slot, *rec))
+        entries.sort(key=lambda e: e.ts_ms)
+        self.entries = entries
+        self.ts = [e.ts_ms for e in entries]
+
+    def add(self, entry: Entry) -> None:
+        i = bisect.bisect_right(self.ts, entry.ts_ms)
+        self.ts.insert(i, entry.ts_ms)
+        self.entries.insert(i, entry)
+        self.close_maps()   # file grew; remap lazily on next read
+
+    def data_size(self) -> int:
+        try:
+            return os.path.getsize(self.base + ".dat")
+        except FileNotFoundError:
+            return 0
+
+    def view(self, ext: str) -> memoryview:
+        m = self._mmaps.get(ext)
+        if m is None:
+            with open(self.base + ext, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmaps[ext] = m
+        return memoryview(m)
+
+    def close_maps(self) -> None:
+        for m in self._mmaps.values():
+            try:
+                m.close()
+            except BufferError:
+                pass   # a caller still holds a view; the map dies with it
+        self._mmaps = {}
+
+
+def _remove_segment_files(base: str) -> None:
+    for ext in _EXTS:
+        try:
+            os.remove(base + ext)
+        except FileNotFoundError:
+            pass
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return      # Windows can't open directories; renames there are durable enough
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _make_thumbnail(image_bytes, encrypted: bool) -> bytes:
+    src = io.BufferedReader(DecryptingReader(io.BytesIO(image_bytes))) if encrypted else io.BytesIO(image_bytes)
+    with Image.open(src) as im:
+        im.draft("RGB", THUMB_SIZE)
+        im = im.convert("RGB")
+        im.thumbnail(THUMB_SIZE)
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=THUMB_QUALITY)
+    return _maybe_encrypt(out.getvalue(), encrypted)
+
+
+def _maybe_encrypt(data: bytes, encrypted: bool) -> bytes:
+    if not encrypted:
+        return data
+    out = io.BytesIO()
+    w = EncryptingWriter(out)
+    w.write(data)
+    w.close()
+    return out.getvalue()
+
+
+def _maybe_decrypt(data, encrypted: bool) -> bytes:
+    if not encrypted:
+        return bytes(data)
+    with io.BufferedReader(DecryptingReader(io.BytesIO(data))) as f:
+        return f.read()
+
+
+class Archive:
+    def __init__(self, root: str = ARCHIVE_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._segments: Dict[str, _Segment] = {}
+        self._recover()
+        for fname in sorted(os.listdir(root)):
+            if _SEGMENT_RE.match(fname):
+                name = fname[: -len(".idx")]
+                self._segments[name] = _Segment(root, name)
+
+    def _recover(self) -> None:
+        """
+        Finish or roll back a compaction a crash interrupted. A '.replaces'
+        note whose segment has its .idx means the compacted copy is complete,
+        so the segments it names are removed; without the .idx the copy is
+        partial and is removed instead. Stray '.compact' temp files go too.
+        """
+        for fname in sorted(os.listdir(self.root)):
+            note = os.path.join(self.root, fname)
+            if _COMPACT_TMP_RE.match(fname):
+                os.remove(note)
+                continue
+            m = _REPLACES_RE.match(fname)
+            if not m:
+                continue
+            new = os.path.join(self.root, m.group(1))
+            if os.path.exists(new + ".idx"):
+                with open(note) as f:
+                    for old in json.load(f):
+                        if old != m.group(1):
+                            _remove_segment_files(os.path.join(self.root, old))
+                if not os.path.getsize(new + ".idx"):
+                    _remove_segment_files(new)      # the day compacted to nothing
+            else:
+                _remove_segment_files(new)
+            os.remove(note)
+
+    # ---------- writing ----------
+
+    def _segment_for(self, day: str, incoming: int) -> _Segment:
+        names = sorted(
+            (n for n in self._segments if n.startswith(day + ".")),
+            key=lambda n: int(n.split(".")[1]),
+        )
+        if names:
+            seg = self._segments[names[-1]]
+            if seg.data_size() + incoming <= SEGMENT_MAX_BYTES:
+                return seg
+            n = int(names[-1].split(".")[1]) + 1
+        else:
+            n = 0
+        seg = _Segment(self.root, f"{day}.{n}")
+        self._segments[seg.name] = seg
+        return seg
+
+    def append(
+        self,
+        ts_ms: int,
+        image_bytes,
+        metadata: Optional[dict] = None,
+        encrypted: bool = False,
+        thumbnail: bool = True,
+    ) -> Entry:
+        """
+        Append one encoded image (plus optional metadata) and return its Entry.
+        """
+        meta = _maybe_encrypt(json.dumps(metadata).encode("utf-8"), encrypted) if metadata else b""
+        thumb = _make_thumbnail(image_bytes, encrypted) if thumbnail else b""
+        flags = FLAG_ENCRYPTED if encrypted else 0
+        day = datetime.fromtimestamp(ts_ms / 1000).strftime("%Y-%m-%d")
+
+        with self._lock:
+            seg = self._segment_for(day, len(image_bytes) + len(meta))
+            with open(seg.base + ".dat", "ab") as f:
+                offset = f.tell()
+                f.write(image_bytes)
+                f.write(meta)
+            with open(seg.base + ".thm", "ab") as f:
+                thumb_offset = f.tell()
+                f.write(thumb)
+            with open(seg.base + ".idx", "ab") as f:
+                slot = f.tell() // RECORD.size
+                f.write(RECORD.pack(ts_ms, offset, len(image_bytes), len(meta), thumb_offset, len(thumb), flags))
+            entry = Entry(seg.name, slot, ts_ms, offset, len(image_bytes), len(meta), thumb_offset, len(thumb), flags)
+            seg.add(entry)
+            return entry
+
+    def append_file(self, path: str, ts_ms: int, metadata: Optional[dict] = None) -> Entry:
+        with open(path, "rb") as f:
+            data = f.read()
+        return self.append(ts_ms, data, metadata, encrypted=".enc" in os.path.basename(path))
+
+    # ---------- reading ----------
+
+    def __len__(self) -> int:
+        return sum(len(s.entries) for s in self._segments.values())
+
+    def range(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Iterator[Entry]:
+        """
+        Live entries with start_ms <= ts < end_ms, in timestamp order.
+        """
+        with self._lock:
+            segments = [self._segments[n] for n in sorted(self._segments)]
+        hits: List[Entry] = []
+        for seg in segments:
+            lo = 0 if start_ms is None else bisect.bisect_left(seg.ts, start_ms)
+            hi = len(seg.ts) if end_ms is None else bisect.bisect_left(seg.ts, end_ms)
+            hits.extend(e for e in seg.entries[lo:hi] if not e.flags & FLAG_DELETED)
+        hits.sort(key=lambda e: e.ts_ms)
+        return iter(hits)
+
+    def find(self, ts: str) -> List[Entry]:
+        ms = ts_to_ms(ts)
+        return list(self.range(ms, ms + 1000))
+
+    def read_image(self, entry: Entry) -> memoryview:
+        """
+        Stored image bytes as a zero-copy view (still encrypted if entry.encrypted).
+        """
+        return self._segments[entry.segment].view(".dat")[entry.offset: entry.offset + entry.length]
+
+    def open_image(self, entry: Entry):
+        """
+        Readable stream of the plaintext image, for Image.open().
+        """
+        data = self.read_image(entry)
+        if entry.encrypted:
+            return io.BufferedReader(DecryptingReader(io.BytesIO(data)))
+        return io.BytesIO(data)
+
+    def read_thumbnail(self, entry: Entry) -> bytes:
+        if not entry.thumb_length:
+            return b""
+        view = self._segments[entry.segment].view(".thm")
+        return _maybe_decrypt(view[entry.thumb_offset: entry.thumb_offset + entry.thumb_length], entry.encrypted)
+
+    def read_metadata(self, entry: Entry) -> dict:
+        if not entry.meta_length:
+            return {}
+        start = entry.offset + entry.length
+        view = self._segments[entry.segment].view(".dat")
+        return json.loads(_maybe_decrypt(view[start: start + entry.meta_length], entry.encrypted))
+
+    # ---------- retention / compaction ----------
+
+    def delete(self, entry: Entry) -> None:
+        """
+        Tombstone an entry; space is reclaimed by compact().
+        """
+        with self._lock:
+            seg = self._segments[entry.segment]
+            with open(seg.base + ".idx", "r+b") as f:
+                f.seek(entry.slot * RECORD.size + RECORD.size - 4)
+                f.write(bytes([entry.flags | FLAG_DELETED]))
+            entry.flags |= FLAG_DELETED
+
+    def apply_retention(self, keep_days: int) -> List[str]:
+        """
+        Drop whole segments (images, thumbnails and index) for days older than
+        `keep_days`. Returns the removed segment names.
+        """
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+        removed = []
+        with self._lock:
+            for name in sorted(self._segments):
+                if name.split(".")[0] >= cutoff:
+                    continue
+                seg = self._segments.pop(name)
+                seg.close_maps()
+                _remove_segment_files(seg.base)
+                removed.append(name)
+        return removed
+
+    def compact(self, day: str) -> Optional[str]:
+        """
+        Rewrite all segments of `day` into one, sorted by time, without
+        tombstoned entries. Returns the new segment name (None if empty).
+
+        The copy goes to a fresh segment number and is fsynced and renamed
+        into place (.idx last) before any old segment is removed; the
+        '.replaces' note lets _recover finish the job after a crash, so the
+        day is readable from either the old segments or the new one at every
+        point.
+        """
+        with self._lock:
+            names = sorted(
+                (n for n in self._segments if n.startswith(day + ".")),
+                key=lambda n: int(n.split(".")[1]),
+            )
+            if not names:
+                return None
+            live = [e for n in names for e in self._segments[n].entries if not e.flags & FLAG_DELETED]
+            live.sort(key=lambda e: e.ts_ms)
+
+            name = f"{day}.{int(names[-1].split('.')[1]) + 1}"
+            base = os.path.join(self.root, name)
+            note = base + ".replaces"
+            if live:
+                tmp = os.path.join(self.root, f"{day}.compact")
+                with open(tmp + ".dat", "wb") as dat, open(tmp + ".thm", "wb") as thm, open(tmp + ".idx", "wb") as idx:
+                    for e in live:
+                        seg = self._segments[e.segment]
+                        offset, thumb_offset = dat.tell(), thm.tell()
+                        dat.write(seg.view(".dat")[e.offset: e.offset + e.length + e.meta_length])
+                        if e.thumb_length:
+                            thm.write(seg.view(".thm")[e.thumb_offset: e.thumb_offset + e.thumb_length])
+                        idx.write(RECORD.pack(
+                            e.ts_ms, offset, e.length, e.meta_length, thumb_offset, e.thumb_length, e.flags
+                        ))
+                    for f in (dat, thm, idx):
+                        f.flush()
+                        os.fsync(f.fileno())
+            with open(note, "w") as f:
+                json.dump(names, f)
+                f.flush()
+                os.fsync(f.fileno())
+            if live:
+                # .idx last: until it's in place, _recover treats the copy as partial
+                for ext in _EXTS:
+                    os.replace(tmp + ext, base + ext)
+            else:
+                open(base + ".idx", "wb").close()     # an empty day: the note alone commits it
+            _fsync_dir(self.root)
+
+            for n in names:
+                seg = self._segments.pop(n)
+                seg.close_maps()
+                _remove_segment_files(seg.base)
+            if not live:
+                _remove_segment_files(base)
+            os.remove(note)
+            if not live:
+                return None
+            self._segments[name] = _Segment(self.root, name)
+            return name
+
+    def close(self) -> None:
+        with self._lock:
+            for seg in self._segments.values():
+                seg.close_maps()
+
+
+def archive_capture(archive: Archive, image_path: str) -> Entry:
+    """
+    Move a loose capture file and its metadata sidecar into the archive. The
+    loose files are removed only after the index record is written.
+    """
+    ts_ms = capture_ms(image_path)
+    entry = archive.append_file(image_path, ts_ms, read_capture_metadata(image_path) or None)
+    os.remove(image_path)
+    for sidecar in metadata_paths(image_path):
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+    return entry
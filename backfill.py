@@ -0,0 +1,282 @@
+# backfill.py
+"""
+Bulk-process historical or '.pending' screenshots through the same pipeline
+as the live loop: vision → canonicalize → insert → episoder.
+
+    python backfill.py raw/screenshots [--workers 8] [--checkpoint backfill.ckpt.jsonl]
+    python backfill.py --archive raw/archive --since 2025-10-25 --until 2025-10-30
+    python backfill.py raw/screenshots --batch 8     # several images per vision request
+
+Images are analyzed concurrently (the shared OpenAI rate limiter keeps the
+account under its limits) but handed to the episoder strictly in timestamp
+order. With --batch N, runs of N consecutive images share one vision
+request, which cuts the repeated prompt tokens at some cost in per-image
+latency. Progress goes to an append-only JSONL checkpoint, so an interrupted
+run picks up where it stopped: inserted-but-not-episoded rows are replayed
+from the checkpoint without calling the API again. A row counts as episoded
+only once the episode containing it has been stored, so rows of the episode
+still open when a run stops are episoded again on the next one.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pipeline import process_capture, process_capture_batch
+from schemas.forChat import VISION_BATCH_SIZE
+from subfuncEp import episoder
+from subfuncEp.episoder import advance_episoder_async, flush_current_episode
+from subfuncEp.semantic_canonicalizer import flush_centroids
+from subfuncsChecks.rate_limiter import limiter
+from subfuncsInput.screenshot import capture_stem, capture_timestamp
+
+_CAPTURE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(_\d{3})?\.(png|jpg|jpeg|webp)(\.enc)?(\.pending)?$")
+REPORT_EVERY = 25
+
+
+# ---------- Sources ---------------------------------------------------------
+
+class _Item:
+    def __init__(self, timestamp: str, path: str, key: str, entry=None):
+        self.timestamp = timestamp
+        self.path = path
+        self.key = key              # checkpoint key; unique even where timestamps repeat
+        self.entry = entry          # archive Entry, if the image lives in a segment
+
+
+def _items_from_dir(folder: str) -> List[_Item]:
+    """
+    Captures under `folder`, keyed by their path relative to it (without
+    suffixes): the per-monitor captures in 'monitor_<i>/' share timestamps.
+    """
+    items = []
+    for root, _dirs, files in os.walk(folder):
+        rel = os.path.relpath(root, folder)
+        for fname in files:
+            if _CAPTURE_RE.match(fname):
+                path = os.path.join(root, fname)
+                stem = capture_stem(path)
+                key = stem if rel == "." else f"{rel.replace(os.sep, '/')}/{stem}"
+                items.append(_Item(capture_timestamp(path), path, key))
+    return items
+
+
+def _items_from_archive(archive, since: Optional[str], until: Optional[str]) -> List[_Item]:
+    start = int(datetime.strptime(since, "%Y-%m-%d").timestamp() * 1000) if since else None
+    end = int(datetime.strptime(until, "%Y-%m-%d").timestamp() * 1000) if until else None
+    items = []
+    seen: Dict[int, int] = {}       # ts_ms → entries so far (per-monitor captures share it)
+    for e in archive.range(start, end):
+        n = seen[e.ts_ms] = seen.get(e.ts_ms, -1) + 1
+        ext = ".png.enc" if e.encrypted else ".png"
+        items.append(_Item(e.timestamp, f"{e.segment}/{e.timestamp}{ext}", f"{e.ts_ms}#{n}", entry=e))
+    return items
+
+
+# ---------- Checkpoint ------------------------------------------------------
+
+class Checkpoint:
+    """
+    Append-only log of {"ts", "status": "inserted"|"episoded"|"failed", "row"?};
+    "ts" is the item's key (its timestamp for older checkpoints).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.inserted: Dict[str, Dict[str, Any]] = {}
+        self.episoded = set()
+        self.failed = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue     # torn last line from an interrupted write
+                    if rec["status"] == "inserted":
+                        self.inserted[rec["ts"]] = rec["row"]
+                    elif rec["status"] == "episoded":
+                        self.episoded.add(rec["ts"])
+                    elif rec["status"] == "failed":
+                        self.failed.add(rec["ts"])
+        self._f = open(path, "a")
+
+    def record(self, ts: str, status: str, row: Optional[Dict[str, Any]] = None) -> None:
+        rec = {"ts": ts, "status": status}
+        if row is not None:
+            rec["row"] = row
+        with self._lock:
+            self._f.write(json.dumps(rec, default=str) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+
+# ---------- Run -------------------------------------------------------------
+
+def _analyze(batch: List[_Item], archive) -> List[Optional[Dict[str, Any]]]:
+    if len(batch) == 1:
+        item = batch[0]
+        stream = archive.open_image(item.entry) if item.entry is not None else None
+        return [process_capture(item.path, timestamp=item.timestamp, image_stream=stream)]
+    return process_capture_batch([
+        (
+            item.path,
+            item.timestamp,
+            (lambda e=item.entry: archive.open_image(e)) if item.entry is not None else None,
+        )
+        for item in batch
+    ])
+
+
+def run_backfill(
+    items: List[_Item],
+    checkpoint: Checkpoint,
+    workers: int = 8,
+    archive=None,
+    retry_failed: bool = False,
+    episode: bool = True,
+    batch: int = 1,
+) -> Tuple[int, int]:
+    items = sorted(items, key=lambda it: (it.timestamp, it.key))
+    items = [it for it in items if it.key not in checkpoint.episoded]
+    if not retry_failed:
+        items = [
+            it for it in items
+            if it.key not in checkpoint.failed or it.key in checkpoint.inserted
+        ]
+    print(f"(BF) {len(items)} screenshots to process "
+          f"({sum(1 for it in items if it.key in checkpoint.inserted)} already inserted)")
+
+    # results[i] is the inserted row, False for a failure, absent while in flight
+    results: Dict[int, Any] = {}
+    next_to_episode = 0
+    n_ok = n_failed = 0
+    t0 = time.perf_counter()
+    keys_by_row: Dict[int, str] = {}     # id(row handed to the episoder) → item key
+
+    def _episode_stored(ep) -> None:
+        for r in ep.screenshot_rows:
+            key = keys_by_row.pop(id(r), None)
+            if key is not None:
+                checkpoint.record(key, "episoded")
+
+    def _release_in_order():
+        nonlocal next_to_episode
+        while next_to_episode in results:
+            row = results.pop(next_to_episode)
+            item = items[next_to_episode]
+            next_to_episode += 1
+            if row is False:
+                continue
+            if episode:
+                # scored in the background, committed in this (timestamp) order;
+                # checkpointed by _episode_stored once its episode is in the DB
+                keys_by_row[id(row)] = item.key
+                advance_episoder_async(row)
+            else:
+                checkpoint.record(item.key, "episoded")
+
+    episoder.episode_flush_listeners.append(_episode_stored)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+            futures = {}
+            pending: List[int] = []
+            for i, item in enumerate(items):
+                if item.key in checkpoint.inserted:
+                    results[i] = checkpoint.inserted[item.key]
+                else:
+                    pending.append(i)
+            # consecutive (in timestamp order) images share a request
+            for b in range(0, len(pending), max(1, batch)):
+                idxs = pending[b : b + max(1, batch)]
+                futures[pool.submit(_analyze, [items[i] for i in idxs], archive)] = idxs
+
+            _release_in_order()
+            for fut in as_completed(futures):
+                idxs = futures[fut]
+                try:
+                    rows = fut.result()
+                except Exception as e:
+                    print(f"(BF.e) {items[idxs[0]].path}: {e}")
+                    rows = [None] * len(idxs)
+                for i, row in zip(idxs, rows):
+                    item = items[i]
+                    if row is None:
+                        n_failed += 1
+                        checkpoint.record(item.key, "failed")
+                        results[i] = False
+                    else:
+                        n_ok += 1
+                        checkpoint.record(item.key, "inserted", row)
+                        results[i] = row
+
+                    done = n_ok + n_failed
+                    if done % REPORT_EVERY == 0:
+                        rate = 60.0 * done / (time.perf_counter() - t0)
+                        print(f"(BF) {done}/{len(pending)} analyzed, {rate:.1f} img/min, "
+                              f"episoded through #{next_to_episode}, limiter={limiter.stats()}")
+                # rows are queued for episoding from this (single) thread, so never out of order
+                _release_in_order()
+
+        if episode:
+            flush_current_episode()
+    finally:
+        episoder.episode_flush_listeners.remove(_episode_stored)
+    flush_centroids()
+    elapsed = time.perf_counter() - t0
+    rate = 60.0 * (n_ok + n_failed) / elapsed if elapsed > 0 else 0.0
+    print(f"(BF.✓) {n_ok} inserted, {n_failed} failed in {elapsed:.1f}s ({rate:.1f} img/min)")
+    return n_ok, n_failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("folder", nargs="?", help="directory of captures (walked recursively)")
+    ap.add_argument("--archive", help="packed archive root instead of a directory")
+    ap.add_argument("--since", help="YYYY-MM-DD (archive only)")
+    ap.add_argument("--until", help="YYYY-MM-DD, exclusive (archive only)")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--batch", type=int, default=1, help=f"images per vision request (max {VISION_BATCH_SIZE})")
+    ap.add_argument("--checkpoint", default="backfill.ckpt.jsonl")
+    ap.add_argument("--retry-failed", action="store_true")
+    ap.add_argument("--no-episodes", action="store_true", help="insert rows only")
+    args = ap.parse_args()
+
+    archive = None
+    if args.archive:
+        from archive.segments import Archive
+        archive = Archive(args.archive)
+        items = _items_from_archive(archive, args.since, args.until)
+    elif args.folder:
+        items = _items_from_dir(args.folder)
+    else:
+        ap.error("give a folder or --archive")
+
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        run_backfill(
+            items,
+            checkpoint,
+            workers=args.workers,
+            archive=archive,
+            retry_failed=args.retry_failed,
+            episode=not args.no_episodes,
+            batch=min(args.batch, VISION_BATCH_SIZE),
+        )
+    finally:
+        checkpoint.close()
+        if archive is not None:
+            archive.close()
+
+
+if __name__ == "__main__":
+    main()
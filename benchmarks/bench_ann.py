@@ -0,0 +1,106 @@
+# bench_ann.py
+"""
+Recall@1 and query latency of the canonicalizer's ANN backends against
+exact search, on synthetic clustered unit vectors (labels cluster by
+topic, like real workstream/deliverable centroids do). Queries are new
+points, not copies of indexed rows; see _dataset.
+
+    python -m benchmarks.bench_ann [--sizes 10000 100000 1000000] [--dim 1536] [--nprobe 4 8 16] [--mix 1.0]
+
+1M x 1536 float32 is ~6 GB per index; pass a smaller --dim to run the
+large sizes on a laptop (recall and relative latency hold up well).
+"""
+import argparse
+import time
+
+import numpy as np
+
+from subfuncEp.ann_index import build_index, hnswlib
+
+
+def _dataset(n: int, dim: int, n_queries: int, seed: int, mix: float):
+    """
+    n label centroids in topics of ~20 around a shared direction (real
+    embeddings are far from isotropic), and queries that are new
+    screenshots of a label: its centroid blended with a sibling label of
+    the same topic (weight `mix`) and a random label (mix / 2). At mix=1
+    the exact nearest neighbour is often not the source label, and the
+    top-2 margin is a few hundredths, so recall measures something.
+    """
+    rng = np.random.default_rng(seed)
+    common = rng.standard_normal(dim).astype(np.float32)
+    topics = common + rng.standard_normal((max(16, n // 20), dim)).astype(np.float32)
+    assign = rng.integers(0, len(topics), n)
+    x = topics[assign] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+
+    order = np.argsort(assign, kind="stable")
+    bounds = np.searchsorted(assign[order], np.arange(len(topics) + 1))
+    picks = rng.integers(0, n, n_queries)
+    t = assign[picks]
+    siblings = order[bounds[t] + (rng.random(n_queries) * (bounds[t + 1] - bounds[t])).astype(np.int64)]
+    others = rng.integers(0, n, n_queries)
+    q = x[picks] + mix * x[siblings] + 0.5 * mix * x[others]
+    q += 0.02 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return x, q
+
+
+def _time_queries(idx, queries, **kw):
+    hits, lat = [], []
+    for qv in queries:
+        t0 = time.perf_counter()
+        res = idx.search(qv, k=1, **kw)
+        lat.append(time.perf_counter() - t0)
+        hits.append(res[0][0] if res else -1)
+    lat = np.array(lat) * 1000
+    return np.array(hits), float(np.percentile(lat, 50)), float(np.percentile(lat, 95))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument("--mix", type=float, default=1.0, help="weight of the sibling label blended into each query")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"{'n':>9} {'backend':<14}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall@1':>10}")
+    for n in args.sizes:
+        x, queries = _dataset(n, args.dim, args.queries, args.seed, args.mix)
+        ids = np.arange(n)
+
+        t0 = time.perf_counter()
+        exact = build_index("exact", ids, x)
+        build = time.perf_counter() - t0
+        truth, p50, p95 = _time_queries(exact, queries)
+        top2 = [exact.search(qv, k=2) for qv in queries]
+        margin = float(np.mean([h[0][1] - h[1][1] for h in top2]))
+        print(f"{n:>9} {'exact':<14}{build:>9.2f}{p50:>9.2f}{p95:>9.2f}{1.0:>10.3f}   (mean top-2 margin {margin:.3f})")
+        del exact
+
+        t0 = time.perf_counter()
+        ivf = build_index("ivf", ids, x)
+        build = time.perf_counter() - t0
+        for nprobe in args.nprobe:
+            found, p50, p95 = _time_queries(ivf, queries, nprobe=nprobe)
+            recall = float(np.mean(found == truth))
+            print(f"{n:>9} {'ivf/' + str(nprobe):<14}{build:>9.2f}{p50:>9.2f}{p95:>9.2f}{recall:>10.3f}")
+        del ivf
+
+        if hnswlib is not None:
+            t0 = time.perf_counter()
+            hnsw = build_index("hnsw", ids, x)
+            build = time.perf_counter() - t0
+            found, p50, p95 = _time_queries(hnsw, queries)
+            recall = float(np.mean(found == truth))
+            print(f"{n:>9} {'hnsw':<14}{build:>9.2f}{p50:>9.2f}{p95:>9.2f}{recall:>10.3f}")
+            del hnsw
+        else:
+            print(f"{n:>9} {'hnsw':<14}  (hnswlib not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# bench_app_classifier.py
+"""
+Coverage and agreement of the local app_bucket / work_type classifier
+(subfuncsProcessing.app_classifier), and the vision output it saves.
+
+    python -m benchmarks.bench_app_classifier [--days 60]       # screenshots in storage
+    python -m benchmarks.bench_app_classifier --synthetic 3000
+
+History is split in time: the classifier learns from the first
+--train share and labels the rest, which are scored against the vision
+model's own labels. Logged rows carry no window metadata, so their window
+is rebuilt from app_or_website (first segment as the app, the rest as the
+title); synthetic rows have real window-style app names and titles.
+
+Output tokens are the JSON the model would return with the full schema vs.
+SEMANTIC_SCHEMA; the latency line multiplies the difference by
+--ms-per-output-token (decode time, a projection rather than a measurement).
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from subfuncEp.descriptors import count_tokens
+from subfuncsProcessing.app_classifier import AppClassifier
+
+SUMMARY_FIELDS = ("semantic_summary", "workstream_label", "deliverable_label", "app_or_website",
+                  "app_bucket", "work_type", "goal_type", "confidence")
+LOCAL_FIELDS = ("app_or_website", "app_bucket", "work_type")   # = schemas.forChat.LOCAL_FIELDS
+
+# (window app, title template, model's app_or_website, app_bucket, {work_type: weight})
+_SYNTHETIC_APPS = [
+    ("Code", "{file} — guide3", "VS Code", "ide", {"coding": 1.0}),
+    ("iTerm2", "python main.py", "iTerm2", "terminal", {"coding": 1.0}),
+    ("Google Chrome", "{page} - YouTube", "Google Chrome – YouTube", "browser", {"entertainment": 0.9, "reading": 0.1}),
+    ("Google Chrome", "{page} - Canvas", "Google Chrome – Canvas", "browser", {"reading": 0.95, "note_taking": 0.05}),
+    ("Google Chrome", "{page} - Google Search", "Google Chrome – Google Search", "browser", {"browsing": 0.6, "reading": 0.4}),
+    ("Google Chrome", "{page} - Google Docs", "Google Chrome – Google Docs", "browser", {"note_taking": 0.7, "reading": 0.3}),
+    ("Notion", "{page}", "Notion", "notes", {"note_taking": 0.95, "reading": 0.05}),
+    ("Preview", "{file}.pdf", "Preview", "pdf_viewer", {"reading": 1.0}),
+    ("Slack", "{page} - AI Mirror - Slack", "Slack", "messaging", {"messaging": 1.0}),
+    ("Microsoft PowerPoint", "{file}.pptx", "PowerPoint", "other", {"presentation": 1.0}),
+    ("Figma", "{file} – Figma", "Figma", "other", {"design": 0.9, "presentation": 0.1}),
+]
+_PAGES = ["Lecture 12", "Assignment 3", "Midterm review", "Home", "Results", "Draft v2", "Notes", "Inbox"]
+
+
+def _synthetic(n: int, seed: int) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    rng = random.Random(seed)
+    weights = [8, 3, 3, 4, 3, 2, 3, 2, 2, 1, 1]
+    rows = []
+    for i in range(n):
+        app, title, label, bucket, works = rng.choices(_SYNTHETIC_APPS, weights)[0]
+        work = rng.choices(list(works), list(works.values()))[0]
+        page = rng.choice(_PAGES)
+        window = {"app": app, "title": title.format(page=page, file=page.lower().replace(" ", "_"))}
+        rows.append((window, {
+            "semantic_summary": f"Working through {page} as part of a longer task, roughly step {i % 7}.",
+            "workstream_label": "AI Mirror product", "deliverable_label": "Prepare pitch deck v3",
+            "app_or_website": label, "app_bucket": bucket, "work_type": work,
+            "goal_type": "telic", "confidence": 0.8,
+        }))
+    return rows
+
+
+def _logged(days: int) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    from storage import read_all
+    from storage_client import storage
+
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    out = []
+    for r in read_all(lambda limit, offset: storage.screenshots_since(since, limit=limit, offset=offset)):
+        name = r.get("app_or_website") or ""
+        if not (name and r.get("app_bucket") and r.get("work_type")):
+            continue
+        parts = [p.strip() for p in name.replace("—", "–").split("–")]
+        out.append(({"app": parts[0], "title": " - ".join(reversed(parts[1:]))}, r))
+    return out
+
+
+def _output_tokens(row: Dict[str, Any], fields) -> int:
+    return count_tokens(json.dumps({k: row.get(k) for k in fields}, ensure_ascii=False))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=60)
+    ap.add_argument("--synthetic", type=int, help="use N synthetic captures instead of stored screenshots")
+    ap.add_argument("--train", type=float, default=0.7, help="share of history (oldest first) to learn from")
+    ap.add_argument("--ms-per-output-token", type=float, default=12.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    data = _synthetic(args.synthetic, args.seed) if args.synthetic else _logged(args.days)
+    if len(data) < 10:
+        print("not enough labelled screenshots (try --synthetic 3000)")
+        return
+    cut = int(len(data) * args.train)
+    clf = AppClassifier(audit_rate=0.0)
+    for window, row in data[:cut]:
+        clf.learn(row["app_or_website"], row["app_bucket"], row["work_type"], window)
+
+    test = data[cut:]
+    hits = bucket_ok = work_ok = 0
+    full_tokens = semantic_tokens = 0
+    per_app: Dict[str, List[int]] = {}
+    for window, row in test:
+        labels = clf.classify(window)
+        full = _output_tokens(row, SUMMARY_FIELDS)
+        full_tokens += full
+        stat = per_app.setdefault(window["app"], [0, 0])
+        stat[1] += 1
+        if labels is None:
+            semantic_tokens += full
+            continue
+        hits += 1
+        stat[0] += 1
+        semantic_tokens += _output_tokens(row, [f for f in SUMMARY_FIELDS if f not in LOCAL_FIELDS])
+        bucket_ok += labels["app_bucket"] == row["app_bucket"]
+        work_ok += labels["work_type"] == row["work_type"]
+
+    n = len(test)
+    print(f"{len(data)} captures ({'synthetic' if args.synthetic else f'stored, {args.days} days'}), "
+          f"learned from {cut}, scored on {n}; {clf.stats()['keys']} keys\n")
+    print(f"labelled locally     {hits / n:6.1%}  ({hits}/{n})")
+    if hits:
+        print(f"app_bucket agrees    {bucket_ok / hits:6.1%}")
+        print(f"work_type agrees     {work_ok / hits:6.1%}")
+    saved = (full_tokens - semantic_tokens) / n
+    print(f"output tokens/call   {full_tokens / n:6.1f} → {semantic_tokens / n:.1f}  (-{saved:.1f}, "
+          f"-{1 - semantic_tokens / full_tokens:.0%})")
+    print(f"projected decode     -{saved * args.ms_per_output_token:.0f} ms/call at {args.ms_per_output_token:g} ms/token")
+    print("\nper app: locally labelled / seen")
+    for app, (h, t) in sorted(per_app.items(), key=lambda kv: -kv[1][1]):
+        print(f"  {app:<24}{h:>6}/{t:<6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# bench_descriptors.py
+"""
+Input tokens of the coherence prompt: the old pretty-printed descriptors
+vs. the compiled, budgeted ones (subfuncEp.descriptors), on logged
+traffic or a synthetic day.
+
+    python -m benchmarks.bench_descriptors [--days 7]                 # coherence_labels in storage
+    python -m benchmarks.bench_descriptors --synthetic 600 [--budget 200 300 500]
+    python -m benchmarks.bench_descriptors --cassette traffic.jsonl.gz
+
+Logged labels carry the exact descriptors the episoder sent, so both
+prompts are rebuilt from them. With --cassette, recorded coherence
+calls give latency vs. prompt tokens (least-squares line), which
+projects the latency change of the shorter prompts.
+
+"reused prefix" is the share of calls whose system prompt + episode
+prefix is byte-identical to the previous call for the same episode,
+i.e. eligible for provider prompt caching (OpenAI caches prompts of
+1024+ tokens, in 128-token steps).
+"""
+import argparse
+import gzip
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.fakes import FakeOpenAI, install_fakes
+from subfuncEp import descriptors
+from subfuncEp.descriptors import PrefixCache, compile_coherence_prompt, count_tokens
+
+# the prompt as sent before compiled descriptors
+LEGACY_SYSTEM_PROMPT = (
+    "You judge whether a new computer activity belongs to the same work session "
+    "as an ongoing episode.\n"
+    "A 'work session' means a sustained attempt to make progress on the same task or deliverable "
+    "(e.g. one assignment, one pitch deck, one feature, one bugfix, one report).\n"
+    "Return a coherence score in [0,1], where 1 means clearly the same work session/task, "
+    "and 0 means clearly unrelated. Intermediate values (e.g. 0.3, 0.7) reflect uncertainty.\n"
+    "Be conservative: if the new activity obviously pursues a different task/deliverable, "
+    "use a low score (< 0.3). If it clearly supports the same task (even via a different app), "
+    "use a high score (> 0.7)."
+)
+
+
+def _legacy_user(episode_desc: Dict[str, Any], shot_desc: Dict[str, Any]) -> str:
+    episode_json = json.dumps(episode_desc, ensure_ascii=False, indent=2)
+    shot_json = json.dumps(shot_desc, ensure_ascii=False, indent=2)
+    return (
+        "Ongoing episode (summary as JSON):\n"
+        f"{episode_json}\n\n"
+        "New activity (screenshot summary as JSON):\n"
+        f"{shot_json}\n\n"
+        "Question: On a scale from 0 to 1, how coherent is the new activity with the ongoing episode, "
+        "interpreting 'coherent' as 'part of the same work session or task'?\n"
+        "Return ONLY JSON of the form: {\"coherence\": number_between_0_and_1}."
+    )
+
+
+# ---------- Traffic ---------------------------------------------------------
+
+def _logged(days: int) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    from storage import read_all
+    from storage_client import storage
+
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    pairs = []
+    for lab in read_all(lambda limit, offset: storage.coherence_labels_since(
+        since, descriptors=True, limit=limit, offset=offset
+    )):
+        ep, shot = lab.get("episode_descriptor"), lab.get("screenshot_descriptor")
+        if isinstance(ep, str):
+            ep, shot = json.loads(ep), json.loads(shot or "{}")
+        if ep and shot:
+            pairs.append((ep, shot))
+    return pairs
+
+
+def _synthetic(n: int, seed: int = 0) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    `n` coherence calls as the episoder makes them: episodes of 3-60
+    screenshots, each revisiting a handful of activities (so summaries
+    repeat), with the odd unknown field.
+    """
+    install_fakes(seed=seed)
+    from subfuncEp.episoder import EpisodeState, _build_episode_descriptor, _build_screenshot_descriptor
+
+    rng = random.Random(seed)
+    t = datetime(2025, 3, 3, 9, 0, 0)
+    pairs = []
+    while len(pairs) < n:
+        activities = [FakeOpenAI._summary(rng.randrange(1 << 30)) for _ in range(rng.randint(1, 4))]
+        for a in activities:
+            a["semantic_summary"] += " " + " ".join(
+                rng.choice(("Editing", "Reviewing", "Reading", "Drafting", "Comparing")) + f" section {rng.randint(1, 9)}."
+                for _ in range(rng.randint(2, 6))
+            )
+            a["url"] = rng.choice((None, f"https://example.com/{rng.randrange(1000)}"))
+            a["topic"] = rng.choice((None, a["deliverable_label"]))
+        ep: Optional[EpisodeState] = None
+        for _ in range(rng.randint(3, 60)):
+            row = dict(rng.choice(activities), timestamp=t.strftime("%Y-%m-%d_%H-%M-%S"))
+            if rng.random() < 0.1:
+                row["workstream_label"] = None
+            t += timedelta(seconds=rng.choice((10, 10, 20, 40)))
+            if ep is None:
+                ep = EpisodeState(start_time=t, end_time=t)
+            else:
+                pairs.append((_build_episode_descriptor(ep), _build_screenshot_descriptor(row)))
+            ep.add_screenshot(row)
+    return pairs[:n]
+
+
+# ---------- Measurement -----------------------------------------------------
+
+def measure(pairs, budget: int) -> Dict[str, Any]:
+    from subfuncEp.episoder import COHERENCE_SYSTEM_PROMPT
+
+    legacy_sys, new_sys = count_tokens(LEGACY_SYSTEM_PROMPT), count_tokens(COHERENCE_SYSTEM_PROMPT)
+    cache = PrefixCache()
+    old, new, reused = [], [], []
+    last_prefix: Dict[str, str] = {}
+    for ep, shot in pairs:
+        old.append(legacy_sys + count_tokens(_legacy_user(ep, shot)))
+        prefix, rest = compile_coherence_prompt(ep, shot, cache, budget)
+        prefix_tokens = new_sys + count_tokens(prefix)
+        new.append(prefix_tokens + count_tokens(rest))
+        key = (ep.get("time_span") or {}).get("start") or ""
+        if last_prefix.get(key) == prefix:
+            reused.append(prefix_tokens)
+        last_prefix[key] = prefix
+    old_a, new_a = np.asarray(old), np.asarray(new)
+    return {
+        "budget": budget,
+        "old_mean": float(old_a.mean()),
+        "old_p95": float(np.percentile(old_a, 95)),
+        "new_mean": float(new_a.mean()),
+        "new_p95": float(np.percentile(new_a, 95)),
+        "reduction": 1 - new_a.sum() / old_a.sum(),
+        "reused": len(reused) / len(pairs),
+        "reused_tokens": float(np.mean(reused)) if reused else 0.0,
+        "prefix_hits": cache.hits / max(1, cache.hits + cache.misses),
+    }
+
+
+def latency_fit(cassette: str) -> Optional[Tuple[float, float, int]]:
+    """(intercept s, seconds per prompt token, n) over recorded coherence calls."""
+    xs, ys = [], []
+    with gzip.open(cassette, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+                resp = e["response"]
+                content = resp["choices"][0]["message"]["content"] or ""
+                tokens = resp["usage"]["prompt_tokens"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            if content.lstrip().startswith('{"coherence"'):
+                xs.append(tokens)
+                ys.append(e["latency"])
+    if len(xs) < 3 or len(set(xs)) < 2:
+        return None
+    slope, intercept = np.polyfit(np.asarray(xs, float), np.asarray(ys, float), 1)
+    return float(intercept), float(slope), len(xs)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--synthetic", type=int, help="use N synthetic calls instead of logged labels")
+    ap.add_argument("--budget", type=int, nargs="+", default=[150, 300, 500])
+    ap.add_argument("--cassette", help="recorded traffic for the latency fit")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    pairs = _synthetic(args.synthetic, args.seed) if args.synthetic else _logged(args.days)
+    if not pairs:
+        print("no coherence calls to measure (try --synthetic 600)")
+        return
+    print(f"{len(pairs)} coherence calls ({'synthetic' if args.synthetic else f'logged, {args.days} days'}); "
+          f"tokens are {'tiktoken o200k_base' if descriptors.tiktoken else 'char estimates (tiktoken not installed)'}\n")
+
+    fit = latency_fit(args.cassette) if args.cassette else None
+    if args.cassette and fit is None:
+        print(f"(not enough coherence calls in {args.cassette} for a latency fit)\n")
+
+    print(f"{'budget':>6} {'old mean':>9} {'old p95':>8} {'new mean':>9} {'new p95':>8} {'saved':>6} "
+          f"{'prefix hits':>11} {'reused prefix':>14}" + (f" {'latency':>16}" if fit else ""))
+    for b in args.budget:
+        r = measure(pairs, b)
+        line = (f"{b:>6} {r['old_mean']:>9.0f} {r['old_p95']:>8.0f} {r['new_mean']:>9.0f} {r['new_p95']:>8.0f} "
+                f"{r['reduction']:>6.0%} {r['prefix_hits']:>11.0%} {r['reused']:>6.0%} ({r['reused_tokens']:>4.0f} tk)")
+        if fit:
+            a, s, _ = fit
+            line += f" {1000 * (a + s * r['old_mean']):>6.0f}→{1000 * (a + s * r['new_mean']):<5.0f}ms"
+        print(line)
+    if fit:
+        a, s, n = fit
+        print(f"\nlatency ≈ {1000 * a:.0f} ms + {1000 * s:.3f} ms/token (fit over {n} recorded coherence calls)")
+
+
+if __name__ == "__main__":
+    main()
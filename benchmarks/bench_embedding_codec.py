@@ -0,0 +1,119 @@
+# bench_embedding_codec.py
+"""
+Size, decode speed and canonicalization accuracy of the packed embedding
+codecs vs. the JSON float list.
+
+Accuracy replays the canonicalizer's decision for each query embedding
+(nearest stored centroid, matched if cosine >= threshold) with the
+centroids round-tripped through each codec, and counts how often the
+chosen centroid or the match/new decision changes.
+
+    python -m benchmarks.bench_embedding_codec [--centroids 500] [--queries 2000]
+    python -m benchmarks.bench_embedding_codec --cassette traffic.jsonl.gz   # real embeddings
+
+With --cassette, recorded embedding responses (benchmarks/replay.py) are
+split into centroids and queries instead of the synthetic set.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.fakes import install_fakes
+from subfuncEp.embedding_codec import CODECS, decode, encode
+
+
+def _synthetic(n_centroids: int, n_queries: int, dim: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # text-embedding-3-small vectors share a strong common direction, so
+    # unrelated texts still sit around cosine 0.2-0.4; mimic that
+    common = rng.standard_normal(dim)
+    c = 0.5 * common + rng.standard_normal((n_centroids, dim))
+    c /= np.linalg.norm(c, axis=1, keepdims=True)
+    picks = rng.integers(0, n_centroids, n_queries)
+    # noise levels spread query→centroid cosines across both thresholds
+    noise = rng.uniform(0.3, 1.2, (n_queries, 1))
+    q = c[picks] + noise * rng.standard_normal((n_queries, dim)) / np.sqrt(dim)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return c.astype(np.float32), q.astype(np.float32)
+
+
+def _from_cassette(path: str):
+    from benchmarks.replay import Cassette, _unpack
+
+    vecs = []
+    for e in Cassette(path).load().entries:
+        if e["kind"] == "openai.embeddings" and "response" in e:
+            for d in _unpack(e["response"])["data"]:
+                vecs.append(d["embedding"])
+    if len(vecs) < 4:
+        raise SystemExit(f"only {len(vecs)} embeddings in {path}")
+    x = np.asarray(vecs, dtype=np.float32)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    # earlier embeddings play the stored centroids, later ones the new screenshots
+    split = len(x) // 2
+    return x[:split], x[split:]
+
+
+def _decisions(centroids: np.ndarray, queries: np.ndarray, threshold: float):
+    scores = queries @ centroids.T
+    best = np.argmax(scores, axis=1)
+    best_score = scores[np.arange(len(queries)), best]
+    return best, best_score, best_score >= threshold
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--centroids", type=int, default=500)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--cassette")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    install_fakes()     # the canonicalizer builds a DB client at import; only its thresholds are used
+    from subfuncEp.semantic_canonicalizer import DELIVERABLE_SIM_THRESHOLD, WORKSTREAM_SIM_THRESHOLD
+
+    if args.cassette:
+        centroids, queries = _from_cassette(args.cassette)
+    else:
+        centroids, queries = _synthetic(args.centroids, args.queries, args.dim, args.seed)
+    print(f"{len(centroids)} centroids x {len(queries)} queries, dim {centroids.shape[1]}")
+
+    # -- size and decode speed per row --
+    sample = centroids[: min(200, len(centroids))]
+    json_rows = [json.dumps(v.astype(np.float64).tolist()) for v in sample]
+    t0 = time.perf_counter()
+    for s in json_rows:
+        np.asarray(json.loads(s), dtype=np.float32)
+    json_us = 1e6 * (time.perf_counter() - t0) / len(json_rows)
+    json_kb = np.mean([len(s) for s in json_rows]) / 1e3
+    print(f"\n{'format':<8}{'KB/row':>9}{'decode us/row':>15}")
+    print(f"{'json':<8}{json_kb:>9.1f}{json_us:>15.1f}")
+    for codec in CODECS:
+        packed = [encode(v, codec) for v in sample]
+        t0 = time.perf_counter()
+        for s in packed:
+            decode(s)
+        us = 1e6 * (time.perf_counter() - t0) / len(packed)
+        print(f"{codec:<8}{np.mean([len(s) for s in packed]) / 1e3:>9.1f}{us:>15.1f}")
+
+    # -- canonicalization decisions --
+    for name, threshold in (("workstream", WORKSTREAM_SIM_THRESHOLD), ("deliverable", DELIVERABLE_SIM_THRESHOLD)):
+        ref_best, ref_score, ref_match = _decisions(centroids, queries, threshold)
+        near = float(np.mean(np.abs(ref_score - threshold) < 0.01))
+        print(f"\n{name} threshold {threshold}: {100 * ref_match.mean():.1f}% matched, "
+              f"{100 * near:.1f}% of queries within 0.01 of it")
+        print(f"{'codec':<8}{'max |dcos|':>12}{'nearest changed':>17}{'decision flips':>16}")
+        for codec in CODECS:
+            rt = np.stack([decode(encode(v, codec)) for v in centroids])
+            best, score, match = _decisions(rt, queries, threshold)
+            dcos = np.max(np.abs(score - ref_score))
+            changed = np.mean(best != ref_best)
+            flips = np.mean(match != ref_match)
+            print(f"{codec:<8}{dcos:>12.2e}{100 * changed:>16.3f}%{100 * flips:>15.3f}%")
+
+
+if __name__ == "__main__":
+    main()
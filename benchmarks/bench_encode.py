@@ -0,0 +1,90 @@
+# bench_encode.py
+"""
+Sustained-load throughput of the capture encode pool vs. the old inline
+`save(path, "PNG")`, across codecs, levels and worker counts.
+
+    python -m benchmarks.bench_encode [--n 24] [--workers 1 2 4] [--processes]
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from subfuncsInput.encoder import DEFAULT_LEVELS, EncodePool
+
+CONFIGS = [
+    ("png", 6),
+    ("png", 1),
+    ("png", 0),
+    ("webp-lossless", 0),
+    ("jpeg", 85),
+]
+
+
+def _load_images(folder: str, n: int):
+    images = []
+    for p in sorted(glob.glob(os.path.join(folder, "*.png")))[:n]:
+        im = Image.open(p)
+        im.load()
+        images.append(im.convert("RGB"))
+    return images
+
+
+def _inline_baseline(images, out_dir: str) -> float:
+    t0 = time.perf_counter()
+    for i, im in enumerate(images):
+        im.save(os.path.join(out_dir, f"inline_{i}.png"), "PNG")
+    return time.perf_counter() - t0
+
+
+def _pooled(images, out_dir: str, codec: str, level: int, workers: int, processes: bool):
+    pool = EncodePool(codec=codec, level=level, workers=workers, use_processes=processes, encrypt=False)
+    t0 = time.perf_counter()
+    submit_s = 0.0
+    handles = []
+    for i, im in enumerate(images):
+        ts = time.perf_counter()
+        handles.append(pool.submit(im, os.path.join(out_dir, f"{codec}_{level}_{workers}_{i}")))
+        submit_s += time.perf_counter() - ts
+    for h in handles:
+        h.result()
+    wall = time.perf_counter() - t0
+    stats = pool.stats()
+    pool.shutdown()
+    return wall, submit_s, stats
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default="raw/screenshots")
+    ap.add_argument("--n", type=int, default=24)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--processes", action="store_true", help="use a process pool instead of threads")
+    args = ap.parse_args()
+
+    images = _load_images(args.dir, args.n)
+    if not images:
+        print(f"no PNGs under {args.dir}")
+        return
+    n = len(images)
+    print(f"{n} images, {images[0].size[0]}x{images[0].size[1]}, "
+          f"{'processes' if args.processes else 'threads'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = _inline_baseline(images, tmp)
+        print(f"{'inline png level 6':<28} {n / base:6.2f} img/s  capture-thread {1000 * base / n:7.1f} ms/img")
+        for codec, level in CONFIGS:
+            for w in args.workers:
+                wall, submit_s, st = _pooled(images, tmp, codec, level, w, args.processes)
+                print(
+                    f"{codec + ' level ' + str(level) + ' x' + str(w):<28} {n / wall:6.2f} img/s  "
+                    f"capture-thread {1000 * submit_s / n:7.1f} ms/img  "
+                    f"{st['avg_kb']:8.0f} KB/img  max wait {st['max_submit_wait_ms']:.0f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
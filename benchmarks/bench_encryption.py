@@ -0,0 +1,80 @@
+# bench_encryption.py
+"""
+Plain PNG writes vs. streaming-encrypted PNG writes (and decrypt reads) on
+the screenshots under raw/screenshots.
+
+    python -m benchmarks.bench_encryption [--n 20] [--dir raw/screenshots]
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from encryption import at_rest
+
+
+def _load_images(folder: str, n: int):
+    paths = sorted(glob.glob(os.path.join(folder, "*.png")))[:n]
+    images = []
+    for p in paths:
+        im = Image.open(p)
+        im.load()
+        images.append(im)
+    return images
+
+
+def _timed(fn, images, out_dir: str, suffix: str):
+    t0 = time.perf_counter()
+    total = 0
+    for i, im in enumerate(images):
+        path = fn(im, os.path.join(out_dir, f"{i}.png{suffix}"))
+        total += os.path.getsize(path)
+    return time.perf_counter() - t0, total
+
+
+def _plain(im, path):
+    im.save(path, "PNG")
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default="raw/screenshots")
+    ap.add_argument("--n", type=int, default=20)
+    args = ap.parse_args()
+
+    images = _load_images(args.dir, args.n)
+    if not images:
+        print(f"no PNGs under {args.dir}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        at_rest.KEY_FILE = os.path.join(tmp, "bench.key")
+        at_rest.load_key(create=True)
+
+        plain_s, plain_bytes = _timed(_plain, images, tmp, "")
+        enc_s, enc_bytes = _timed(
+            lambda im, p: at_rest.save_image_encrypted(im, p, "PNG"), images, tmp, at_rest.ENC_SUFFIX
+        )
+
+        t0 = time.perf_counter()
+        for i in range(len(images)):
+            with at_rest.open_capture(os.path.join(tmp, f"{i}.png{at_rest.ENC_SUFFIX}")) as f:
+                while f.read(1 << 20):
+                    pass
+        dec_s = time.perf_counter() - t0
+
+    n = len(images)
+    mb = plain_bytes / 1e6
+    print(f"images: {n}  ({images[0].size[0]}x{images[0].size[1]}, {mb / n:.2f} MB/png)")
+    print(f"plain PNG write     : {1000 * plain_s / n:8.1f} ms/img  {mb / plain_s:8.1f} MB/s")
+    print(f"encrypted PNG write : {1000 * enc_s / n:8.1f} ms/img  {mb / enc_s:8.1f} MB/s"
+          f"  (overhead {100 * (enc_s / plain_s - 1):+.1f}%, +{(enc_bytes - plain_bytes) / n:.0f} B/img)")
+    print(f"streaming decrypt   : {1000 * dec_s / n:8.1f} ms/img  {mb / dec_s:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# bench_mirror.py
+"""
+Local columnar mirror (storage.mirror) vs. scanning storage per analysis,
+on a synthetic history in a throwaway SQLite database.
+
+    python -m benchmarks.bench_mirror [--weeks 4] [--per-day 2000] [--rollup-days 28]
+
+Steps timed:
+  - "scan": screenshots_since over the rollup window plus the same
+    time-per-workstream-per-day rollup in Python, which is what each
+    analysis run does today;
+  - "full sync": the mirror's first sync of all three tables;
+  - "delta sync": a sync after one more hour of activity is inserted;
+  - "rollup": Mirror.time_per_workstream over the window.
+
+"rows moved" is what crosses the storage interface, the part that goes
+over the network against Supabase; a local SQLite file understates the
+scan's cost, so the row counts matter more than its time here. The mirror
+rollup is checked against the scan's to the second.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from storage.mirror import IDLE_DWELL_S, MAX_DWELL_S, Mirror
+from storage.sqlite_store import SQLiteStore
+
+_WORKSTREAMS = ["BIOG 1500 course", "AI Mirror product", "Global Development course", "Internship applications"]
+_APPS = [("VS Code", "ide", "coding"), ("Google Chrome – Canvas", "browser", "reading"),
+         ("Notion", "notes", "note_taking"), ("YouTube", "browser", "entertainment")]
+
+
+def _fill(store: SQLiteStore, start: datetime, end: datetime, per_day: int, rng: random.Random) -> int:
+    """Screenshots, episodes and face samples between `start` and `end` (work hours 9-19)."""
+    step = 10 * 3600 / per_day
+    n = 0
+    t = start
+    ws = rng.choice(_WORKSTREAMS)
+    ep_start = t
+    next_face = t
+    store._conn.execute("begin")
+    try:
+        while t < end:
+            if t.hour < 9 or t.hour >= 19:
+                t = t.replace(hour=9, minute=0, second=0) + (timedelta(days=1) if t.hour >= 19 else timedelta())
+                continue
+            if rng.random() < 0.01:
+                store.insert_episode({"start_time": ep_start.isoformat(), "end_time": t.isoformat(),
+                                      "screenshot_count": 0, "workstream_label": ws})
+                ws, ep_start = rng.choice(_WORKSTREAMS), t
+            app, bucket, work = rng.choice(_APPS)
+            store.insert_screenshot({
+                "timestamp": t.strftime("%Y-%m-%d_%H-%M-%S"), "workstream_label": ws,
+                "deliverable_label": f"{ws} deliverable", "app_or_website": app, "app_bucket": bucket,
+                "work_type": work, "goal_type": "telic", "confidence": 0.8,
+                "semantic_summary": f"Working on {ws} in {app}.",
+            })
+            n += 1
+            if t >= next_face:
+                store.insert_faceval({"created_at": t.astimezone(timezone.utc).replace(tzinfo=None).isoformat(timespec="milliseconds"),
+                                      "state": "engaged", "drowsy": rng.random() * 0.4, "engaged": rng.random() * 0.8})
+                next_face = t + timedelta(seconds=135)
+            gap = step * rng.uniform(0.5, 1.5)
+            if rng.random() < 0.01:
+                gap += rng.uniform(120, 1800)      # away from the desk
+            t += timedelta(seconds=gap)
+        store._conn.execute("commit")
+    except Exception:
+        store._conn.execute("rollback")
+        raise
+    return n
+
+
+def _scan_rollup(store: SQLiteStore, start: str) -> Tuple[Dict[Tuple[str, str], float], int]:
+    rows = store.screenshots_since(start)
+    times = [datetime.strptime(r["timestamp"], "%Y-%m-%d_%H-%M-%S") for r in rows]
+    minutes: Dict[Tuple[str, str], float] = defaultdict(float)
+    for i, r in enumerate(rows):
+        gap = (times[i + 1] - times[i]).total_seconds() if i + 1 < len(rows) else IDLE_DWELL_S
+        dwell = gap if 0 <= gap < MAX_DWELL_S else IDLE_DWELL_S
+        minutes[(r["timestamp"][:10], r.get("workstream_label") or "unknown")] += dwell / 60.0
+    return minutes, len(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--weeks", type=int, default=4)
+    ap.add_argument("--per-day", type=int, default=2000, help="screenshots per 10-hour day")
+    ap.add_argument("--rollup-days", type=int, default=28)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    tmp = tempfile.mkdtemp(prefix="bench_mirror_")
+    try:
+        store = SQLiteStore(os.path.join(tmp, "local.db"))
+        end = datetime.now().replace(microsecond=0) - timedelta(hours=2)
+        start = end - timedelta(weeks=args.weeks)
+        n = _fill(store, start, end, args.per_day, rng)
+        since = (end - timedelta(days=args.rollup_days)).strftime("%Y-%m-%d")
+        print(f"{n} screenshots over {args.weeks} weeks; rollup window since {since}\n")
+
+        t0 = time.perf_counter()
+        scan, scanned = _scan_rollup(store, since)
+        t_scan = time.perf_counter() - t0
+
+        mirror = Mirror(os.path.join(tmp, "mirror"))
+        t0 = time.perf_counter()
+        full = mirror.sync(storage=store)
+        t_full = time.perf_counter() - t0
+
+        _fill(store, end, end + timedelta(hours=1), args.per_day, rng)
+        t0 = time.perf_counter()
+        delta = mirror.sync(storage=store)
+        t_delta = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        out = mirror.time_per_workstream(since)
+        t_rollup = time.perf_counter() - t0
+
+        # same window as the scan, i.e. without the hour added after it
+        scan_after, _ = _scan_rollup(store, since)
+        got = {(r["day"], r["workstream_label"]): r["minutes"] for r in out.to_pylist()}
+        worst = max(abs(got.get(k, 0.0) - v) for k, v in scan_after.items()) * 60
+
+        print(f"{'step':<12} {'ms':>9} {'rows moved':>11}")
+        print(f"{'scan':<12} {1000 * t_scan:>9.1f} {scanned:>11}")
+        print(f"{'full sync':<12} {1000 * t_full:>9.1f} {sum(full.values()):>11}")
+        print(f"{'delta sync':<12} {1000 * t_delta:>9.1f} {sum(delta.values()):>11}")
+        print(f"{'rollup':<12} {1000 * t_rollup:>9.1f} {0:>11}")
+        print(f"\n{out.num_rows} (day, workstream) rows; largest difference from the scan {worst:.2f} s")
+        print(f"mirror on disk: {sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(mirror.root) for f in fs) / 1e6:.1f} MB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
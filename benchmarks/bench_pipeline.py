@@ -0,0 +1,254 @@
+# bench_pipeline.py
+"""
+Offline end-to-end benchmark of one screenshot tick:
+
+    capture(encode) → vision → canonicalize → insert → episodize
+
+against the in-process fakes in benchmarks/fakes.py, using the PNGs under
+raw/screenshots as captured frames. Reports p50/p95/p99 per stage and end
+to end, sustained screenshots/sec and peak RSS.
+
+    python -m benchmarks.bench_pipeline --n 200 --openai-latency 0.05 --db-latency 0.005
+    python -m benchmarks.bench_pipeline --json out.json --compare baseline.json
+    python -m benchmarks.bench_pipeline --cassette traffic.jsonl.gz --latency-scale 1.0
+    python -m benchmarks.bench_pipeline --storage sqlite     # real SQLite file instead of the fake DB
+    python -m benchmarks.bench_pipeline --cascade gpt-4o-mini:low,gpt-4o-mini:high   # two-tier vision cascade
+
+Everything is seeded, so two runs with the same arguments on different
+commits do the same work. --compare exits non-zero when a p50/p95 or the
+throughput regresses by more than --tolerance.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.fakes import install_fakes
+from benchmarks.replay import start_replay
+
+STAGES = ["capture", "vision", "canonicalize", "insert", "episodize", "end_to_end"]
+
+
+def percentile(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    k = (len(xs) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB on Linux
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1024.0
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _load_frames(folder: str, n: int):
+    from PIL import Image
+
+    frames = []
+    for p in sorted(glob.glob(os.path.join(folder, "*.png")))[:n]:
+        im = Image.open(p)
+        im.load()
+        frames.append(im)
+    return frames
+
+
+def run(args) -> Dict:
+    if args.cascade:
+        os.environ["VISION_CASCADE"] = args.cascade     # read when schemas.forChat is imported
+    if args.cassette:
+        fake_openai = fake_db = None
+        player = start_replay(args.cassette, latency_scale=args.latency_scale)
+    else:
+        player = None
+        store = None
+        if args.storage == "sqlite":
+            from storage.sqlite_store import SQLiteStore
+
+            store = SQLiteStore(os.path.join(tempfile.mkdtemp(prefix="bench-db-"), "bench.db"))
+        fake_openai, fake_db = install_fakes(
+            openai_latency=args.openai_latency,
+            db_latency=args.db_latency,
+            openai_error_rate=args.openai_error_rate,
+            db_error_rate=args.db_error_rate,
+            seed=args.seed,
+            storage=store,
+        )
+        if store is not None:
+            fake_db = None
+
+    # imported after the fakes are in place
+    import pipeline
+    from pipeline import build_screenshot_row
+    from schemas.forChat import analyze_screenshot_with_openai, cascade_stats
+    from subfuncEp import episoder, semantic_canonicalizer, transition_cache
+    from subfuncsInput.encoder import EncodePool
+
+    frames = _load_frames(args.dir, args.frames)
+    if not frames:
+        raise SystemExit(f"no PNG fixtures under {args.dir}")
+
+    timings: Dict[str, List[float]] = {s: [] for s in STAGES}
+    errors: Dict[str, int] = {}
+    pool = EncodePool(codec=args.codec, encrypt=False)
+    base_ts = time.mktime(time.strptime("2025-01-01_09-00-00", "%Y-%m-%d_%H-%M-%S"))
+
+    def _stage(name, fn, *a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return fn(*a, **kw)
+        finally:
+            timings[name].append(time.perf_counter() - t0)
+
+    cascade_stats.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        t_start = time.perf_counter()
+        for i in range(args.n):
+            ts = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(base_ts + 10 * i))
+            t_tick = time.perf_counter()
+            try:
+                path = _stage("capture", lambda: pool.submit(frames[i % len(frames)], os.path.join(tmp, ts)).result())
+
+                summary = _stage("vision", analyze_screenshot_with_openai, path)
+                row = _stage("canonicalize", build_screenshot_row, summary, ts)
+                inserted = _stage("insert", pipeline.storage.insert_screenshot, row)
+                _stage("episodize", episoder.advance_episoder, inserted)
+            except Exception as e:
+                key = type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            finally:
+                if os.path.exists(os.path.join(tmp, ts + pool.extension)):
+                    os.remove(os.path.join(tmp, ts + pool.extension))
+            timings["end_to_end"].append(time.perf_counter() - t_tick)
+        wall = time.perf_counter() - t_start
+        pool.shutdown()
+
+    ok = len(timings["end_to_end"])
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+        "screenshots": args.n,
+        "completed": ok,
+        "errors": errors,
+        "screenshots_per_sec": ok / wall if wall > 0 else 0.0,
+        "wall_s": wall,
+        "peak_rss_mb": peak_rss_mb(),
+        "api_calls": dict(fake_openai.calls) if fake_openai else {"replay_hits": player.hits, "replay_fallbacks": player.fallbacks},
+        "db_calls": fake_db.calls if fake_db else None,
+        "vision_cascade": cascade_stats.snapshot(),
+        "canonical_sticky": semantic_canonicalizer.sticky.stats(),
+        "coherence_transitions": transition_cache.get_transition_cache().stats(),
+        "stages": {
+            s: {
+                "n": len(timings[s]),
+                "p50_ms": 1000 * percentile(timings[s], 50),
+                "p95_ms": 1000 * percentile(timings[s], 95),
+                "p99_ms": 1000 * percentile(timings[s], 99),
+            }
+            for s in STAGES
+        },
+    }
+
+
+def print_report(res: Dict) -> None:
+    print(f"commit {res['commit']}  {res['completed']}/{res['screenshots']} ok  "
+          f"{res['screenshots_per_sec']:.2f} screenshots/s  peak RSS {res['peak_rss_mb']:.0f} MB")
+    if res["errors"]:
+        print(f"errors: {res['errors']}")
+    print(f"api calls: {res['api_calls']}  db calls: {res['db_calls']}")
+    if res.get("vision_cascade"):
+        from schemas.forChat import format_cascade_stats
+
+        print(format_cascade_stats(res["vision_cascade"]))
+    if res.get("canonical_sticky"):
+        st = res["canonical_sticky"]
+        print(f"sticky canonicalization: {st['hit_rate']:.0%} hits ({st['hits']}/{st['hits'] + st['misses']})")
+    if res.get("coherence_transitions"):
+        st = res["coherence_transitions"]
+        print(f"coherence transition cache: {st['hit_rate']:.0%} answered ({st['hits']}/{st['hits'] + st['misses']}, "
+              f"{st['keys']} keys)")
+    print(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for s, st in res["stages"].items():
+        print(f"{s:<14}{st['p50_ms']:>10.1f}{st['p95_ms']:>10.1f}{st['p99_ms']:>10.1f}")
+
+
+def compare(res: Dict, baseline: Dict, tolerance: float) -> bool:
+    """
+    Print deltas against a baseline run; True if nothing regressed.
+    """
+    ok = True
+    print(f"\nvs {baseline.get('commit', '?')}:")
+    for s, st in res["stages"].items():
+        old = baseline.get("stages", {}).get(s)
+        if not old:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if old[key] <= 0:
+                continue
+            delta = st[key] / old[key] - 1
+            flag = "  REGRESSION" if delta > tolerance else ""
+            ok &= not flag
+            print(f"  {s:<14}{key:<8}{old[key]:>9.1f} → {st[key]:>9.1f}  ({100 * delta:+.1f}%){flag}")
+    old_tp = baseline.get("screenshots_per_sec", 0)
+    if old_tp > 0:
+        delta = res["screenshots_per_sec"] / old_tp - 1
+        flag = "  REGRESSION" if delta < -tolerance else ""
+        ok &= not flag
+        print(f"  throughput {old_tp:.2f} → {res['screenshots_per_sec']:.2f}/s ({100 * delta:+.1f}%){flag}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", default="raw/screenshots")
+    ap.add_argument("--n", type=int, default=100, help="screenshots to push through")
+    ap.add_argument("--frames", type=int, default=20, help="distinct fixture images to cycle")
+    ap.add_argument("--codec", default="png")
+    ap.add_argument("--openai-latency", type=float, default=0.0, help="median seconds per chat call")
+    ap.add_argument("--db-latency", type=float, default=0.0, help="median seconds per DB call")
+    ap.add_argument("--openai-error-rate", type=float, default=0.0)
+    ap.add_argument("--db-error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cassette", help="replay recorded traffic (benchmarks/replay.py) instead of the fakes")
+    ap.add_argument("--storage", choices=["fake", "sqlite"], default="fake",
+                    help="DB behind the storage layer (--db-latency/--db-error-rate apply to fake only)")
+    ap.add_argument("--latency-scale", type=float, default=1.0, help="with --cassette: scale recorded latencies")
+    ap.add_argument("--cascade", help="VISION_CASCADE override, e.g. 'gpt-4o-mini:low,gpt-4o:high'")
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--compare", help="baseline JSON from an earlier run")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args()
+
+    res = run(args)
+    print_report(res)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(res, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
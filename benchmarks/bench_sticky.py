@@ -0,0 +1,117 @@
+# bench_sticky.py
+"""
+Sticky canonicalization (semantic_canonicalizer.canonicalize) vs. a full
+search per screenshot, on a synthetic session against the fakes.
+
+    python -m benchmarks.bench_sticky [--n 200] [--mean-run 8] [--embed-latency 0.03]
+    python -m benchmarks.bench_sticky --radius 0.9 0.95 0.98
+    python -m benchmarks.bench_sticky --switch 0 0.2 0.5
+
+The session is runs of screenshots on one (workstream, deliverable) task,
+run lengths geometric around --mean-run, with the app and wording changing
+inside a run, as when someone moves between editor, browser and notes on
+one assignment. With --switch p, each screenshot after a run's first moves
+to another deliverable of the same workstream with probability p (exam
+revision, then the lab report, same course). Each setting runs in a fresh
+process (fresh fakes, indexes and DB).
+
+"agree" is the share of sticky hits whose reused ids equal what a full
+search would have returned at that point (checked with read-only lookups
+and an extra embedding that isn't counted).
+"""
+import argparse
+import multiprocessing
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def _session(n: int, mean_run: float, switch: float, seed: int) -> List[Tuple[str, str, str]]:
+    from benchmarks.fakes import _WORKSTREAMS, FakeOpenAI
+
+    deliverables = dict(_WORKSTREAMS)
+    rng = random.Random(seed)
+    out: List[Tuple[str, str, str]] = []
+    while len(out) < n:
+        task = FakeOpenAI._summary(rng.randrange(1 << 30))
+        ws, dv = task["workstream_label"], task["deliverable_label"]
+        for i in range(min(n - len(out), 1 + int(rng.expovariate(1 / max(mean_run - 1, 1e-9))))):
+            others = [d for d in deliverables[ws] if d != dv]
+            if i and others and rng.random() < switch:
+                dv = rng.choice(others)
+            s = FakeOpenAI._summary(rng.randrange(1 << 30))
+            # like most real summaries, the wording names the course, not the deliverable
+            summary = f"Working on {ws} in {s['app_or_website']}, step {rng.randint(1, 9)}."
+            out.append((ws, dv, summary))
+    return out
+
+
+def _run(radius: float, switch: float, n: int, mean_run: float, embed_latency: float, seed: int) -> Dict[str, Any]:
+    from benchmarks.fakes import install_fakes
+
+    fake_openai, _ = install_fakes(openai_latency=5 * embed_latency, seed=seed)
+    from subfuncEp import semantic_canonicalizer as sc
+
+    sticky = sc.StickyCanonicalizer(radius=radius)
+    times, agree, checked = [], 0, 0
+    for ws_raw, dv_raw, summary in _session(n, mean_run, switch, seed):
+        hits_before = sticky.hits
+        t0 = time.perf_counter()
+        ws_id, ws_label, dv_id, _ = sticky.canonicalize(ws_raw, dv_raw, summary)
+        times.append(time.perf_counter() - t0)
+        if sticky.hits > hits_before:
+            calls = fake_openai.calls["embedding"]
+            full_ws, _, s1 = sc.workstream_index.nearest(sc.get_embedding(sc._workstream_text(ws_raw, summary)))
+            full_dv, _, s2 = sc.deliverable_index.nearest(
+                sc.get_embedding(sc._deliverable_text(ws_label, dv_raw, summary)), group=ws_id
+            )
+            fake_openai.calls["embedding"] = calls          # the check isn't part of the workload
+            checked += 1
+            agree += (full_ws == ws_id and s1 >= sc.WORKSTREAM_SIM_THRESHOLD
+                      and full_dv == dv_id and s2 >= sc.DELIVERABLE_SIM_THRESHOLD)
+    sticky.flush()
+    st = sticky.stats()
+    t = np.asarray(times) * 1000
+    return {
+        "radius": radius,
+        "switch": switch,
+        "hit_rate": st["hit_rate"],
+        "agree": agree / checked if checked else 1.0,
+        "embeddings": fake_openai.calls["embedding"],
+        "p50_ms": float(np.percentile(t, 50)),
+        "p95_ms": float(np.percentile(t, 95)),
+        "mean_ms": float(t.mean()),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=200)
+    ap.add_argument("--mean-run", type=float, default=8.0)
+    ap.add_argument("--embed-latency", type=float, default=0.03, help="median seconds per embedding call")
+    ap.add_argument("--radius", type=float, nargs="+", default=[0.95])
+    ap.add_argument("--switch", type=float, nargs="+", default=[0.0, 0.3],
+                    help="chance a screenshot moves to another deliverable of the same workstream")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    radii = [2.0] + args.radius             # 2.0: never sticky, i.e. the full search every time
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for p in args.switch:
+        for r in radii:
+            with ctx.Pool(1) as pool:
+                results.append(pool.apply(_run, (r, p, args.n, args.mean_run, args.embed_latency, args.seed)))
+
+    print(f"{args.n} screenshots, mean run {args.mean_run:g}, embedding latency ~{1000 * args.embed_latency:.0f} ms\n")
+    print(f"{'switch':>6} {'radius':>8} {'hits':>6} {'agree':>6} {'embeds':>7} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in results:
+        label = "full" if r["radius"] > 1 else f"{r['radius']:g}"
+        print(f"{r['switch']:>6g} {label:>8} {r['hit_rate']:>6.0%} {r['agree']:>6.0%} {r['embeddings']:>7} "
+              f"{r['mean_ms']:>8.1f} {r['p50_ms']:>7.1f} {r['p95_ms']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# bench_transitions.py
+"""
+How many coherence calls the transition cache (subfuncEp.transition_cache)
+answers, and how often its answer lands on the same side of the episode
+threshold as GPT's.
+
+    python -m benchmarks.bench_transitions [--days 30]            # coherence_labels in storage
+    python -m benchmarks.bench_transitions --synthetic 5000 [--min-agree 0.8 0.9 0.95]
+
+Calls are replayed oldest first as the live episoder would meet them: a
+call the cache answers is compared with the logged (or synthetic) GPT
+score and not learned from; every other call is "sent to GPT" and learned.
+"side agrees" is the share of answered calls where cache and GPT fall on
+the same side of SAME_EPISODE_THRESHOLD, i.e. where the extend/buffer
+decision would not change.
+
+The synthetic day walks through tasks from the fakes' vocabulary, one
+(workstream, deliverable) at a time with app changes inside a task and
+detours to other tasks and to entertainment; GPT is stood in for by a
+noisy rule (same deliverable → coherent unless entertainment, other
+workstream → not, same workstream/other deliverable → either).
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from subfuncEp.episode_rules import SAME_EPISODE_THRESHOLD, decide
+from subfuncEp.transition_cache import MIN_AGREE, TransitionCache
+
+# one call: (episode descriptor, screenshot descriptor, GPT score)
+Call = Tuple[Dict[str, Any], Dict[str, Any], float]
+
+
+def _logged(days: int) -> List[Call]:
+    from storage import read_all
+    from storage_client import storage
+
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    calls = []
+    for lab in read_all(lambda limit, offset: storage.coherence_labels_since(
+        since, descriptors=True, limit=limit, offset=offset
+    )):
+        if not str(lab.get("label_source") or "").startswith("gpt"):
+            continue
+        ep, shot = lab.get("episode_descriptor"), lab.get("screenshot_descriptor")
+        if isinstance(ep, str):
+            ep, shot = json.loads(ep), json.loads(shot or "{}")
+        if ep and shot and lab.get("coherence_score") is not None:
+            calls.append((ep, shot, float(lab["coherence_score"])))
+    return calls
+
+
+def _teacher(rng: random.Random, ep: Dict[str, Any], shot: Dict[str, Any]) -> float:
+    if rng.random() < 0.04:                     # GPT being GPT
+        return round(rng.uniform(0.1, 0.95), 2)
+    if shot["work_type"] == "entertainment" and ep["dominant_work_type"] != "entertainment":
+        return round(rng.uniform(0.05, 0.3), 2)
+    if shot["workstream_label"] != ep["dominant_workstream_label"]:
+        return round(rng.uniform(0.05, 0.35), 2)
+    if shot["deliverable_label"] == ep["dominant_deliverable_label"]:
+        return round(rng.uniform(0.75, 0.95), 2)
+    return round(rng.uniform(0.3, 0.85), 2)
+
+
+def _synthetic(n: int, seed: int) -> List[Call]:
+    from benchmarks.fakes import _APPS, _WORKSTREAMS, install_fakes
+
+    install_fakes(seed=seed)
+    from subfuncEp.episoder import EpisodeState, _build_episode_descriptor, _build_screenshot_descriptor
+
+    rng = random.Random(seed)
+    tasks = [(ws, dv) for ws, dvs in _WORKSTREAMS for dv in dvs]
+    work_apps = [a for a in _APPS if a[2] != "entertainment"]
+    t = datetime(2025, 3, 3, 9, 0, 0)
+    calls: List[Call] = []
+    ep, pending = None, 0
+    task = rng.choice(tasks)
+    while len(calls) < n:
+        r = rng.random()
+        if r < 0.04:
+            task = rng.choice(tasks)            # moves on
+        shown, app = task, rng.choice(work_apps)
+        if 0.04 <= r < 0.10:
+            shown = rng.choice(tasks)           # detour to another task
+        elif 0.10 <= r < 0.14:
+            app = next(a for a in _APPS if a[2] == "entertainment")
+        name, bucket, work = app
+        t += timedelta(seconds=rng.choice((10, 10, 20, 40)))
+        row = {
+            "timestamp": t.strftime("%Y-%m-%d_%H-%M-%S"),
+            "app_or_website": name, "app_bucket": bucket, "work_type": work, "goal_type": "telic",
+            "workstream_label": shown[0], "deliverable_label": shown[1],
+            "semantic_summary": f"Working on {shown[1]} for {shown[0]} in {name}.",
+        }
+        if ep is None:
+            ep = EpisodeState(start_time=t, end_time=t)
+            ep.add_screenshot(row)
+            continue
+        ep_desc, shot_desc = _build_episode_descriptor(ep), _build_screenshot_descriptor(row)
+        score = _teacher(rng, ep_desc, shot_desc)
+        calls.append((ep_desc, shot_desc, score))
+        action = decide(score, pending)
+        if action == "extend":
+            ep.add_screenshot(row)
+            pending = 0
+        elif action == "buffer":
+            pending += 1
+        else:
+            ep = EpisodeState(start_time=t, end_time=t)
+            ep.add_screenshot(row)
+            pending = 0
+        if t.hour >= 19:                        # next day
+            t = t.replace(hour=9) + timedelta(days=1)
+    return calls
+
+
+def replay(calls: List[Call], min_agree: float, seed: int) -> Dict[str, Any]:
+    random.seed(seed)       # the audit draw
+    cache = TransitionCache(min_agree=min_agree)
+    answered = agree = 0
+    by_side = {True: [0, 0], False: [0, 0]}     # GPT coherent? → [answered, agreed]
+    for ep, shot, score in calls:
+        cached = cache.lookup(ep, shot)
+        if cached is None:
+            cache.learn(ep, shot, score)
+            continue
+        answered += 1
+        same = (cached >= SAME_EPISODE_THRESHOLD) == (score >= SAME_EPISODE_THRESHOLD)
+        agree += same
+        side = by_side[score >= SAME_EPISODE_THRESHOLD]
+        side[0] += 1
+        side[1] += same
+    st = cache.stats()
+    return {
+        "min_agree": min_agree,
+        "answered": answered / len(calls),
+        "agree": agree / answered if answered else 1.0,
+        "coherent_agree": by_side[True][1] / by_side[True][0] if by_side[True][0] else 1.0,
+        "incoherent_agree": by_side[False][1] / by_side[False][0] if by_side[False][0] else 1.0,
+        "keys": st["keys"],
+        "audits": st["audits"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--synthetic", type=int, help="use N synthetic calls instead of logged labels")
+    ap.add_argument("--min-agree", type=float, nargs="+", default=[MIN_AGREE])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    calls = _synthetic(args.synthetic, args.seed) if args.synthetic else _logged(args.days)
+    if len(calls) < 10:
+        print("not enough coherence labels (try --synthetic 5000)")
+        return
+    gpt_coherent = sum(s >= SAME_EPISODE_THRESHOLD for _, _, s in calls) / len(calls)
+    print(f"{len(calls)} coherence calls ({'synthetic' if args.synthetic else f'logged, {args.days} days'}), "
+          f"{gpt_coherent:.0%} coherent by GPT\n")
+    print(f"{'agree':>6} {'answered':>9} {'side agrees':>12} {'(coherent':>10} {'incoherent)':>11} {'keys':>6} {'audits':>7}")
+    for m in args.min_agree:
+        r = replay(calls, m, args.seed)
+        print(f"{m:>6g} {r['answered']:>9.0%} {r['agree']:>12.1%} {r['coherent_agree']:>10.1%} "
+              f"{r['incoherent_agree']:>11.1%} {r['keys']:>6} {r['audits']:>7}")
+
+
+if __name__ == "__main__":
+    main()
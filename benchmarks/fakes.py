@@ -0,0 +1,400 @@
+# fakes.py
+"""
+In-process stand-ins for the OpenAI and Supabase clients, with injectable
+latency and error rates, so the pipeline can be driven offline.
+
+    from benchmarks.fakes import install_fakes
+    openai_fake, db_fake = install_fakes(openai_latency=0.8, db_latency=0.05)
+    # now import pipeline / episoder / canonicalizer and run them
+
+install_fakes must run before the pipeline modules are imported the first
+time: storage_client.py builds the configured backend at import. The fake
+Supabase sits underneath a real SupabaseStore, so the storage layer itself
+is exercised; pass storage= to install_clients to use another backend
+(e.g. an SQLiteStore on a temp file) instead. Like PostgREST, the fake
+returns at most 1000 rows per select, so unpaged reads get truncated here
+too.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+from typing import Any, Dict, List, Optional
+
+EMBED_DIM = 1536
+_DATA_URL_RE = re.compile(r"data:[^\"]+")
+_IMAGE_PART = "\"type\": \"image_url\""      # once per image in json.dumps(messages)
+_LOW_DETAIL = "\"detail\": \"low\""
+_DETAIL_RE = re.compile(r', "detail": "\w+"')
+
+# small fixed vocabulary so canonicalization actually merges labels
+_WORKSTREAMS = [
+    ("BIOG 1500 course", ["Study for BIOG Exam 2", "Finish lab report section 3"]),
+    ("AI Mirror product", ["Implement episodization coherence function", "Prepare pitch deck v3"]),
+    ("Global Development course", ["Write Global Development midterm speech"]),
+    ("Internship applications", ["Update resume", "Cover letter for summer role"]),
+]
+_APPS = [
+    ("VS Code", "ide", "coding"),
+    ("Google Chrome – Canvas", "browser", "reading"),
+    ("Notion", "notes", "note_taking"),
+    ("YouTube", "browser", "entertainment"),
+    ("Terminal", "terminal", "coding"),
+]
+
+
+class _Latency:
+    """
+    Log-normal latency around `median` seconds (sigma 0.35), seeded.
+    """
+
+    def __init__(self, median: float, error_rate: float, seed: int):
+        self.median = median
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait_and_maybe_fail(self, scale: float = 1.0) -> bool:
+        with self._lock:
+            delay = scale * self.median * self._rng.lognormvariate(0.0, 0.35) if self.median > 0 else 0.0
+            fail = self._rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        return fail
+
+
+def _ns(**kw) -> types.SimpleNamespace:
+    return types.SimpleNamespace(**kw)
+
+
+# ---------- OpenAI ----------------------------------------------------------
+
+def _rate_limit_error():
+    import httpx
+    import openai
+
+    req = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    resp = httpx.Response(429, headers={"retry-after-ms": "200"}, request=req)
+    return openai.RateLimitError("fake 429", response=resp, body=None)
+
+
+def _seed_from(*parts: Any) -> int:
+    h = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "little")
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, embed_latency: Optional[float] = None, seed: int = 0):
+        self._chat_latency = _Latency(latency, error_rate, seed)
+        self._embed_latency = _Latency(latency / 5 if embed_latency is None else embed_latency, error_rate, seed + 1)
+        self.calls: Dict[str, int] = {"vision": 0, "coherence": 0, "embedding": 0, "other": 0}
+        self._lock = threading.Lock()
+        self.chat = _ns(completions=_ns(create=self._chat_create))
+        self.embeddings = _ns(create=self._embed_create)
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    # -- chat --
+
+    def _chat_create(self, **kw) -> Any:
+        text = json.dumps(kw.get("messages", []), default=str)
+        # low-detail images are quicker to read, the bigger model slower
+        scale = (0.6 if _LOW_DETAIL in text else 1.0) * (1.5 if kw.get("model") == "gpt-4o" else 1.0)
+        if self._chat_latency.wait_and_maybe_fail(scale):
+            raise _rate_limit_error()
+        fmt = (kw.get("response_format") or {}).get("json_schema", {})
+        name = fmt.get("name", "")
+        if "Screenshot" in name:
+            self._count("vision")
+            content = self._vision_content(name, text, fmt.get("schema", {}), kw.get("model", ""))
+        elif name == "CoherenceJudgment":
+            self._count("coherence")
+            content = json.dumps({"coherence": self._coherence(text)})
+        else:
+            self._count("other")
+            content = "{}"
+        # images are billed per tile, not per base64 byte (a flat 85 at low detail)
+        n_images = text.count(_IMAGE_PART)
+        n_low = text.count(_LOW_DETAIL)
+        prompt = len(_DATA_URL_RE.sub("", text)) // 4 + 765 * (n_images - n_low) + 85 * n_low
+        usage = _ns(prompt_tokens=prompt, completion_tokens=len(content) // 4,
+                    total_tokens=prompt + len(content) // 4)
+        return _ns(choices=[_ns(message=_ns(content=content))], usage=usage)
+
+    @staticmethod
+    def _summary(seed: int) -> Dict[str, Any]:
+        rng = random.Random(seed)
+        ws, deliverables = _WORKSTREAMS[rng.randrange(len(_WORKSTREAMS))]
+        dv = deliverables[rng.randrange(len(deliverables))]
+        app, bucket, work = _APPS[rng.randrange(len(_APPS))]
+        return {
+            "semantic_summary": f"Working on {dv} for {ws} in {app}.",
+            "workstream_label": ws,
+            "deliverable_label": dv,
+            "app_or_website": app,
+            "app_bucket": bucket,
+            "work_type": work,
+            "goal_type": "atelic" if work == "entertainment" else "telic",
+            "confidence": round(0.5 + 0.5 * rng.random(), 2),
+        }
+
+    def _vision_content(self, name: str, text: str, schema: Dict[str, Any], model: str = "") -> str:
+        # one summary per image in the request; consecutive images tend to
+        # share a task, like real sessions do. Low detail reads less, a
+        # bigger model more, so the cascade sees confidence move by tier.
+        n_images = max(1, text.count(_IMAGE_PART))
+        base = _seed_from(_DETAIL_RE.sub("", text)[-256:]) // 7
+        items = [self._summary(base + i // 3) for i in range(n_images)]
+        shift = (-0.15 if _LOW_DETAIL in text else 0.0) + (0.1 if model == "gpt-4o" else 0.0)
+        for it in items:
+            it["confidence"] = round(min(1.0, max(0.0, it["confidence"] + shift)), 2)
+        props = schema.get("properties", {})
+        if "items" in props:
+            return json.dumps({"items": [dict(it, index=i) for i, it in enumerate(items)]})
+        item = items[0]
+        return json.dumps({k: v for k, v in item.items() if not props or k in props})
+
+    @staticmethod
+    def _coherence(text: str) -> float:
+        rng = random.Random(_seed_from(text))
+        return round(rng.choice([0.9, 0.85, 0.8, 0.75, 0.3, 0.2]), 2)
+
+    # -- embeddings --
+
+    def _embed_create(self, **kw) -> Any:
+        if self._embed_latency.wait_and_maybe_fail():
+            raise _rate_limit_error()
+        self._count("embedding")
+        inputs = kw["input"] if isinstance(kw["input"], list) else [kw["input"]]
+        data = [_ns(index=i, embedding=self.embed(t)) for i, t in enumerate(inputs)]
+        return _ns(data=data, usage=_ns(total_tokens=sum(len(t) for t in inputs) // 4))
+
+    @staticmethod
+    def embed(text: str) -> List[float]:
+        """
+        Deterministic unit vector: a direction per known label plus small
+        text-specific noise, so same-label texts land close together.
+        """
+        anchor = 0
+        for ws, dvs in _WORKSTREAMS:
+            for label in [ws] + dvs:
+                if label in text:
+                    anchor = _seed_from(anchor, label)
+        a = random.Random(anchor)
+        n = random.Random(_seed_from(text))
+        v = [a.gauss(0, 1) + 0.15 * n.gauss(0, 1) for _ in range(EMBED_DIM)]
+        norm = sum(x * x for x in v) ** 0.5
+        return [x / norm for x in v]
+
+
+# ---------- Supabase --------------------------------------------------------
+
+class _Query:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._payload: Any = None
+        self._filters: List[Any] = []
+        self._order: List[Any] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+
+    def select(self, cols: str = "*"):
+        self._op = "select"
+        return self
+
+    def insert(self, row):
+        self._op, self._payload = "insert", row
+        return self
+
+    def update(self, values):
+        self._op, self._payload = "update", values
+        return self
+
+    def upsert(self, row):
+        self._op, self._payload = "upsert", row
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def eq(self, col, val):
+        self._filters.append(lambda r: r.get(col) == val)
+        return self
+
+    def gt(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) > val)
+        return self
+
+    def gte(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) >= val)
+        return self
+
+    def lt(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) < val)
+        return self
+
+    def order(self, col, desc: bool = False):
+        self._order.append((col, desc))
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        return self._db._execute(self)
+
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, max_rows: int = 1000):
+        self._latency = _Latency(latency, error_rate, seed + 2)
+        self.max_rows = max_rows        # PostgREST's db-max-rows: selects return at most this many
+        self._lock = threading.Lock()
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._next_id: Dict[str, int] = {}
+        self.calls = 0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, fn: str, params: Dict[str, Any]):
+        q = _Query(self, "__rpc__")
+        q._op, q._payload = "rpc", (fn, params)
+        return q
+
+    def _execute(self, q: _Query):
+        if self._latency.wait_and_maybe_fail():
+            raise RuntimeError("fake supabase error")
+        with self._lock:
+            self.calls += 1
+            rows = self.tables.setdefault(q._table, [])
+            if q._op == "insert":
+                payload = q._payload if isinstance(q._payload, list) else [q._payload]
+                out = []
+                for r in payload:
+                    r = dict(r)
+                    r.setdefault("id", self._next_id.get(q._table, 1))
+                    self._next_id[q._table] = r["id"] + 1
+                    rows.append(r)
+                    out.append(dict(r))
+                return _ns(data=out)
+            if q._op == "rpc":
+                return _ns(data=self._rpc(*q._payload))
+            hits = [r for r in rows if all(f(r) for f in q._filters)]
+            if q._op == "update":
+                for r in hits:
+                    r.update(q._payload)
+                return _ns(data=[dict(r) for r in hits])
+            if q._op == "delete":
+                for r in hits:
+                    rows.remove(r)
+                return _ns(data=[dict(r) for r in hits])
+            for col, desc in reversed(q._order):      # stable sorts: last key first
+                hits.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+            limit = self.max_rows if q._limit is None else min(q._limit, self.max_rows)
+            hits = hits[q._offset: q._offset + limit]
+            return _ns(data=[dict(r) for r in hits])
+
+
+    def _rpc(self, fn: str, params: Dict[str, Any]) -> Any:
+        # mirrors sql/merge_centroid_delta.sql
+        if fn == "merge_centroid_delta":
+            for r in self.tables.get(params["p_table"], []):
+                if r.get("id") != params["p_id"]:
+                    continue
+                emb, n = r.get("embedding") or [], r.get("n_points", 0) or 0
+                total, count = params["p_sum"], params["p_count"]
+                if len(emb) != len(total):
+                    emb, n = [0.0] * len(total), 0
+                r["embedding"] = [(e * n + s) / (n + count) for e, s in zip(emb, total)]
+                r["n_points"] = n + count
+            return None
+        raise RuntimeError(f"PGRST202 Could not find the function public.{fn}")
+
+
+# ---------- Installation ----------------------------------------------------
+
+# module → attribute holding the client, patched by install_fakes
+OPENAI_CLIENT_SITES = [
+    ("schemas.forChat", "client"),
+    ("subfuncEp.embeddings", "client"),
+    ("subfuncEp.episoder", "client"),
+]
+STORAGE_SITES = [
+    ("storage_client", "storage"),
+    ("pipeline", "storage"),
+    ("subfuncEp.semantic_canonicalizer", "storage"),
+    ("subfuncEp.episoder", "storage"),
+]
+
+
+def install_clients(openai_client: Any, supabase_client: Any = None, storage: Any = None) -> Any:
+    """
+    Point every pipeline module at the given OpenAI client and storage
+    (`storage`, or a SupabaseStore over `supabase_client`). Modules not
+    imported yet pick it up through the stub 'storage_client' module.
+    Returns the storage installed.
+    """
+    from storage.supabase_store import SupabaseStore
+
+    if storage is None:
+        storage = SupabaseStore(supabase_client)
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    stub = sys.modules.get("storage_client")
+    if stub is None:
+        stub = types.ModuleType("storage_client")
+        sys.modules["storage_client"] = stub
+    stub.storage = storage
+
+    import importlib
+
+    for mod_name, attr in OPENAI_CLIENT_SITES:
+        setattr(importlib.import_module(mod_name), attr, openai_client)
+    for mod_name, attr in STORAGE_SITES:
+        mod = importlib.import_module(mod_name)
+        if hasattr(mod, attr):
+            setattr(mod, attr, storage)
+    return storage
+
+
+def isolate_local_state() -> str:
+    """
+    Point on-disk caches (the canonicalizer's ANN snapshots) at a temp dir
+    so offline runs never leave fake centroids behind for the live agent.
+    """
+    import tempfile
+
+    from subfuncEp import semantic_canonicalizer
+
+    tmp = tempfile.mkdtemp(prefix="offline-state-")
+    semantic_canonicalizer.ANN_DIR = tmp
+    return tmp
+
+
+def install_fakes(
+    openai_latency: float = 0.0,
+    db_latency: float = 0.0,
+    openai_error_rate: float = 0.0,
+    db_error_rate: float = 0.0,
+    seed: int = 0,
+    storage: Any = None,
+):
+    fake_openai = FakeOpenAI(openai_latency, openai_error_rate, seed=seed)
+    fake_db = FakeSupabase(db_latency, db_error_rate, seed=seed)
+    install_clients(fake_openai, fake_db, storage=storage)
+    isolate_local_state()
+    return fake_openai, fake_db
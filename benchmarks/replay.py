@@ -0,0 +1,379 @@
+# replay.py
+"""
+Record/replay transport for the OpenAI and Supabase clients.
+
+Recording wraps the live clients and appends every call to a gzip JSONL
+cassette: a request key, the call's target (model or table/op), its
+latency and the response (or error). Replaying serves those responses
+back with the original latencies, optionally scaled, so caching, batching
+or concurrency experiments can be run repeatably on real traffic with no
+network.
+
+    python -m benchmarks.replay record  traffic.jsonl.gz -- backfill.py raw/screenshots --workers 4
+    python -m benchmarks.replay replay  traffic.jsonl.gz --latency-scale 0.5 -- backfill.py raw/screenshots
+    python -m benchmarks.replay info    traffic.jsonl.gz
+
+Requests are matched by key first (a hash of the call's arguments, with
+image data hashed rather than stored). When an experiment changes the
+requests themselves, unmatched calls fall back to the next unused
+recording for the same target, in recorded order; --strict turns that
+into an error instead.
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import runpy
+import sys
+import threading
+import time
+import types
+from array import array
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+_DATA_URL_RE = re.compile(r"data:[^;]+;base64,[A-Za-z0-9+/=]+")
+PACK_MIN_FLOATS = 64      # float lists at least this long are stored as packed float32
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+# ---------- Encoding --------------------------------------------------------
+
+def request_key(kind: str, payload: Any) -> str:
+    """
+    Stable hash of a call. Inline images are replaced by their own hash, and
+    float vectors are hashed at float32 precision so that a replayed
+    embedding written back to the DB still matches its recording.
+    """
+    text = json.dumps(_pack(payload), sort_keys=True, default=str)
+    text = _DATA_URL_RE.sub(lambda m: "img:" + hashlib.sha1(m.group(0).encode()).hexdigest(), text)
+    return hashlib.sha1(f"{kind}|{text}".encode("utf-8")).hexdigest()[:20]
+
+
+def _pack(obj: Any) -> Any:
+    # embeddings dominate cassette size; float32 is what the API returns anyway
+    if isinstance(obj, list) and len(obj) >= PACK_MIN_FLOATS and all(isinstance(x, float) for x in obj):
+        return {"__f32__": base64.b64encode(array("f", obj).tobytes()).decode("ascii")}
+    if isinstance(obj, (list, tuple)):
+        return [_pack(x) for x in obj]
+    if isinstance(obj, dict):
+        return {k: _pack(v) for k, v in obj.items()}
+    return obj
+
+
+def _unpack(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        if "__f32__" in obj and len(obj) == 1:
+            return array("f", base64.b64decode(obj["__f32__"])).tolist()
+        return {k: _unpack(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_unpack(x) for x in obj]
+    return obj
+
+
+def _to_namespace(obj: Any) -> Any:
+    """Attribute access for replayed OpenAI responses (resp.choices[0].message.content)."""
+    if isinstance(obj, dict):
+        return types.SimpleNamespace(**{k: _to_namespace(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return [_to_namespace(x) for x in obj]
+    return obj
+
+
+def _dump_openai(resp: Any) -> Any:
+    if hasattr(resp, "model_dump"):
+        return resp.model_dump()
+    return json.loads(json.dumps(resp, default=lambda o: vars(o)))
+
+
+def _dump_error(err: Exception) -> Dict[str, Any]:
+    response = getattr(err, "response", None)
+    return {
+        "type": type(err).__name__,
+        "status": getattr(response, "status_code", None),
+        "message": str(err),
+    }
+
+
+def _raise_error(err: Dict[str, Any]) -> None:
+    if err.get("type") == "RateLimitError":
+        import httpx
+        import openai
+
+        req = httpx.Request("POST", "https://api.openai.com/v1/replayed")
+        resp = httpx.Response(err.get("status") or 429, request=req)
+        raise openai.RateLimitError(err.get("message", "replayed 429"), response=resp, body=None)
+    raise RuntimeError(f"(replayed {err.get('type')}) {err.get('message')}")
+
+
+# ---------- Cassette --------------------------------------------------------
+
+class Cassette:
+    """
+    Gzip JSONL of {"kind", "target", "key", "latency", "response" | "error"}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = None
+        self.entries: List[Dict[str, Any]] = []
+
+    # -- recording --
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(_pack(entry), separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._f is None:
+                # a new gzip member per session, so re-recording onto a file appends
+                self._f = gzip.open(self.path, "at", encoding="utf-8")
+            self._f.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+    # -- replay --
+
+    def load(self) -> "Cassette":
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self.entries.append(json.loads(line))
+                except ValueError:
+                    continue     # torn last line from an interrupted recording
+        return self
+
+
+class _Recorder:
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def call(self, kind: str, target: str, key_payload: Any, fn, dump, load):
+        key = request_key(kind, key_payload)
+        t0 = time.perf_counter()
+        try:
+            resp = fn()
+        except Exception as e:
+            self.cassette.append({"kind": kind, "target": target, "key": key,
+                                  "latency": time.perf_counter() - t0, "error": _dump_error(e)})
+            raise
+        self.cassette.append({"kind": kind, "target": target, "key": key,
+                              "latency": time.perf_counter() - t0, "response": dump(resp)})
+        return resp
+
+
+class _Player:
+    def __init__(self, cassette: Cassette, latency_scale: float = 1.0, strict: bool = False):
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._by_key: Dict[Tuple[str, str], Deque[int]] = defaultdict(deque)
+        self._by_target: Dict[Tuple[str, str], Deque[int]] = defaultdict(deque)
+        self._used = set()
+        self._entries = cassette.entries
+        for i, e in enumerate(self._entries):
+            self._by_key[(e["kind"], e["key"])].append(i)
+            self._by_target[(e["kind"], e["target"])].append(i)
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _take(self, q: Deque[int]) -> Optional[int]:
+        while q:
+            i = q.popleft()
+            if i not in self._used:
+                self._used.add(i)
+                return i
+        return None
+
+    def call(self, kind: str, target: str, key_payload: Any, fn, dump, load):
+        key = request_key(kind, key_payload)
+        with self._lock:
+            i = self._take(self._by_key[(kind, key)])
+            if i is not None:
+                self.hits += 1
+            elif not self.strict:
+                i = self._take(self._by_target[(kind, target)])
+                if i is not None:
+                    self.fallbacks += 1
+        if i is None:
+            raise CassetteMiss(f"no recording left for {kind} {target} ({key})")
+        entry = self._entries[i]
+        if self.latency_scale > 0:
+            time.sleep(entry["latency"] * self.latency_scale)
+        if "error" in entry:
+            _raise_error(entry["error"])
+        return load(_unpack(entry["response"]))
+
+
+# ---------- OpenAI ----------------------------------------------------------
+
+class ReplayOpenAI:
+    """
+    Drop-in for the OpenAI client's chat.completions.create and
+    embeddings.create. Wraps `client` when recording; `client` is None on replay.
+    """
+
+    def __init__(self, transport, client: Any = None):
+        self._t = transport
+        self._client = client
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._chat_create))
+        self.embeddings = types.SimpleNamespace(create=self._embed_create)
+
+    def _chat_create(self, **kw):
+        fn = (lambda: self._client.chat.completions.create(**kw)) if self._client is not None else None
+        return self._t.call("openai.chat", kw.get("model", ""), kw, fn, _dump_openai, _to_namespace)
+
+    def _embed_create(self, **kw):
+        fn = (lambda: self._client.embeddings.create(**kw)) if self._client is not None else None
+        return self._t.call("openai.embeddings", kw.get("model", ""), kw, fn, _dump_openai, _to_namespace)
+
+
+# ---------- Supabase --------------------------------------------------------
+
+def _dump_db(resp: Any) -> Dict[str, Any]:
+    return {"data": getattr(resp, "data", None), "count": getattr(resp, "count", None)}
+
+
+class _Query:
+    """
+    Records the builder chain (table().select().eq()...) and routes
+    execute() through the transport.
+    """
+
+    def __init__(self, transport, table: str, inner: Any = None, chain: Tuple = ()):
+        self._t = transport
+        self._table = table
+        self._inner = inner
+        self._chain = chain
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        inner_attr = getattr(self._inner, name) if self._inner is not None else None
+
+        def _step(*args, **kwargs):
+            inner = inner_attr(*args, **kwargs) if inner_attr is not None else None
+            return _Query(self._t, self._table, inner, self._chain + ((name, args, kwargs),))
+
+        return _step
+
+    def execute(self):
+        ops = [step[0] for step in self._chain]
+        op = next((o for o in ops if o in ("select", "insert", "update", "upsert", "delete", "rpc")), "select")
+        target = f"{self._table}.{op}"
+        fn = self._inner.execute if self._inner is not None else None
+        return self._t.call("supabase", target, [self._table, self._chain], fn, _dump_db,
+                            lambda d: types.SimpleNamespace(**d))
+
+
+class ReplaySupabase:
+    def __init__(self, transport, client: Any = None):
+        self._t = transport
+        self._client = client
+
+    def table(self, name: str) -> _Query:
+        return _Query(self._t, name, self._client.table(name) if self._client is not None else None)
+
+    def rpc(self, fn: str, params: Dict[str, Any]) -> _Query:
+        inner = self._client.rpc(fn, params) if self._client is not None else None
+        return _Query(self._t, fn, inner, (("rpc", (params,), {}),))
+
+
+# ---------- Installation ----------------------------------------------------
+
+def start_recording(path: str) -> Cassette:
+    """
+    Wrap the live clients so every call is appended to `path`. DB traffic
+    is recorded at the Supabase client, so record with the default
+    STORAGE_BACKEND.
+    """
+    import atexit
+
+    from benchmarks.fakes import install_clients
+    from schemas import forChat
+    from supabase_client import supabase
+
+    cassette = Cassette(path)
+    rec = _Recorder(cassette)
+    install_clients(ReplayOpenAI(rec, forChat.client), ReplaySupabase(rec, supabase))
+    atexit.register(cassette.close)
+    return cassette
+
+
+def start_replay(path: str, latency_scale: float = 1.0, strict: bool = False) -> _Player:
+    """
+    Serve every OpenAI/Supabase call from the cassette at `path`. Must run
+    before the pipeline modules are first imported (see fakes.install_clients).
+    """
+    from benchmarks.fakes import install_clients, isolate_local_state
+
+    player = _Player(Cassette(path).load(), latency_scale=latency_scale, strict=strict)
+    install_clients(ReplayOpenAI(player), ReplaySupabase(player))
+    isolate_local_state()
+    return player
+
+
+def _info(path: str) -> None:
+    entries = Cassette(path).load().entries
+    per: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for e in entries:
+        per[f"{e['kind']} {e['target']}"].append(e["latency"])
+        if "error" in e:
+            errors[e["error"].get("type", "?")] += 1
+    print(f"{path}: {len(entries)} calls, {os.path.getsize(path) / 1e3:.0f} KB")
+    for name, lat in sorted(per.items()):
+        lat.sort()
+        print(f"  {name:<40}{len(lat):>6}  p50 {1000 * lat[len(lat) // 2]:7.1f} ms  max {1000 * lat[-1]:7.1f} ms")
+    if errors:
+        print(f"  errors: {dict(errors)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage="%(prog)s {record,replay,info} CASSETTE [options] [-- script.py args...]",
+    )
+    ap.add_argument("mode", choices=["record", "replay", "info"])
+    ap.add_argument("cassette")
+    ap.add_argument("--latency-scale", type=float, default=1.0, help="replay: multiply recorded latencies (0 = none)")
+    ap.add_argument("--strict", action="store_true", help="replay: fail on any request not recorded verbatim")
+    argv = sys.argv[1:]
+    split = argv.index("--") if "--" in argv else len(argv)
+    args = ap.parse_args(argv[:split])
+    script = argv[split + 1:]
+
+    if args.mode == "info":
+        _info(args.cassette)
+        return
+
+    if not script:
+        ap.error("give the script to run after --")
+
+    if args.mode == "record":
+        start_recording(args.cassette)
+        player = None
+    else:
+        player = start_replay(args.cassette, args.latency_scale, args.strict)
+
+    sys.argv = script
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script[0])))
+    try:
+        runpy.run_path(script[0], run_name="__main__")
+    finally:
+        if player is not None:
+            print(f"(RP) {player.hits} exact hits, {player.fallbacks} fallbacks")
+
+
+if __name__ == "__main__":
+    main()
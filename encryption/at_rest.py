@@ -0,0 +1,274 @@
+# at_rest.py
+"""
+Streaming authenticated encryption for the screenshot/headshot archive.
+
+File layout (".enc"):
+
+    header : MAGIC(4) | chunk_size u32 BE | nonce_prefix(7)
+    chunks : AES-256-GCM(chunk) || tag(16), back to back
+
+Chunk i is sealed with nonce = nonce_prefix | i (u32 BE) | last_flag(1) and
+the header as associated data (the STREAM construction), so reordering,
+truncation and header tampering all fail authentication. Every chunk but the
+last holds exactly chunk_size plaintext bytes.
+
+EncryptingWriter is a write-only file object: PIL can save straight into it
+and chunks are sealed on a shared thread pool while the encoder keeps going,
+so the full image is never buffered. DecryptingReader is the matching
+read-only file object, decrypting a few chunks ahead on the same pool.
+
+The AES key is derived with HKDF from the existing Fernet key file
+(encryption/encrypt.py's secret.key), loaded on first use.
+"""
+import io
+import os
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b"GSE1"
+HEADER = struct.Struct(">4sI7s")
+TAG_SIZE = 16
+CHUNK_SIZE = 256 * 1024
+MAX_INFLIGHT_CHUNKS = 8
+READAHEAD_CHUNKS = 4
+
+ENCRYPT_AT_REST = os.getenv("ENCRYPT_AT_REST", "0") == "1"
+KEY_FILE = os.getenv("ENCRYPTION_KEY_FILE", "secret.key")
+ENCRYPT_WORKERS = int(os.getenv("ENCRYPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+ENC_SUFFIX = ".enc"
+
+_key: Optional[bytes] = None
+_key_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+# ---------- Key / pool ------------------------------------------------------
+
+def load_key(create: bool = False) -> bytes:
+    """
+    32-byte AES key derived from KEY_FILE. With create=True a new Fernet-format
+    key file is written (0600) if none exists.
+    """
+    global _key
+    with _key_lock:
+        if _key is not None:
+            return _key
+        if not os.path.exists(KEY_FILE):
+            if not create:
+                raise FileNotFoundError(f"Encryption key '{KEY_FILE}' not found.")
+            from cryptography.fernet import Fernet
+
+            fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(Fernet.generate_key())
+        with open(KEY_FILE, "rb") as f:
+            master = f.read().strip()
+        _key = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None, info=b"screenshot-at-rest v1"
+        ).derive(master)
+        return _key
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _key_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=ENCRYPT_WORKERS, thread_name_prefix="enc")
+        return _pool
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack(">I", index) + (b"\x01" if last else b"\x00")
+
+
+# ---------- Writer ----------------------------------------------------------
+
+class EncryptingWriter(io.RawIOBase):
+    """
+    Write-only file object that seals CHUNK_SIZE pieces on the worker pool and
+    writes them to `raw` in order. At most MAX_INFLIGHT_CHUNKS are buffered.
+    """
+
+    def __init__(self, raw, key: Optional[bytes] = None, chunk_size: int = CHUNK_SIZE):
+        super().__init__()
+        self._raw = raw
+        self._aead = AESGCM(key or load_key(create=True))
+        self._chunk_size = chunk_size
+        prefix = os.urandom(7)
+        self._header = HEADER.pack(MAGIC, chunk_size, prefix)
+        self._prefix = prefix
+        self._buf = bytearray()
+        self._index = 0
+        self._inflight = deque()
+        self._pool = _get_pool()
+        raw.write(self._header)
+
+    def writable(self) -> bool:
+        return True
+
+    def _seal(self, data: bytes, last: bool) -> None:
+        nonce = _nonce(self._prefix, self._index, last)
+        self._index += 1
+        self._inflight.append(self._pool.submit(self._aead.encrypt, nonce, data, self._header))
+        while len(self._inflight) > MAX_INFLIGHT_CHUNKS:
+            self._raw.write(self._inflight.popleft().result())
+
+    def write(self, b) -> int:
+        self._buf += b
+        # keep at least one byte back so close() always has a final chunk to seal
+        while len(self._buf) > self._chunk_size:
+            self._seal(bytes(self._buf[: self._chunk_size]), last=False)
+            del self._buf[: self._chunk_size]
+        return len(b)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._seal(bytes(self._buf), last=True)
+            self._buf = bytearray()
+            while self._inflight:
+                self._raw.write(self._inflight.popleft().result())
+            self._raw.flush()
+        finally:
+            super().close()
+
+    def abort(self) -> None:
+        """
+        Close without sealing a final chunk, so what was written can never
+        authenticate as a complete file. The caller removes the output.
+        """
+        if self.closed:
+            return
+        for fut in self._inflight:
+            fut.cancel()
+        self._inflight.clear()
+        self._buf = bytearray()
+        super().close()
+
+
+# ---------- Reader ----------------------------------------------------------
+
+class DecryptingReader(io.RawIOBase):
+    """
+    Read-only file object over an '.enc' stream. Chunks are authenticated
+    before any of their bytes are returned; READAHEAD_CHUNKS are decrypted
+    ahead of the reader on the worker pool.
+    """
+
+    def __init__(self, raw, key: Optional[bytes] = None):
+        super().__init__()
+        self._raw = raw if isinstance(raw, io.BufferedReader) else io.BufferedReader(raw)
+        header = self._raw.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("truncated encrypted file header")
+        magic, chunk_size, prefix = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("not an at-rest encrypted file")
+        self._header = header
+        self._prefix = prefix
+        self._sealed_size = chunk_size + TAG_SIZE
+        self._aead = AESGCM(key or load_key())
+        self._index = 0
+        self._eof = False
+        self._ahead = deque()
+        self._pending = memoryview(b"")
+        self._pool = _get_pool()
+
+    def readable(self) -> bool:
+        return True
+
+    def _schedule(self) -> None:
+        while not self._eof and len(self._ahead) < READAHEAD_CHUNKS:
+            sealed = self._raw.read(self._sealed_size)
+            last = len(sealed) < self._sealed_size or not self._raw.peek(1)
+            if len(sealed) < TAG_SIZE:
+                raise ValueError("truncated encrypted file")
+            nonce = _nonce(self._prefix, self._index, last)
+            self._index += 1
+            self._ahead.append(self._pool.submit(self._aead.decrypt, nonce, sealed, self._header))
+            self._eof = last
+
+    def readinto(self, b) -> int:
+        if not self._pending:
+            self._schedule()
+            if not self._ahead:
+                return 0
+            self._pending = memoryview(self._ahead.popleft().result())
+            if not self._pending:
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+# ---------- Helpers ---------------------------------------------------------
+
+def is_encrypted_path(path: str) -> bool:
+    return path.endswith(ENC_SUFFIX) or path.endswith(ENC_SUFFIX + ".pending")
+
+
+def open_capture(path: str):
+    """
+    Binary read stream for a capture, decrypting transparently if it is an
+    '.enc' file. Use as a context manager.
+    """
+    if is_encrypted_path(path):
+        return io.BufferedReader(DecryptingReader(open(path, "rb")), buffer_size=CHUNK_SIZE)
+    return open(path, "rb")
+
+
+def save_image_encrypted(image, path: str, fmt: str = "PNG", **params) -> str:
+    """
+    Encode a PIL image straight into an encrypted file; returns `path`.
+    If encoding fails, the partial file is removed and the error re-raised.
+    """
+    return _write_encrypted(path, lambda writer: image.save(writer, fmt, **params))
+
+
+def write_bytes_encrypted(data, path: str) -> str:
+    """
+    Encrypt an already-encoded buffer (e.g. cv2.imencode output) to `path`.
+    """
+    view = memoryview(data)
+
+    def _fill(writer):
+        for i in range(0, len(view), CHUNK_SIZE):
+            writer.write(view[i:i + CHUNK_SIZE])
+
+    return _write_encrypted(path, _fill)
+
+
+def _write_encrypted(path: str, fill) -> str:
+    """
+    Run `fill(writer)` into a new encrypted file at `path`. The final chunk
+    is sealed only if it returns; otherwise the writer is aborted and the
+    file removed, since a prefix of sealed chunks would still decrypt.
+    """
+    with open(path, "wb") as raw:
+        writer = EncryptingWriter(raw)
+        try:
+            fill(writer)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raw.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+    return path
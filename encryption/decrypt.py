@@ -2,6 +2,7 @@ from PIL import Image
 import io
 from cryptography.fernet import Fernet
 import os
+from encryption.at_rest import MAGIC, DecryptingReader
 
 # --- Re-use the secure key logic ---
 KEY_FILE = "secret.key"
@@ -11,27 +12,31 @@ def generate_or_load_key():
     with open(KEY_FILE, "rb") as key_file:
         key = key_file.read()
     return key
-key = generate_or_load_key()
-fernet = Fernet(key)
 # --- End re-used logic ---
 
 
 def decrypt_and_view_screenshot(input_filename):
-    """Reads and decrypts a file, then shows the image."""
+    """Reads and decrypts a file (one-shot Fernet or streaming at-rest format), then shows the image."""
     print("Reading encrypted screenshot...")
     try:
         with open(input_filename, 'rb') as f:
-            encrypted_data = f.read()
+            streaming = f.read(len(MAGIC)) == MAGIC
     except FileNotFoundError:
         print(f"Error: File '{input_filename}' not found.")
         return
 
-    # Decrypt the image data
     print("Decrypting screenshot...")
-    decrypted_data = fernet.decrypt(encrypted_data)
-    
-    # Open the image from the decrypted byte stream
-    decrypted_image = Image.open(io.BytesIO(decrypted_data))
+    if streaming:
+        with io.BufferedReader(DecryptingReader(open(input_filename, 'rb'))) as f:
+            decrypted_image = Image.open(f)
+            decrypted_image.load()
+    else:
+        with open(input_filename, 'rb') as f:
+            encrypted_data = f.read()
+        fernet = Fernet(generate_or_load_key())
+        decrypted_data = fernet.decrypt(encrypted_data)
+        # Open the image from the decrypted byte stream
+        decrypted_image = Image.open(io.BytesIO(decrypted_data))
 
     # Show the image
     print("Displaying decrypted screenshot...")
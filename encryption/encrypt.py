@@ -15,8 +15,6 @@ def generate_or_load_key():
         with open(KEY_FILE, "rb") as key_file:
             key = key_file.read()
     return key
-key = generate_or_load_key()
-fernet = Fernet(key)
 # --- End re-used logic ---
 
 
@@ -33,6 +31,7 @@ def take_and_encrypt_screenshot(output_filename):
 
     # Encrypt the image data
     print("Encrypting screenshot...")
+    fernet = Fernet(generate_or_load_key())
     encrypted_data = fernet.encrypt(image_data)
 
     # Save the encrypted data to a file
@@ -1,102 +1,101 @@
 from subfuncsInput.headshot import capture_headshot   # if/when you use it
-from subfuncsInput.screenshot import capture_screenshot
+from subfuncsInput.screenshot import capture_screenshot_async
+from subfuncsInput.encoder import default_pool
 from subfuncsChecks.connected import is_connected
-from supabase_client import supabase
-from schemas.forChat import analyze_screenshot_with_openai, ValidationError
+from storage_client import storage
+from pipeline import process_capture
 from pathlib import Path
 import subprocess, time, random, os, threading
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  # suppress TensorFlow/MediaPipe logs
 from subfuncsProcessing.face_analysis import points_from_landmarks, eye_AR, mouth_AR, analyze_window, cv2, mp, FPS, EVAL_INTERVAL, FRAME_BATCH, BATCH_SEC
 from datetime import datetime
-from subfuncEp.episoder import advance_episoder
-from subfuncEp.semantic_canonicalizer import (
-    canonicalize_workstream,
-    canonicalize_deliverable,
-)
-
-
-
-
-INTERVAL_1 = 10  # seconds between captures
-
-def polite_sleep_backoff(i: int):
-    time.sleep(min(30, 2**i + random.random()*0.5))
+from subfuncEp.episoder import advance_episoder_async, episode_stability
+from subfuncEp.reorder import ReorderBuffer
+from concurrent.futures import ThreadPoolExecutor
+from subfuncsInput.scheduler import AdaptiveScheduler
+from archive.segments import Archive, archive_capture
+import telemetry
+
+
+
+
+INTERVAL_1 = 10  # seconds between captures when ADAPTIVE_CAPTURE is off
+ADAPTIVE_CAPTURE = True  # vary the interval with idle time / screen change, see subfuncsInput.scheduler
+CAPTURE_MODE = "active_monitor"  # see subfuncsInput.screenshot.CAPTURE_MODES
+ARCHIVE_AFTER_PROCESSING = True  # pack processed captures into raw/archive segments
+ENCODE_REPORT_EVERY = 60  # captures between encoder throughput reports
+VISION_WORKERS = 3  # captures analyzed concurrently; the episoder still sees them in order
+
+
+def _analyze_capture(screenshot_location, slot, reorder, screenshot_archive):
+    """
+    Worker: vision → canonicalize → insert for one capture, then hand the
+    row to the reorder buffer (which feeds the episoder in capture order).
+    """
+    row = None
+    try:
+        row = process_capture(screenshot_location)
+    except Exception as e:
+        print(f"(S.e(3))processing failed: {e}")
+    finally:
+        reorder.complete(slot, row)
+    if row is not None and ARCHIVE_AFTER_PROCESSING:
+        try:
+            archive_capture(screenshot_archive, screenshot_location)
+        except Exception as e:
+            print(f"(S.e(5))archiving failed, keeping loose file: {e}")
 
 
 def screenshot_loop():
+    screenshot_archive = Archive() if ARCHIVE_AFTER_PROCESSING else None
+    n_captures = 0
+    scheduler = AdaptiveScheduler() if ADAPTIVE_CAPTURE else None
+    vision_pool = ThreadPoolExecutor(max_workers=VISION_WORKERS, thread_name_prefix="vision")
+    # episoding: coherence is scored in the background (advance_episoder_async)
+    # and decisions commit in capture order
+    reorder = ReorderBuffer(advance_episoder_async)
     while True:
         try:
             #print("(S.1) proceeding to take screenshot")
-            screenshot_location = capture_screenshot()
+            pending = capture_screenshot_async(mode=CAPTURE_MODE)
+            if pending is None:
+                raise RuntimeError("capture failed")
+            # the PNG encodes on a worker while we check connectivity
+            with telemetry.span("connectivity"):
+                online = is_connected()
+            screenshot_location = pending.result()
         except Exception as e:
             print(f"(S.e(1)) error clicking screenshot: {e}")
+            if scheduler is not None:
+                scheduler.observe_failure()
         else:
+            n_captures += 1
+            if n_captures % ENCODE_REPORT_EVERY == 0:
+                print(f"(ENC) {default_pool().stats()}")
             #print("(S.2) checking for internet connection")
-            if is_connected():
+            if online:
+                # slots are reserved here, in capture order
+                slot = reorder.reserve(screenshot_location)
                 try:
-                    #print("(S.3) collecting vision summary from OpenAI")
-                    summary = analyze_screenshot_with_openai(screenshot_location)
-                except ValidationError as ve:
-                    print(f"(S.e(3))Schema validation failed: {ve}")
+                    vision_pool.submit(_analyze_capture, screenshot_location, slot, reorder, screenshot_archive)
                 except Exception as e:
-                    print(f"(S.e(3))OpenAI vision error: {e}")
-                else:
-                    #print("(S.4) inserting into Supabase")
-                    # 1) canonicalize workstream & deliverable
-                    # 1) canonicalize workstream & deliverable
-                    ws_id, ws_label = canonicalize_workstream(
-                        summary.workstream_label,
-                        summary.semantic_summary,
-                    )
-
-                    dv_id, dv_label = canonicalize_deliverable(
-                        ws_id,
-                        ws_label,                    # canonical WS label
-                        summary.deliverable_label,
-                        summary.semantic_summary,
-                    )
-                    # 2) build row for screenshots insert
-                    allowed_cols = {
-                        "semantic_summary",
-                        "workstream_label",
-                        "deliverable_label",
-                        "app_or_website",
-                        "app_bucket",
-                        "work_type",
-                        "goal_type",
-                        "confidence",
-                    }
-
-                    row = {k: v for k, v in summary.model_dump().items() if k in allowed_cols}
-
-                    row["timestamp"] = Path(screenshot_location).stem
-                    row["workstream_id"] = ws_id
-                    row["deliverable_id"] = dv_id
-                    row["workstream_label"] = ws_label      # canonical text
-                    row["deliverable_label"] = dv_label     # canonical text
-                    try:
-                        db_resp = supabase.table("screenshots").insert(row).execute()
-                        #print(db_resp)
-                        # TODO: remove the above pound to see what gets inserted
-                        # episoding: update in-memory session state and flush closed episodes
-                        if db_resp.data:
-                            try:
-                                advance_episoder(db_resp.data[0])
-                            except Exception as epi_e:
-                                print(f"(EPI.e) Episoding failed: {epi_e}")
-                        else:
-                            print("(EPI.e) screenshots insert returned no data; skipping episoding.")
-                    except Exception as e:
-                        print(f"(S.e(4))Supabase insert failed: {e}")
+                    print(f"(S.e(3))could not queue capture: {e}")
+                    reorder.fail(slot)
             else:
                 print("(S.e(2))no internet connection, keeping image for later")
+                telemetry.inc("screenshot_skips_total", reason="offline")
                 # optional: mark as pending
                 try:
                     os.rename(screenshot_location, screenshot_location + ".pending")
                 except Exception as e:
                     print(f"rename failed: {e}")
+            if scheduler is not None:
+                scheduler.observe(pending.change_score, *episode_stability())
 
-        time.sleep(INTERVAL_1)
+        if scheduler is not None:
+            scheduler.wait()
+        else:
+            time.sleep(INTERVAL_1)
 
 
 # //////////////// FACE LOOP /////////////////////
@@ -154,11 +153,11 @@ def headshot_batch_loop():
             state = analyze_window(metrics_list)
             print("(F.5) received analysis result")
             try:
-                db_resp = supabase.table("facevals").insert(state).execute()
+                db_resp = storage.insert_faceval(state)
                 print(db_resp)
                 print("(F.6) analysis posted")
             except Exception as e:
-                print(f"Supabase headshot insert failed: {e}")
+                print(f"headshot insert failed: {e}")
         else:
             print("No face metrics collected in this window; skipping DB insert.")
 
@@ -169,6 +168,7 @@ def headshot_batch_loop():
 
 # ---- main ----
 if __name__ == "__main__":
+    telemetry.start()   # no-op unless TELEMETRY=1
     t1 = threading.Thread(target=screenshot_loop, daemon=True)
     #t2 = threading.Thread(target=headshot_batch_loop, daemon=True)
 
@@ -3,7 +3,7 @@ from subfuncsInput.screenshot import capture_screenshot
 from subfuncsConditions.connected import is_connected
 from morphik import Morphik
 from schemas.forMorphik import ScreenshotSummary, summarize_screenshot, morphik
-from supabase_client import supabase
+from storage_client import storage
 import os
 
 
@@ -76,7 +76,7 @@ while True:
                     summary = ScreenshotSummary(**response.completion)
                     row = {k: v for k, v in summary.model_dump().items() if k in allowed_cols}
                     row["timestamp"] = screenshot_location[0:-4] # to remove .png
-                    db_resp = (supabase.table("screenshots").insert(row).execute())
+                    db_resp = storage.insert_screenshot(row)
                     print(db_resp)
                 #NOTE:delete picture from user/local location in production
                     # will keep the pictures now for reference
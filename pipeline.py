@@ -0,0 +1,152 @@
+# pipeline.py
+"""
+Per-screenshot processing shared by the live loop (main.py) and the
+backfill CLI (backfill.py): vision summary → canonical workstream and
+deliverable → 'screenshots' insert. Episoding stays with the caller,
+since it has to see rows in timestamp order.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from schemas.forChat import (
+    ScreenshotSummary,
+    ValidationError,
+    analyze_screenshot_with_openai,
+    analyze_screenshots_with_openai,
+)
+from subfuncEp.semantic_canonicalizer import canonicalize
+from subfuncsInput.screenshot import capture_timestamp, read_capture_metadata
+from subfuncsProcessing.app_classifier import get_classifier
+from storage_client import storage
+import telemetry
+
+# ScreenshotSummary fields that are also 'screenshots' columns
+ALLOWED_COLS = {
+    "semantic_summary",
+    "workstream_label",
+    "deliverable_label",
+    "app_or_website",
+    "app_bucket",
+    "work_type",
+    "goal_type",
+    "confidence",
+}
+
+LOCAL_APP_LABELS = True   # app_bucket/work_type from window metadata when the app is known (app_classifier)
+
+
+def build_screenshot_row(summary: ScreenshotSummary, timestamp: str) -> Dict[str, Any]:
+    """
+    Canonicalize the summary's workstream/deliverable and build the insert row.
+    """
+    # 1) canonicalize workstream & deliverable (reusing the previous
+    #    screenshot's ids when the summary barely moved)
+    ws_id, ws_label, dv_id, dv_label = canonicalize(
+        summary.workstream_label,
+        summary.deliverable_label,
+        summary.semantic_summary,
+    )
+
+    # 2) build row for screenshots insert
+    row = {k: v for k, v in summary.model_dump().items() if k in ALLOWED_COLS}
+
+    row["timestamp"] = timestamp
+    row["workstream_id"] = ws_id
+    row["deliverable_id"] = dv_id
+    row["workstream_label"] = ws_label      # canonical text
+    row["deliverable_label"] = dv_label     # canonical text
+    return row
+
+
+def process_capture(
+    path: str,
+    timestamp: Optional[str] = None,
+    image_stream=None,
+    first_tier: int = 0,
+) -> Optional[Dict[str, Any]]:
+    """
+    Run one capture through vision, canonicalization and the DB insert.
+
+    Args:
+        path (str): Capture path (also used for the timestamp and mime type).
+        timestamp (str | None): Override for 'YYYY-MM-DD_HH-MM-SS'.
+        image_stream: Optional readable stream with the plaintext image
+            (e.g. an archive entry) instead of reading `path`.
+        first_tier (int): Vision cascade tier to start from.
+
+    Returns:
+        dict | None: The inserted 'screenshots' row, or None on any failure.
+    """
+    window = read_capture_metadata(path).get("window") if LOCAL_APP_LABELS else None
+    known = get_classifier().classify(window) if window else None
+    try:
+        #print("(S.3) collecting vision summary from OpenAI")
+        summary = analyze_screenshot_with_openai(path, image_stream=image_stream, first_tier=first_tier, known=known)
+    except ValidationError as ve:
+        print(f"(S.e(3))Schema validation failed: {ve}")
+        return None
+    except Exception as e:
+        print(f"(S.e(3))OpenAI vision error: {e}")
+        return None
+    if known is None:
+        _learn_app_labels(summary, window)
+    return _store_summary(summary, timestamp or capture_timestamp(path))
+
+
+def process_capture_batch(captures: List[Tuple[str, Optional[str], Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Like process_capture for a run of consecutive captures, sharing one
+    vision request (schemas.forChat.analyze_screenshots_with_openai).
+    Items the batch answer left out, got wrong or was unsure about are
+    retried one at a time, from the second cascade tier up (the batch is
+    the cheap first pass), or at the only tier when there is one.
+
+    Args:
+        captures: (path, timestamp or None, open_stream or None) per capture,
+            at most VISION_BATCH_SIZE of them. `open_stream` is a zero-arg
+            callable returning a fresh plaintext image stream (e.g. for an
+            archive entry), since a retried item has to be read twice.
+
+    Returns:
+        list: The inserted row or None for each capture, in input order.
+    """
+    paths = [c[0] for c in captures]
+    try:
+        streams = [c[2]() if c[2] is not None else None for c in captures]
+        summaries = analyze_screenshots_with_openai(paths, image_streams=streams)
+    except Exception as e:
+        print(f"(S.e(3))OpenAI batched vision error: {e}")
+        return [None] * len(captures)
+
+    rows: List[Optional[Dict[str, Any]]] = []
+    for (path, timestamp, open_stream), summary in zip(captures, summaries):
+        if summary is None:
+            stream = open_stream() if open_stream is not None else None
+            rows.append(process_capture(path, timestamp=timestamp, image_stream=stream, first_tier=1))
+            continue
+        _learn_app_labels(summary, None)
+        rows.append(_store_summary(summary, timestamp or capture_timestamp(path)))
+    return rows
+
+
+def _learn_app_labels(summary: ScreenshotSummary, window: Optional[Dict[str, Any]]) -> None:
+    # full-schema answers only: locally labelled captures would just echo the table
+    if LOCAL_APP_LABELS:
+        get_classifier().learn(summary.app_or_website, summary.app_bucket, summary.work_type, window)
+
+
+def _store_summary(summary: ScreenshotSummary, timestamp: str) -> Optional[Dict[str, Any]]:
+    #print("(S.4) inserting into storage")
+    with telemetry.span("canonicalize"):
+        row = build_screenshot_row(summary, timestamp)
+    try:
+        with telemetry.span("db_insert"):
+            inserted = storage.insert_screenshot(row)
+    except Exception as e:
+        print(f"(S.e(4))screenshot insert failed: {e}")
+        return None
+
+    if not inserted:
+        print("(EPI.e) screenshots insert returned no data; skipping episoding.")
+        telemetry.inc("screenshot_skips_total", reason="empty_insert")
+        return None
+    return inserted
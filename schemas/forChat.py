@@ -1,8 +1,11 @@
-import base64, os, time, random
+import base64, json, os, time, random, threading
 from openai import OpenAI
 from pydantic import ValidationError
 from pydantic import BaseModel, Field, ValidationError
-from typing import Optional, List, Literal
+from typing import Optional, List, Literal, Dict, Tuple, Any
+from subfuncsChecks.rate_limiter import call_openai, estimate_tokens
+from encryption.at_rest import open_capture
+import telemetry
 
 
 from pydantic import BaseModel, Field, ValidationError
@@ -84,123 +87,444 @@ class ScreenshotSummary(BaseModel):
         )
     )
 
+    # Self-assessed reliability of the fields above (drives the model cascade)
+    confidence: float = Field(
+        ...,
+        ge=0.0,
+        le=1.0,
+        description=(
+            "How sure you are of the labels above, from 0 to 1. Low when the screenshot is blurry, "
+            "mostly empty, ambiguous, or too small to read."
+        )
+    )
+
+
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)  # retries live in call_openai
+
+VISION_BATCH_SIZE = 8                     # screenshots per batched request (run at the first cascade tier)
+
+# Single-screenshot cascade, cheapest first, as "model:detail" tiers. A
+# tier's answer is kept once it validates with confidence >= VISION_MIN_CONFIDENCE;
+# otherwise the next tier is asked. The last tier's answer is kept regardless.
+# The default is one tier, the pre-cascade request (detail "auto" is what the
+# API uses when none is given); on the fakes "gpt-4o-mini:low,gpt-4o-mini:high"
+# cost more and ran slower (bench_pipeline --cascade), so it stays opt-in
+# until real low-detail confidence rates say otherwise.
+VISION_CASCADE_SPEC = os.getenv("VISION_CASCADE", "gpt-4o-mini:auto")
+VISION_MIN_CONFIDENCE = float(os.getenv("VISION_MIN_CONFIDENCE", "0.6"))
+
+# USD per 1M (input, output) tokens, for the cost mix in cascade stats
+MODEL_PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00)}
+
+# instruction text + schema is ~2.6k chars
+VISION_EST_TOKENS = estimate_tokens(text="x" * 2600, images=1)
+
+
+def _parse_cascade(spec: str) -> List[Tuple[str, str]]:
+    tiers = []
+    for part in spec.split(","):
+        model, _, detail = part.strip().partition(":")
+        if detail not in ("low", "high", "auto"):
+            raise ValueError(f"VISION_CASCADE tier {part!r}: expected 'model:low|high|auto'")
+        tiers.append((model, detail))
+    if not tiers:
+        raise ValueError("VISION_CASCADE is empty")
+    return tiers
+
+
+VISION_CASCADE = _parse_cascade(VISION_CASCADE_SPEC)
+
+
+def _strict_schema(model) -> dict:
+    """JSON schema the API will enforce: every property required, no extras."""
+    schema = model.model_json_schema()
+    schema["additionalProperties"] = False
+    schema["required"] = list(schema.get("properties", {}).keys())
+    return schema
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# built once; identical bytes on every call also keep the prompt prefix cacheable
+SCREENSHOT_SCHEMA = _strict_schema(ScreenshotSummary)
+# fields subfuncsProcessing.app_classifier can supply from window metadata;
+# when it does, the model is asked for the rest only
+LOCAL_FIELDS = ("app_or_website", "app_bucket", "work_type")
+SEMANTIC_SCHEMA = {
+    **SCREENSHOT_SCHEMA,
+    "properties": {k: v for k, v in SCREENSHOT_SCHEMA["properties"].items() if k not in LOCAL_FIELDS},
+    "required": [k for k in SCREENSHOT_SCHEMA["required"] if k not in LOCAL_FIELDS],
+}
+SCREENSHOT_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                **SCREENSHOT_SCHEMA,
+                "properties": {"index": {"type": "integer"}, **SCREENSHOT_SCHEMA["properties"]},
+                "required": ["index"] + SCREENSHOT_SCHEMA["required"],
+            },
+        },
+    },
+    "required": ["items"],
+    "additionalProperties": False,
+}
+
+# Static prompt text. Kept ahead of anything per-request (images, batch
+# notes) so repeated calls share a long identical prefix for prompt caching.
+VISION_SYSTEM_PROMPT = (
+    "You analyze desktop screenshots and return ONLY JSON that matches the schema. "
+    "Never add extra keys or prose."
+)
+
+VISION_INSTRUCTIONS = (
+    "Extract fields according to the schema. Rules:\n"
+    "\n"
+    "1) semantic_summary: in 1–2 sentences, describe what the user is trying to accomplish in this screenshot, "
+    "what concrete content they are working with (course, project, client, repo, document), and how this fits into "
+    "a broader task (e.g. preparing an assignment, writing a speech, editing a pitch deck, implementing a feature).\n"
+    "   - Focus on TASK-LEVEL meaning, not UI details.\n"
+    "\n"
+    "2) workstream_label: assign the life-scale workstream or domain this activity belongs to. This should be stable "
+    "over weeks or months, not change every session.\n"
+    "   - Examples: 'BIOG 1500 course', 'Global Development course', 'AI Mirror product', "
+    "     'Internship applications', 'Personal reading: Buddhism'.\n"
+    "   - If multiple screenshots on different days would belong to the same semester-long course or long-term project, "
+    "     they should share the same workstream_label.\n"
+    "\n"
+    "3) deliverable_label: assign the specific deliverable or objective the user is currently working toward within the workstream.\n"
+    "   - Examples: 'Study for BIOG Exam 2', 'Write Global Development midterm speech', "
+    "     'Implement episodization coherence function', 'Prepare pitch deck v3', 'Finish lab report section 3'.\n"
+    "   - This is a bounded objective that could be completed over one or several sessions.\n"
+    "\n"
+    "4) app_or_website: name the active application or website as shown in the window/tab/frame title "
+    "(e.g. 'Google Chrome – Canvas', 'VS Code', 'Notion', 'YouTube').\n"
+    "\n"
+    "5) app_bucket: choose ONE from exactly:\n"
+    "   ['browser','ide','pdf_viewer','notes','email','terminal','file_explorer','messaging','media_player','other'].\n"
+    "   - 'browser' for Chrome/Firefox/Safari showing web content.\n"
+    "   - 'ide' for code editors like VS Code, PyCharm, etc.\n"
+    "   - 'pdf_viewer' for apps showing PDF documents.\n"
+    "   - 'notes' for note-taking tools (Notion, Obsidian, Apple Notes, etc.).\n"
+    "   - 'email' for email clients (Gmail web, Outlook, etc.).\n"
+    "   - 'terminal' for command-line shells.\n"
+    "   - 'file_explorer' for file managers.\n"
+    "   - 'messaging' for chat apps.\n"
+    "   - 'media_player' for dedicated media players.\n"
+    "   - 'other' if none of the above fit.\n"
+    "\n"
+    "6) work_type: choose ONE from exactly:\n"
+    "   [\"reading\",\"note_taking\",\"coding\",\"messaging\",\"browsing\",\"entertainment\",\"design\",\"spreadsheets\",\"presentation\",\"unknown\"].\n"
+    "   - 'reading': mainly consuming text (articles, PDFs, textbooks, docs) without editing.\n"
+    "   - 'note_taking': writing structured notes, outlines, or annotations.\n"
+    "   - 'coding': working in code editors, terminals, or IDE tools to write/modify code.\n"
+    "   - 'messaging': chat/email/slack/DM focused.\n"
+    "   - 'browsing': general web surfing, search results, multiple unrelated tabs.\n"
+    "   - 'entertainment': videos, games, social feeds primarily for leisure.\n"
+    "   - 'design': Figma, slide design, visual layout work.\n"
+    "   - 'spreadsheets': Excel/Sheets or similar grid-based work.\n"
+    "   - 'presentation': editing slide decks (PowerPoint, Keynote, Google Slides).\n"
+    "   - 'unknown': if unclear.\n"
+    "\n"
+    "7) goal_type: classify whether the activity is telic, atelic, or unknown.\n"
+    "   - 'telic': clearly directed at a concrete outcome/deliverable (finish an assignment, complete a pitch deck, "
+    "     implement a feature, fix a bug, submit a report, study for a specific exam).\n"
+    "   - 'atelic': open-ended exploration or consumption (browsing, reading for curiosity, watching random videos) "
+    "     without a clear endpoint.\n"
+    "   - 'unknown': if you cannot reliably tell.\n"
+    "\n"
+    "8) confidence: a number from 0 to 1 for how reliable your labels are. Use below 0.6 when text you "
+    "needed was unreadable or the task is genuinely ambiguous; do not inflate it.\n"
+    "\n"
+)
 
 #///////////// HELPERS //////////
 
-def _image_b64_data_url(path: str) -> str:
-    with open(path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
-    mime = "image/png" if path.lower().endswith(".png") else "image/jpeg"
-    return f"data:{mime};base64,{b64}"
+def _image_b64_data_url(path: str, stream=None) -> str:
+    # stream in multiples of 3 bytes so the base64 pieces concatenate cleanly;
+    # '.enc' captures are decrypted on the fly
+    parts = []
+    with (stream or open_capture(path)) as f:
+        while True:
+            block = f.read(3 * 64 * 1024)
+            if not block:
+                break
+            parts.append(base64.b64encode(block).decode("ascii"))
+    name = path.lower().replace(".pending", "").replace(".enc", "")
+    if name.endswith(".png"):
+        mime = "image/png"
+    elif name.endswith(".webp"):
+        mime = "image/webp"
+    else:
+        mime = "image/jpeg"
+    return f"data:{mime};base64,{''.join(parts)}"
+
+
+def _cost(model: str, usage: Any) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (
+        (getattr(usage, "prompt_tokens", 0) or 0) * price_in
+        + (getattr(usage, "completion_tokens", 0) or 0) * price_out
+    ) / 1e6
 
 #////////////////////////////////
 
 
-def analyze_screenshot_with_openai(path: str) -> ScreenshotSummary:
+class CascadeStats:
     """
-    Calls GPT-4o-mini with structured output enforced by JSON schema.
-    Returns a validated ScreenshotSummary (raises ValidationError on mismatch).
+    Routing counts for the vision cascade: per tier, how many calls it got,
+    how they ended ("accepted", "low_confidence", "invalid", "error"), and
+    their latency, tokens and cost; per request, the tier that answered.
     """
-    data_url = _image_b64_data_url(path)
-
-    # Build a JSON schema the API will enforce
-    json_schema = ScreenshotSummary.model_json_schema()
-    json_schema["additionalProperties"] = False
-    props = json_schema.get("properties", {})
-    json_schema["required"] = list(props.keys())
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",                  # or "gpt-4o" for higher quality
+
+    OUTCOMES = ("accepted", "low_confidence", "invalid", "error")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.tiers: Dict[str, Dict[str, float]] = {}
+            self.answered_by: Dict[str, int] = {}
+
+    def record_call(self, tier: str, outcome: str, seconds: float, model: str, usage: Any = None) -> None:
+        cost = _cost(model, usage) if usage is not None else 0.0
+        with self._lock:
+            t = self.tiers.setdefault(tier, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                             "completion_tokens": 0, "cost_usd": 0.0,
+                                             **{o: 0 for o in self.OUTCOMES}})
+            t["calls"] += 1
+            t[outcome] += 1
+            t["seconds"] += seconds
+            t["cost_usd"] += cost
+            if usage is not None:
+                t["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                t["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+        telemetry.inc("vision_cascade_calls_total", tier=tier, outcome=outcome)
+        if cost:
+            telemetry.inc("vision_cascade_cost_usd_total", cost, tier=tier)
+
+    def record_request(self, tier: Optional[str]) -> None:
+        with self._lock:
+            self.requests += 1
+            key = tier or "failed"
+            self.answered_by[key] = self.answered_by.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "answered_by": dict(self.answered_by),
+                "tiers": {k: dict(v) for k, v in self.tiers.items()},
+            }
+
+
+cascade_stats = CascadeStats()
+
+
+def format_cascade_stats(snap: Dict[str, Any]) -> str:
+    """Human-readable routing / latency / cost mix from CascadeStats.snapshot()."""
+    n = snap["requests"]
+    if not n:
+        return "vision cascade: no requests"
+    lines = [f"vision cascade: {n} requests, min confidence {VISION_MIN_CONFIDENCE:g}",
+             f"  {'tier':<20}{'answered':>9}{'calls':>7}{'low conf':>9}{'invalid':>8}{'error':>6}"
+             f"{'mean ms':>9}{'USD/1k':>8}"]
+    total_cost = 0.0
+    for model, detail in VISION_CASCADE:
+        tier = f"{model}:{detail}"
+        t = snap["tiers"].get(tier)
+        if not t:
+            continue
+        total_cost += t["cost_usd"]
+        lines.append(
+            f"  {tier:<20}{snap['answered_by'].get(tier, 0) / n:>9.0%}{t['calls']:>7}{t['low_confidence']:>9}"
+            f"{t['invalid']:>8}{t['error']:>6}{1000 * t['seconds'] / t['calls']:>9.0f}"
+            f"{1000 * t['cost_usd'] / t['calls']:>8.3f}"
+        )
+    calls = sum(t["calls"] for t in snap["tiers"].values())
+    seconds = sum(t["seconds"] for t in snap["tiers"].values())
+    failed = snap["answered_by"].get("failed", 0)
+    lines.append(f"  {calls / n:.2f} calls/request, {1000 * seconds / n:.0f} ms/request, "
+                 f"${1000 * total_cost / n:.3f} per 1k screenshots"
+                 + (f", {failed} failed" if failed else ""))
+    return "\n".join(lines)
+
+
+def _vision_call(model: str, detail: str, data_url: str, known: Optional[Dict[str, str]] = None) -> Any:
+    content = [{"type": "text", "text": VISION_INSTRUCTIONS}]
+    if known:
+        # after the static instructions, so they stay a cacheable prefix
+        content.append({"type": "text", "text": (
+            f"The active app is already known: {json.dumps(known, ensure_ascii=False)}. "
+            "Skip rules 4-6; fill only the fields in the schema."
+        )})
+    content.append({"type": "image_url", "image_url": {"url": data_url, "detail": detail}})
+    return call_openai(
+        client.chat.completions.create,
+        est_tokens=VISION_EST_TOKENS,
+        stage="vision",
+        model=model,
         temperature=0,                        # more deterministic
         seed=42,                              # repeatability (best-effort)
         response_format={
             "type": "json_schema",
             "json_schema": {
-                "name": "ScreenshotSummary",
-                "schema": json_schema,
+                "name": "ScreenshotSemantics" if known else "ScreenshotSummary",
+                "schema": SEMANTIC_SCHEMA if known else SCREENSHOT_SCHEMA,
                 "strict": True
             }
         },
         messages=[
-            {"role": "system", "content": (
-                "You analyze desktop screenshots and return ONLY JSON that matches the schema. "
-                "Never add extra keys or prose."
-            )},
-            {
-    "role": "user",
-    "content": [
-        {
-            "type": "text",
-            "text":
-                "Extract fields according to the schema. Rules:\n"
-                "\n"
-                "1) semantic_summary: in 1–2 sentences, describe what the user is trying to accomplish in this screenshot, "
-                "what concrete content they are working with (course, project, client, repo, document), and how this fits into "
-                "a broader task (e.g. preparing an assignment, writing a speech, editing a pitch deck, implementing a feature).\n"
-                "   - Focus on TASK-LEVEL meaning, not UI details.\n"
-                "\n"
-                "2) workstream_label: assign the life-scale workstream or domain this activity belongs to. This should be stable "
-                "over weeks or months, not change every session.\n"
-                "   - Examples: 'BIOG 1500 course', 'Global Development course', 'AI Mirror product', "
-                "     'Internship applications', 'Personal reading: Buddhism'.\n"
-                "   - If multiple screenshots on different days would belong to the same semester-long course or long-term project, "
-                "     they should share the same workstream_label.\n"
-                "\n"
-                "3) deliverable_label: assign the specific deliverable or objective the user is currently working toward within the workstream.\n"
-                "   - Examples: 'Study for BIOG Exam 2', 'Write Global Development midterm speech', "
-                "     'Implement episodization coherence function', 'Prepare pitch deck v3', 'Finish lab report section 3'.\n"
-                "   - This is a bounded objective that could be completed over one or several sessions.\n"
-                "\n"
-                "4) app_or_website: name the active application or website as shown in the window/tab/frame title "
-                "(e.g. 'Google Chrome – Canvas', 'VS Code', 'Notion', 'YouTube').\n"
-                "\n"
-                "5) app_bucket: choose ONE from exactly:\n"
-                "   ['browser','ide','pdf_viewer','notes','email','terminal','file_explorer','messaging','media_player','other'].\n"
-                "   - 'browser' for Chrome/Firefox/Safari showing web content.\n"
-                "   - 'ide' for code editors like VS Code, PyCharm, etc.\n"
-                "   - 'pdf_viewer' for apps showing PDF documents.\n"
-                "   - 'notes' for note-taking tools (Notion, Obsidian, Apple Notes, etc.).\n"
-                "   - 'email' for email clients (Gmail web, Outlook, etc.).\n"
-                "   - 'terminal' for command-line shells.\n"
-                "   - 'file_explorer' for file managers.\n"
-                "   - 'messaging' for chat apps.\n"
-                "   - 'media_player' for dedicated media players.\n"
-                "   - 'other' if none of the above fit.\n"
-                "\n"
-                "6) work_type: choose ONE from exactly:\n"
-                "   [\"reading\",\"note_taking\",\"coding\",\"messaging\",\"browsing\",\"entertainment\",\"design\",\"spreadsheets\",\"presentation\",\"unknown\"].\n"
-                "   - 'reading': mainly consuming text (articles, PDFs, textbooks, docs) without editing.\n"
-                "   - 'note_taking': writing structured notes, outlines, or annotations.\n"
-                "   - 'coding': working in code editors, terminals, or IDE tools to write/modify code.\n"
-                "   - 'messaging': chat/email/slack/DM focused.\n"
-                "   - 'browsing': general web surfing, search results, multiple unrelated tabs.\n"
-                "   - 'entertainment': videos, games, social feeds primarily for leisure.\n"
-                "   - 'design': Figma, slide design, visual layout work.\n"
-                "   - 'spreadsheets': Excel/Sheets or similar grid-based work.\n"
-                "   - 'presentation': editing slide decks (PowerPoint, Keynote, Google Slides).\n"
-                "   - 'unknown': if unclear.\n"
-                "\n"
-                "7) goal_type: classify whether the activity is telic, atelic, or unknown.\n"
-                "   - 'telic': clearly directed at a concrete outcome/deliverable (finish an assignment, complete a pitch deck, "
-                "     implement a feature, fix a bug, submit a report, study for a specific exam).\n"
-                "   - 'atelic': open-ended exploration or consumption (browsing, reading for curiosity, watching random videos) "
-                "     without a clear endpoint.\n"
-                "   - 'unknown': if you cannot reliably tell.\n"
-                "\n"
-        }
-        ,
-        {
-            "type": "image_url",
-            "image_url": {"url": data_url}
-        }
-    ]
-}
+            {"role": "system", "content": VISION_SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ],
+    )
+
+
+def analyze_screenshot_with_openai(
+    path: str,
+    image_stream=None,
+    first_tier: int = 0,
+    known: Optional[Dict[str, str]] = None,
+) -> ScreenshotSummary:
+    """
+    Runs the screenshot up VISION_CASCADE with structured output enforced by
+    JSON schema: the cheapest tier first, the next one only when an answer
+    fails validation or comes back below VISION_MIN_CONFIDENCE.
+
+    Returns a validated ScreenshotSummary: the first confident answer, else
+    the most confident one seen. API errors end the cascade (no escalation);
+    the last error (e.g. ValidationError) is raised if no tier produced a
+    valid answer.
+    `image_stream` (optional) supplies the plaintext image instead of reading `path`.
+    `first_tier` skips cheaper tiers (e.g. after a low-confidence batched answer).
+    `known` holds LOCAL_FIELDS labelled locally (app_classifier); the model
+    then answers SEMANTIC_SCHEMA and these values complete the summary.
+    """
+    data_url = _image_b64_data_url(path, image_stream)
+    tiers = VISION_CASCADE[min(first_tier, len(VISION_CASCADE) - 1):]
+
+    best: Optional[Tuple[ScreenshotSummary, str]] = None
+    error: Optional[Exception] = None
+    for model, detail in tiers:
+        tier = f"{model}:{detail}"
+        t0 = time.perf_counter()
+        try:
+            resp = _vision_call(model, detail, data_url, known)
+        except Exception as e:
+            # API trouble isn't a reason to pay for a bigger model; stop here
+            cascade_stats.record_call(tier, "error", time.perf_counter() - t0, model)
+            error = e
+            break
+        seconds = time.perf_counter() - t0
+        try:
+            # The API returns a JSON string (already schema-constrained). Validate with Pydantic:
+            raw = resp.choices[0].message.content
+            if known:
+                summary = ScreenshotSummary.model_validate({**json.loads(raw), **known})
+            else:
+                summary = ScreenshotSummary.model_validate_json(raw)
+        except (ValueError, TypeError) as ve:      # ValidationError, or JSON that isn't an object
+            cascade_stats.record_call(tier, "invalid", seconds, model, resp.usage)
+            error = ve
+            continue
+        if summary.confidence >= VISION_MIN_CONFIDENCE:
+            cascade_stats.record_call(tier, "accepted", seconds, model, resp.usage)
+            cascade_stats.record_request(tier)
+            return summary
+        cascade_stats.record_call(tier, "low_confidence", seconds, model, resp.usage)
+        if best is None or summary.confidence > best[0].confidence:
+            best = (summary, tier)
 
+    if best is not None:
+        cascade_stats.record_request(best[1])
+        return best[0]
+    cascade_stats.record_request(None)
+    raise error
 
+
+def analyze_screenshots_with_openai(
+    paths: List[str],
+    image_streams: Optional[List] = None,
+) -> List[Optional[ScreenshotSummary]]:
+    """
+    Batched variant for backlog drains and backfills: up to VISION_BATCH_SIZE
+    consecutive screenshots in one request, answered as an array.
+
+    The system prompt and instructions are the same leading text as the
+    single-image call, so the provider's prompt cache covers them across
+    both; only the images and a short batch note follow.
+
+    Returns one entry per input, in input order: a validated
+    ScreenshotSummary, or None where the item was missing, failed
+    validation or (with more than one cascade tier) came back below
+    VISION_MIN_CONFIDENCE; the caller can retry those one at a time, from
+    cascade tier 1.
+    """
+    if not paths:
+        return []
+    if len(paths) > VISION_BATCH_SIZE:
+        raise ValueError(f"at most {VISION_BATCH_SIZE} screenshots per request, got {len(paths)}")
+    streams = image_streams or [None] * len(paths)
+    model, detail = VISION_CASCADE[0]
+
+    content = [
+        {"type": "text", "text": VISION_INSTRUCTIONS},
+        {"type": "text", "text": (
+            f"There are {len(paths)} screenshots below, labelled 'Screenshot 0' to "
+            f"'Screenshot {len(paths) - 1}' in capture order. Return one item per screenshot "
+            "in 'items', with 'index' set to its label number. Judge each screenshot on its own."
+        )},
+    ]
+    for i, (path, stream) in enumerate(zip(paths, streams)):
+        content.append({"type": "text", "text": f"Screenshot {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": _image_b64_data_url(path, stream), "detail": detail}})
+
+    resp = call_openai(
+        client.chat.completions.create,
+        est_tokens=estimate_tokens(text="x" * 2600, images=len(paths), max_output=300 * len(paths)),
+        stage="vision",
+        model=model,
+        temperature=0,
+        seed=42,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": "ScreenshotSummaryBatch",
+                "schema": SCREENSHOT_BATCH_SCHEMA,
+                "strict": True
+            }
+        },
+        messages=[
+            {"role": "system", "content": VISION_SYSTEM_PROMPT},
+            {"role": "user", "content": content},
         ],
     )
 
-    raw = resp.choices[0].message.content
-    # The API returns a JSON string (already schema-constrained). Validate with Pydantic:
-    return ScreenshotSummary.model_validate_json(raw)
+    try:
+        items = json.loads(resp.choices[0].message.content).get("items") or []
+    except (ValueError, AttributeError) as e:
+        print(f"(S.e(3))Batch response was not a JSON object: {e}")
+        return [None] * len(paths)
+
+    out: List[Optional[ScreenshotSummary]] = [None] * len(paths)
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        idx = item.pop("index", None)
+        if not isinstance(idx, int) or not 0 <= idx < len(paths) or out[idx] is not None:
+            print(f"(S.e(3))Batch item with bad or duplicate index {idx!r}; dropped")
+            continue
+        try:
+            summary = ScreenshotSummary.model_validate(item)
+        except ValidationError as ve:
+            print(f"(S.e(3))Batch item {idx} failed validation: {ve}")
+            continue
+        # worth a retry only when there is a tier above the batch's
+        if len(VISION_CASCADE) > 1 and summary.confidence < VISION_MIN_CONFIDENCE:
+            telemetry.inc("vision_batch_low_confidence_total")
+            continue
+        out[idx] = summary
+    return out
@@ -0,0 +1,16 @@
+-- add_embedding_bin.sql
+--
+-- Packed embedding column for workstreams/deliverables (see
+-- subfuncEp/embedding_codec.py). Run once in the Supabase SQL editor, then
+-- convert existing rows with:
+--
+--     python -m subfuncEp.migrate_embeddings [--codec f32] [--drop-json]
+--
+-- The legacy float8[] `embedding` column stays until every agent writes
+-- the packed format; readers use embedding_bin when it is set.
+
+alter table workstreams  add column if not exists embedding_bin text;
+alter table deliverables add column if not exists embedding_bin text;
+
+alter table workstreams  alter column embedding drop not null;
+alter table deliverables alter column embedding drop not null;
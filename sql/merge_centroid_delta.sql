@@ -0,0 +1,54 @@
+-- merge_centroid_delta.sql
+--
+-- Atomic centroid merge used by subfuncEp/semantic_canonicalizer.py:
+--
+--     embedding := (embedding * n_points + p_sum) / (n_points + p_count)
+--     n_points  := n_points + p_count
+--
+-- p_sum is the element-wise sum of the p_count embeddings matched to the row
+-- since the client's last flush. The new centroid is computed from the row
+-- as it is when the UPDATE runs, under its row lock, so agents flushing
+-- concurrently serialize instead of overwriting each other.
+--
+-- A row whose stored embedding is missing or has a different dimension is
+-- reset to the delta's mean.
+--
+-- Assumes `embedding` is float8[] and `n_points` an integer, on both
+-- 'workstreams' and 'deliverables'. Run once in the Supabase SQL editor.
+
+create or replace function merge_centroid_delta(
+    p_table text,
+    p_id bigint,
+    p_sum float8[],
+    p_count integer
+) returns void
+language plpgsql
+as $$
+begin
+    if p_table not in ('workstreams', 'deliverables') then
+        raise exception 'merge_centroid_delta: unsupported table %', p_table;
+    end if;
+    if p_count <= 0 then
+        return;
+    end if;
+
+    execute format(
+        'update %I as t
+            set embedding = (
+                    select array_agg(
+                               (coalesce(e.v, 0) * case when cardinality(t.embedding) = cardinality($1)
+                                                        then coalesce(t.n_points, 0) else 0 end
+                                + s.v)
+                               / (case when cardinality(t.embedding) = cardinality($1)
+                                       then coalesce(t.n_points, 0) else 0 end + $2)
+                               order by s.i)
+                      from unnest($1) with ordinality as s(v, i)
+                      left join unnest(t.embedding) with ordinality as e(v, i) on e.i = s.i
+                ),
+                n_points = case when cardinality(t.embedding) = cardinality($1)
+                                then coalesce(t.n_points, 0) + $2 else $2 end
+          where t.id = $3',
+        p_table
+    ) using p_sum, p_count, p_id;
+end;
+$$;
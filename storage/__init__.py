@@ -0,0 +1,9 @@
+# storage package
+"""
+Persistence behind one interface (storage.base.Storage) so the pipeline
+doesn't depend on a live Supabase project. The process-wide instance lives
+in storage_client.py.
+"""
+from storage.base import CENTROID_TABLES, PAGE_SIZE, Storage, read_all
+
+__all__ = ["CENTROID_TABLES", "PAGE_SIZE", "Storage", "read_all"]
@@ -0,0 +1,126 @@
+# base.py
+"""
+The storage interface every backend implements.
+
+Rows are plain dicts keyed by column name, as the Supabase client returns
+them; insert methods return the stored row (with its generated 'id') or
+None if the backend reported nothing back.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+CENTROID_TABLES = ("workstreams", "deliverables")
+PAGE_SIZE = 1000          # rows per request (PostgREST's default max per response)
+
+Row = Dict[str, Any]
+
+
+def check_centroid_table(table: str) -> None:
+    if table not in CENTROID_TABLES:
+        raise ValueError(f"not a centroid table: {table!r}; expected one of {CENTROID_TABLES}")
+
+
+def read_all(fetch: Callable[[int, int], List[Row]], page_size: int = PAGE_SIZE) -> List[Row]:
+    """
+    Every row of a *_since query, `page_size` at a time; `fetch(limit,
+    offset)` returns one page, e.g.
+
+        read_all(lambda limit, offset: storage.episodes_since(start, limit=limit, offset=offset))
+
+    A Supabase response stops at PAGE_SIZE rows, so an unpaged call quietly
+    returns only the oldest ones. Pages are offsets into one (time, id)
+    ordering, so rows sharing a timestamp across a page boundary are all
+    read; a row shifted into the next page by a concurrent insert shows up
+    twice and is dropped by id.
+    """
+    rows: List[Row] = []
+    seen = set()
+    offset = 0
+    while True:
+        page = fetch(page_size, offset)
+        offset += len(page)
+        for r in page:
+            if r.get("id") is None or r["id"] not in seen:
+                seen.add(r.get("id"))
+                rows.append(r)
+        if len(page) < page_size:
+            return rows
+
+
+class Storage(ABC):
+    # ---------- screenshots ----------
+
+    @abstractmethod
+    def insert_screenshot(self, row: Row) -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    def screenshots_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        """
+        Screenshots with timestamp > `start` ('YYYY-MM-DD...' prefix ok),
+        oldest first (ties by id), so `limit`/`offset` pages are stable.
+        """
+
+    # ---------- workstreams / deliverables ----------
+
+    @abstractmethod
+    def centroid_rows(self, table: str, columns: str = "*", since_id: int = 0, limit: Optional[int] = None) -> List[Row]:
+        """Rows with id > since_id, in id order."""
+
+    @abstractmethod
+    def get_centroid(self, table: str, row_id: int, columns: str = "*") -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    def insert_centroid(self, table: str, row: Row) -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    def update_centroid_if(self, table: str, row_id: int, expected_n_points: Optional[int], values: Row) -> bool:
+        """
+        Apply `values` only if the row's n_points still equals
+        `expected_n_points` (compare-and-set). True if it was applied.
+        """
+
+    def merge_centroid_delta(self, table: str, row_id: int, total: Sequence[float], count: int) -> None:
+        """
+        Atomically fold `count` embeddings summing to `total` into the row's
+        JSON centroid. Backends without a server-side merge raise
+        NotImplementedError, and callers fall back to update_centroid_if.
+        Packed embeddings (embedding_bin) always take that path.
+        """
+        raise NotImplementedError(f"{type(self).__name__} has no server-side centroid merge")
+
+    # ---------- episodes / labels / face ----------
+
+    @abstractmethod
+    def insert_episode(self, row: Row) -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    def episodes_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        """Episodes with start_time > `start` (ISO, 'YYYY-MM-DD' prefix ok), oldest first (ties by id)."""
+
+    @abstractmethod
+    def insert_coherence_label(self, row: Row) -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    def coherence_labels_since(self, start: str, descriptors: bool = False,
+                               limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        """
+        Coherence labels with screenshot_timestamp > `start`, oldest first
+        (ties by id); with `descriptors`, also the logged episode /
+        screenshot descriptors.
+        """
+
+    @abstractmethod
+    def insert_faceval(self, row: Row) -> Optional[Row]:
+        ...
+
+    @abstractmethod
+    def facevals_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        """Face samples with created_at > `start` (ISO, 'YYYY-MM-DD' prefix ok), oldest first (ties by id)."""
+
+    def close(self) -> None:
+        pass
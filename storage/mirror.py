@@ -0,0 +1,283 @@
+# mirror.py
+"""
+Local columnar mirror of 'screenshots', 'episodes' and 'facevals' for
+analytics: Parquet files partitioned by day, kept current by delta sync,
+queried with pyarrow's vectorized filters and group-bys instead of a full
+remote scan per analysis.
+
+    python -m storage.mirror sync [--since 2025-01-01]      # delta sync (or re-sync from a day)
+    python -m storage.mirror rollup [--days 28]             # time per workstream per day
+
+    m = Mirror(); m.sync()
+    t = m.read("screenshots", start="2025-03-01", columns=["ts", "workstream_label"])
+
+Layout: MIRROR_DIR/<table>/day=YYYY-MM-DD/part.parquet (hive style), the
+day being the first 10 characters of the table's time column as stored
+(so 'facevals' days are UTC, like their created_at). _state.json holds
+each table's watermark, the newest time value synced.
+
+Sync fetches rows newer than the start of the watermark's day minus
+OVERLAP_DAYS and rewrites every day partition it touched from scratch, so
+re-running is idempotent and rows that land late for a recent day
+(out-of-order vision workers, a facevals insert racing the sync) are
+picked up. Older days (e.g. after a backfill) are re-synced with --since.
+Files are written to a temp name and renamed, so readers never see a
+half-written partition.
+
+Each table keeps a fixed set of typed columns (other keys are dropped)
+plus parsed time columns as timestamp[ms] (Parquet has no seconds unit)
+in local wall time (subfuncsProcessing.engagement.to_seconds), which is
+what range filters and durations use. Needs pyarrow (pip install pyarrow).
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as pads
+    import pyarrow.parquet as pq
+except ImportError:       # optional; only the mirror needs it
+    pa = None
+
+from storage.base import PAGE_SIZE, read_all
+from subfuncsProcessing.engagement import to_seconds
+
+MIRROR_DIR = os.getenv("MIRROR_DIR", "raw/mirror")
+OVERLAP_DAYS = 1          # days before the watermark's day re-fetched on every sync
+FETCH_PAGE = PAGE_SIZE    # rows per request
+MAX_DWELL_S = 90          # a gap between screenshots longer than this was time away...
+IDLE_DWELL_S = 10         # ...and the screenshot before it counts this long (scheduler BASE_INTERVAL)
+
+
+class _Spec:
+    def __init__(self, time_col: str, columns: Dict[str, str],
+                 fetch: Callable[[Any, str, int, int], List[Dict[str, Any]]],
+                 times: Dict[str, str], utc: bool = False):
+        self.time_col = time_col        # partitioning / watermark column, as stored
+        self.columns = columns          # name → "int" | "float" | "str"
+        self.fetch = fetch              # (storage, start, limit, offset) → rows with time_col > start, by (time, id)
+        self.times = times              # parsed column → source column
+        self.utc = utc                  # source times are UTC
+
+
+TABLES: Dict[str, _Spec] = {
+    "screenshots": _Spec(
+        "timestamp",
+        {"id": "int", "timestamp": "str", "semantic_summary": "str", "workstream_label": "str",
+         "deliverable_label": "str", "app_or_website": "str", "app_bucket": "str", "work_type": "str",
+         "goal_type": "str", "confidence": "float", "workstream_id": "int", "deliverable_id": "int"},
+        lambda s, start, limit, offset: s.screenshots_since(start, limit=limit, offset=offset),
+        {"ts": "timestamp"},
+    ),
+    "episodes": _Spec(
+        "start_time",
+        {"id": "int", "start_time": "str", "end_time": "str", "screenshot_count": "int",
+         "workstream_label": "str", "deliverable_label": "str", "goal_type": "str", "work_band": "str",
+         "app_or_website": "str"},
+        lambda s, start, limit, offset: s.episodes_since(start, limit=limit, offset=offset),
+        {"start_ts": "start_time", "end_ts": "end_time"},
+    ),
+    "facevals": _Spec(
+        "created_at",
+        {"id": "int", "created_at": "str", "state": "str", "drowsy": "float", "engaged": "float"},
+        lambda s, start, limit, offset: s.facevals_since(start, limit=limit, offset=offset),
+        {"ts": "created_at"},
+        utc=True,
+    ),
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("the analytics mirror needs pyarrow (pip install pyarrow)")
+
+
+def _typed(values: List[Any], kind: str) -> "pa.Array":
+    if kind == "int":
+        return pa.array([v if isinstance(v, int) and not isinstance(v, bool) else None for v in values], pa.int64())
+    if kind == "float":
+        return pa.array([float(v) if isinstance(v, (int, float)) else None for v in values], pa.float64())
+    return pa.array([v if isinstance(v, str) else (None if v is None else str(v)) for v in values], pa.string())
+
+
+def _to_table(spec: _Spec, rows: Sequence[Dict[str, Any]]) -> "pa.Table":
+    cols = {name: _typed([r.get(name) for r in rows], kind) for name, kind in spec.columns.items()}
+    for name, src in spec.times.items():
+        secs = to_seconds((r.get(src) for r in rows), utc=spec.utc)
+        cols[name] = pa.array(np.where(secs >= 0, secs, 0).astype("datetime64[s]").astype("datetime64[ms]"),
+                              pa.timestamp("ms"), mask=secs < 0)
+    return pa.table(cols)
+
+
+class Mirror:
+    def __init__(self, root: str = MIRROR_DIR):
+        _require_pyarrow()
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._state_path = os.path.join(root, "_state.json")
+
+    # ---------- state ----------
+
+    def _state(self) -> Dict[str, Any]:
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        tmp = self._state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self._state_path)
+
+    def watermark(self, table: str) -> Optional[str]:
+        return (self._state().get(table) or {}).get("watermark")
+
+    # ---------- sync ----------
+
+    def _partition(self, table: str, day: str) -> str:
+        return os.path.join(self.root, table, f"day={day}")
+
+    def _write_day(self, table: str, day: str, t: "pa.Table") -> None:
+        d = self._partition(table, day)
+        os.makedirs(d, exist_ok=True)
+        path = os.path.join(d, "part.parquet")
+        pq.write_table(t, path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+
+    def sync(self, tables: Iterable[str] = tuple(TABLES), since: Optional[str] = None, storage=None) -> Dict[str, int]:
+        """
+        Bring the mirror up to date; rows fetched per table. With `since`
+        ('YYYY-MM-DD'), days from there on are re-fetched regardless of the
+        watermark (and days with no rows left are removed).
+        """
+        if storage is None:
+            from storage_client import storage
+        state = self._state()
+        fetched: Dict[str, int] = {}
+        for table in tables:
+            spec = TABLES[table]
+            mark = (state.get(table) or {}).get("watermark")
+            if since is not None:
+                start = since
+            elif mark:
+                start = (datetime.strptime(mark[:10], "%Y-%m-%d") - timedelta(days=OVERLAP_DAYS)).strftime("%Y-%m-%d")
+            else:
+                start = ""
+            rows = read_all(lambda limit, offset: spec.fetch(storage, start, limit, offset), FETCH_PAGE)
+            by_day: Dict[str, List[Dict[str, Any]]] = {}
+            for r in rows:
+                ts = r.get(spec.time_col)
+                if isinstance(ts, str) and len(ts) >= 10:
+                    by_day.setdefault(ts[:10], []).append(r)
+            for day, day_rows in by_day.items():
+                self._write_day(table, day, _to_table(spec, day_rows))
+            if since is not None:
+                for day in self.days(table):
+                    if day >= since and day not in by_day:
+                        shutil.rmtree(self._partition(table, day), ignore_errors=True)
+            times = [r[spec.time_col] for day_rows in by_day.values() for r in day_rows]
+            newest = max(times) if times else mark
+            if newest and (mark is None or since is not None or newest > mark):
+                mark = newest
+            state[table] = {"watermark": mark, "synced_at": datetime.now().isoformat(timespec="seconds")}
+            fetched[table] = len(rows)
+        self._save_state(state)
+        return fetched
+
+    # ---------- queries ----------
+
+    def days(self, table: str) -> List[str]:
+        d = os.path.join(self.root, table)
+        if not os.path.isdir(d):
+            return []
+        return sorted(name[4:] for name in os.listdir(d)
+                      if name.startswith("day=") and os.path.exists(os.path.join(d, name, "part.parquet")))
+
+    def read(self, table: str, start: Optional[str] = None, end: Optional[str] = None,
+             columns: Optional[List[str]] = None, filter: Optional["pc.Expression"] = None) -> "pa.Table":
+        """
+        Rows of `table` whose day is in [start, end] ('YYYY-MM-DD', either
+        open), restricted to `columns` and a pyarrow `filter` expression.
+        Day bounds only open the partitions needed; the result has a 'day'
+        column.
+        """
+        spec = TABLES[table]
+        days = [d for d in self.days(table) if (start is None or d >= start) and (end is None or d <= end)]
+        if not days:
+            empty = _to_table(spec, [])
+            empty = empty.append_column("day", pa.array([], pa.string()))
+            return empty.select(columns) if columns else empty
+        paths = [os.path.join(self._partition(table, d), "part.parquet") for d in days]
+        dataset = pads.dataset(paths, format="parquet",
+                               partitioning=pads.partitioning(pa.schema([("day", pa.string())]), flavor="hive"),
+                               partition_base_dir=os.path.join(self.root, table))
+        return dataset.to_table(columns=columns, filter=filter)
+
+    def time_per_workstream(self, start: Optional[str] = None, end: Optional[str] = None) -> "pa.Table":
+        """
+        (day, workstream_label, minutes, screenshots), time being each
+        screenshot's gap to the next one (IDLE_DWELL_S past a gap of
+        MAX_DWELL_S or more), sorted by day then minutes.
+        """
+        t = self.read("screenshots", start, end, columns=["day", "ts", "workstream_label"])
+        if t.num_rows == 0:
+            return pa.table({"day": pa.array([], pa.string()), "workstream_label": pa.array([], pa.string()),
+                             "minutes": pa.array([], pa.float64()), "screenshots": pa.array([], pa.int64())})
+        t = t.sort_by("ts")
+        secs = t.column("ts").cast(pa.int64()).to_numpy(zero_copy_only=False) // 1000
+        gap = np.diff(secs, append=secs[-1] + IDLE_DWELL_S)
+        dwell = np.where((gap >= 0) & (gap < MAX_DWELL_S), gap, IDLE_DWELL_S).astype(np.float64)
+        t = t.append_column("dwell_s", pa.array(dwell))
+        t = t.set_column(t.schema.get_field_index("workstream_label"), "workstream_label",
+                         pc.fill_null(t.column("workstream_label"), "unknown"))
+        out = t.group_by(["day", "workstream_label"]).aggregate([("dwell_s", "sum"), ("dwell_s", "count")])
+        out = pa.table({
+            "day": out.column("day"),
+            "workstream_label": out.column("workstream_label"),
+            "minutes": pc.divide(out.column("dwell_s_sum"), 60.0),
+            "screenshots": out.column("dwell_s_count"),
+        })
+        return out.sort_by([("day", "ascending"), ("minutes", "descending")])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("sync", help="delta sync from storage")
+    s.add_argument("--since", help="re-sync days after this one ('YYYY-MM-DD')")
+    s.add_argument("--tables", nargs="+", choices=list(TABLES), default=list(TABLES))
+    r = sub.add_parser("rollup", help="time per workstream per day")
+    r.add_argument("--days", type=int, default=28)
+    r.add_argument("--no-sync", action="store_true", help="query the mirror as it is")
+    ap.add_argument("--dir", default=MIRROR_DIR)
+    args = ap.parse_args()
+
+    m = Mirror(args.dir)
+    if args.cmd == "sync" or not args.no_sync:
+        t0 = time.perf_counter()
+        n = m.sync(args.tables if args.cmd == "sync" else tuple(TABLES), since=getattr(args, "since", None))
+        print(f"synced in {time.perf_counter() - t0:.2f}s")
+        for t, rows in n.items():
+            print(f"  {t:<12} {rows:>7} rows fetched, watermark {m.watermark(t)}")
+    if args.cmd == "rollup":
+        start = (datetime.now() - timedelta(days=args.days)).strftime("%Y-%m-%d")
+        t0 = time.perf_counter()
+        out = m.time_per_workstream(start)
+        dt = time.perf_counter() - t0
+        print(f"{out.num_rows} (day, workstream) rows since {start} in {1000 * dt:.1f} ms\n")
+        for row in out.to_pylist():
+            print(f"{row['day']}  {row['workstream_label'][:40]:<40} {row['minutes']:>7.1f} min  {row['screenshots']:>5}")
+
+
+if __name__ == "__main__":
+    main()
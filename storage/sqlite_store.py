@@ -0,0 +1,247 @@
+# sqlite_store.py
+"""
+Local single-file storage (stdlib sqlite3), for single-machine deployments
+and fully offline runs.
+
+    STORAGE_BACKEND=sqlite SQLITE_PATH=raw/local.db python main.py
+
+Each table has typed columns for what the pipeline writes and queries,
+plus an 'extra' JSON column for any other keys, so rows round-trip like
+they do through Supabase. Dict/list values (descriptors, JSON embeddings)
+are stored as JSON text and decoded on read.
+
+The database runs in WAL mode, so readers (analytics, virtue_analyzer)
+don't block the capture loop's writes. Writes go through one connection
+under a lock; update_centroid_if is a single guarded UPDATE.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from storage.base import Row, Storage, check_centroid_table
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "raw/local.db")
+
+SCHEMA = """
+create table if not exists screenshots (
+    id                integer primary key autoincrement,
+    timestamp         text not null,
+    semantic_summary  text,
+    workstream_label  text,
+    deliverable_label text,
+    app_or_website    text,
+    app_bucket        text,
+    work_type         text,
+    goal_type         text,
+    confidence        real,
+    workstream_id     integer,
+    deliverable_id    integer,
+    extra             text
+);
+create index if not exists screenshots_timestamp on screenshots (timestamp);
+create index if not exists screenshots_workstream on screenshots (workstream_id, timestamp);
+create index if not exists screenshots_deliverable on screenshots (deliverable_id);
+
+create table if not exists workstreams (
+    id              integer primary key autoincrement,
+    canonical_label text not null,
+    embedding       text,
+    embedding_bin   text,
+    n_points        integer not null default 0,
+    extra           text
+);
+
+create table if not exists deliverables (
+    id              integer primary key autoincrement,
+    workstream_id   integer not null,
+    canonical_label text not null,
+    embedding       text,
+    embedding_bin   text,
+    n_points        integer not null default 0,
+    extra           text
+);
+create index if not exists deliverables_workstream on deliverables (workstream_id);
+
+create table if not exists episodes (
+    id                integer primary key autoincrement,
+    start_time        text not null,
+    end_time          text not null,
+    screenshot_count  integer,
+    workstream_label  text,
+    deliverable_label text,
+    goal_type         text,
+    work_band         text,
+    app_or_website    text,
+    extra             text
+);
+create index if not exists episodes_start on episodes (start_time);
+
+create table if not exists coherence_labels (
+    id                    integer primary key autoincrement,
+    screenshot_timestamp  text,
+    episode_start_time    text,
+    episode_end_time      text,
+    coherence_score       real,
+    label_source          text,
+    episode_descriptor    text,
+    screenshot_descriptor text,
+    extra                 text
+);
+create index if not exists coherence_labels_timestamp on coherence_labels (screenshot_timestamp);
+
+create table if not exists facevals (
+    id         integer primary key autoincrement,
+    created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    state      text,
+    drowsy     real,
+    engaged    real,
+    extra      text
+);
+create index if not exists facevals_created on facevals (created_at);
+"""
+
+# columns holding JSON text, decoded back to Python values on read
+_JSON_COLUMNS = {"embedding", "episode_descriptor", "screenshot_descriptor"}
+
+
+class SQLiteStore(Storage):
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.executescript(SCHEMA)
+        self._columns: Dict[str, List[str]] = {}
+        for table in ("screenshots", "workstreams", "deliverables", "episodes", "coherence_labels", "facevals"):
+            self._columns[table] = [r[1] for r in self._conn.execute(f"pragma table_info({table})")]
+
+    # ---------- row mapping ----------
+
+    def _encode(self, table: str, row: Row) -> Dict[str, Any]:
+        cols = self._columns[table]
+        out: Dict[str, Any] = {}
+        extra: Dict[str, Any] = {}
+        for k, v in row.items():
+            if k == "id" or k == "extra":
+                continue
+            if k not in cols:
+                extra[k] = v
+            elif isinstance(v, (dict, list)):
+                out[k] = json.dumps(v)
+            else:
+                out[k] = v
+        if extra:
+            out["extra"] = json.dumps(extra, default=str)
+        return out
+
+    @staticmethod
+    def _decode(r: sqlite3.Row) -> Row:
+        row = dict(r)
+        extra = row.pop("extra", None)
+        for k in _JSON_COLUMNS:
+            if row.get(k) is not None:
+                row[k] = json.loads(row[k])
+        if extra:
+            row.update(json.loads(extra))
+        return row
+
+    def _insert(self, table: str, row: Row) -> Row:
+        values = self._encode(table, row)
+        cols = ", ".join(values)
+        marks = ", ".join("?" for _ in values)
+        with self._lock:
+            cur = self._conn.execute(
+                f"insert into {table} ({cols}) values ({marks})" if values else f"insert into {table} default values",
+                list(values.values()),
+            )
+            r = self._conn.execute(f"select * from {table} where id = ?", (cur.lastrowid,)).fetchone()
+        return self._decode(r)
+
+    def _select(self, sql: str, params=()) -> List[Row]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._decode(r) for r in rows]
+
+    # ---------- screenshots ----------
+
+    def insert_screenshot(self, row: Row) -> Optional[Row]:
+        return self._insert("screenshots", row)
+
+    def screenshots_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        return self._since("screenshots", "timestamp", start, limit, offset)
+
+    def _since(self, table: str, col: str, start: str, limit: Optional[int], offset: int,
+               columns: str = "*") -> List[Row]:
+        sql = f"select {columns} from {table} where {col} > ? order by {col}, id"
+        params: List[Any] = [start]
+        if limit is not None:
+            sql += " limit ? offset ?"
+            params += [limit, offset]
+        elif offset:
+            raise ValueError("offset needs a limit")
+        return self._select(sql, params)
+
+    # ---------- workstreams / deliverables ----------
+
+    def centroid_rows(self, table: str, columns: str = "*", since_id: int = 0, limit: Optional[int] = None) -> List[Row]:
+        check_centroid_table(table)
+        sql = f"select * from {table} where id > ? order by id"
+        params: List[Any] = [since_id]
+        if limit is not None:
+            sql += " limit ?"
+            params.append(limit)
+        return self._select(sql, params)
+
+    def get_centroid(self, table: str, row_id: int, columns: str = "*") -> Optional[Row]:
+        check_centroid_table(table)
+        rows = self._select(f"select * from {table} where id = ?", (row_id,))
+        return rows[0] if rows else None
+
+    def insert_centroid(self, table: str, row: Row) -> Optional[Row]:
+        check_centroid_table(table)
+        return self._insert(table, row)
+
+    def update_centroid_if(self, table: str, row_id: int, expected_n_points: Optional[int], values: Row) -> bool:
+        check_centroid_table(table)
+        enc = self._encode(table, values)
+        sets = ", ".join(f"{k} = ?" for k in enc)
+        with self._lock:
+            cur = self._conn.execute(
+                f"update {table} set {sets} where id = ? and n_points is ?",
+                list(enc.values()) + [row_id, expected_n_points],
+            )
+        return cur.rowcount == 1
+
+    # ---------- episodes / labels / face ----------
+
+    def insert_episode(self, row: Row) -> Optional[Row]:
+        return self._insert("episodes", row)
+
+    def episodes_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        return self._since("episodes", "start_time", start, limit, offset)
+
+    def insert_coherence_label(self, row: Row) -> Optional[Row]:
+        return self._insert("coherence_labels", row)
+
+    def coherence_labels_since(self, start: str, descriptors: bool = False,
+                               limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        cols = "*" if descriptors else (
+            "id, screenshot_timestamp, episode_start_time, coherence_score, label_source, null as extra"
+        )
+        return self._since("coherence_labels", "screenshot_timestamp", start, limit, offset, columns=cols)
+
+    def insert_faceval(self, row: Row) -> Optional[Row]:
+        return self._insert("facevals", row)
+
+    def facevals_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        return self._since("facevals", "created_at", start, limit, offset)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
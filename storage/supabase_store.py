@@ -0,0 +1,99 @@
+# supabase_store.py
+"""
+Storage on a Supabase (PostgREST) project. Works with anything exposing the
+supabase-py query builder, which is how the offline fakes and the
+record/replay transport plug in underneath it.
+"""
+from typing import Any, List, Optional, Sequence
+
+from storage.base import Row, Storage, check_centroid_table
+
+
+def _first(resp) -> Optional[Row]:
+    data = getattr(resp, "data", None)
+    return data[0] if data else None
+
+
+class SupabaseStore(Storage):
+    def __init__(self, client: Any):
+        self.client = client
+
+    # ---------- screenshots ----------
+
+    def insert_screenshot(self, row: Row) -> Optional[Row]:
+        return _first(self.client.table("screenshots").insert(row).execute())
+
+    def screenshots_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        return self._since("screenshots", "timestamp", start, limit, offset)
+
+    def _since(self, table: str, col: str, start: str, limit: Optional[int], offset: int,
+               columns: str = "*") -> List[Row]:
+        query = self.client.table(table).select(columns).gt(col, start).order(col).order("id")
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        elif offset:
+            raise ValueError("offset needs a limit")
+        return query.execute().data or []
+
+    # ---------- workstreams / deliverables ----------
+
+    def centroid_rows(self, table: str, columns: str = "*", since_id: int = 0, limit: Optional[int] = None) -> List[Row]:
+        check_centroid_table(table)
+        query = self.client.table(table).select(columns)
+        if since_id:
+            query = query.gt("id", since_id)
+        query = query.order("id")
+        if limit is not None:
+            query = query.limit(limit)
+        return query.execute().data or []
+
+    def get_centroid(self, table: str, row_id: int, columns: str = "*") -> Optional[Row]:
+        check_centroid_table(table)
+        return _first(self.client.table(table).select(columns).eq("id", row_id).execute())
+
+    def insert_centroid(self, table: str, row: Row) -> Optional[Row]:
+        check_centroid_table(table)
+        return _first(self.client.table(table).insert(row).execute())
+
+    def update_centroid_if(self, table: str, row_id: int, expected_n_points: Optional[int], values: Row) -> bool:
+        check_centroid_table(table)
+        resp = self.client.table(table).update(values).eq("id", row_id).eq("n_points", expected_n_points).execute()
+        return bool(resp.data)
+
+    def merge_centroid_delta(self, table: str, row_id: int, total: Sequence[float], count: int) -> None:
+        check_centroid_table(table)
+        try:
+            self.client.rpc(
+                "merge_centroid_delta",
+                {"p_table": table, "p_id": row_id, "p_sum": list(total), "p_count": count},
+            ).execute()
+        except Exception as e:
+            if "PGRST202" in str(e) or "Could not find the function" in str(e):
+                raise NotImplementedError(
+                    "merge_centroid_delta RPC missing; run sql/merge_centroid_delta.sql"
+                ) from e
+            raise
+
+    # ---------- episodes / labels / face ----------
+
+    def insert_episode(self, row: Row) -> Optional[Row]:
+        return _first(self.client.table("episodes").insert(row).execute())
+
+    def episodes_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        return self._since("episodes", "start_time", start, limit, offset)
+
+    def insert_coherence_label(self, row: Row) -> Optional[Row]:
+        return _first(self.client.table("coherence_labels").insert(row).execute())
+
+    def coherence_labels_since(self, start: str, descriptors: bool = False,
+                               limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        cols = "id, screenshot_timestamp, episode_start_time, coherence_score, label_source"
+        if descriptors:
+            cols += ", episode_descriptor, screenshot_descriptor"
+        return self._since("coherence_labels", "screenshot_timestamp", start, limit, offset, columns=cols)
+
+    def insert_faceval(self, row: Row) -> Optional[Row]:
+        return _first(self.client.table("facevals").insert(row).execute())
+
+    def facevals_since(self, start: str, limit: Optional[int] = None, offset: int = 0) -> List[Row]:
+        return self._since("facevals", "created_at", start, limit, offset)
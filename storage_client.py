@@ -0,0 +1,23 @@
+import os
+
+from storage import Storage
+
+# "supabase" (default) or "sqlite" (single local file, see storage/sqlite_store.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+
+
+def make_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "supabase":
+        # imported lazily so the sqlite backend needs neither supabase-py nor credentials
+        from storage.supabase_store import SupabaseStore
+        from supabase_client import supabase
+
+        return SupabaseStore(supabase)
+    if backend == "sqlite":
+        from storage.sqlite_store import SQLiteStore
+
+        return SQLiteStore()
+    raise ValueError(f"unknown STORAGE_BACKEND {backend!r}; expected 'supabase' or 'sqlite'")
+
+
+storage: Storage = make_storage()
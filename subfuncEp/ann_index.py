@@ -0,0 +1,458 @@
+# ann_index.py
+"""
+Nearest-centroid indexes for the canonicalizer (cosine similarity over
+float32 unit vectors).
+
+    idx = make_index("ivf", dim=1536)
+    idx.upsert(42, emb)                 # insert, or move an updated centroid
+    [(row_id, score)] = idx.search(q, k=1)
+    idx.save("raw/ann/workstreams.npz"); idx = load_index("raw/ann/workstreams.npz")
+
+Backends:
+    "exact"  brute-force matmul; the reference and the right choice below a few thousand rows
+    "ivf"    IVF-flat: k-means coarse lists, scan the nprobe closest lists (numpy only)
+    "hnsw"   hnswlib graph, if hnswlib is installed
+    "auto"   exact that switches itself to IVF once it passes AUTO_IVF_THRESHOLD rows
+
+All support incremental upsert/remove and persistence. IVF keeps scanning
+exactly until it has MIN_TRAIN rows, and retrains its lists when the index
+has grown RETRAIN_GROWTH times past its last training size. Training runs
+on a background thread over a snapshot of the rows, so upserts (made under
+the canonicalizer's lock) never wait on k-means; the first call after it
+finishes swaps the new lists in, and until then the old ones keep serving.
+"""
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:       # optional; only the "hnsw" backend needs it
+    hnswlib = None
+
+ANN_BACKEND = os.getenv("ANN_BACKEND", "auto")
+AUTO_IVF_THRESHOLD = 5000
+MIN_TRAIN = 1024
+RETRAIN_GROWTH = 4.0
+KMEANS_ITERS = 10
+KMEANS_SAMPLE = 65536
+DEFAULT_NPROBE = 8
+BACKGROUND_TRAIN = True     # False: train inline (scripts that want the lists right away)
+
+Hit = Tuple[int, float]
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32).reshape(-1)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> List[Hit]:
+    if scores.size == 0:
+        return []
+    k = min(k, scores.size)
+    part = np.argpartition(-scores, k - 1)[:k]
+    part = part[np.argsort(-scores[part])]
+    return [(int(ids[i]), float(scores[i])) for i in part]
+
+
+# ---------- Exact -----------------------------------------------------------
+
+class ExactIndex:
+    """
+    Row-major float32 matrix with id → row bookkeeping; removed rows are
+    zeroed and reused, so scores against them are 0 and never win.
+    """
+
+    kind = "exact"
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._x = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._row: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._n = 0          # high-water mark of used rows
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __contains__(self, row_id: int) -> bool:
+        return row_id in self._row
+
+    def _grow(self) -> None:
+        cap = self._x.shape[0] * 2
+        x = np.zeros((cap, self.dim), dtype=np.float32)
+        x[: self._n] = self._x[: self._n]
+        ids = np.full(cap, -1, dtype=np.int64)
+        ids[: self._n] = self._ids[: self._n]
+        self._x, self._ids = x, ids
+
+    def upsert(self, row_id: int, vec) -> int:
+        """Store `vec` (normalized) under `row_id`; returns its matrix row."""
+        r = self._row.get(row_id)
+        if r is None:
+            if self._free:
+                r = self._free.pop()
+            else:
+                if self._n == self._x.shape[0]:
+                    self._grow()
+                r = self._n
+                self._n += 1
+            self._row[row_id] = r
+            self._ids[r] = row_id
+        self._x[r] = _unit(vec)
+        return r
+
+    def remove(self, row_id: int) -> Optional[int]:
+        r = self._row.pop(row_id, None)
+        if r is not None:
+            self._x[r] = 0.0
+            self._ids[r] = -1
+            self._free.append(r)
+        return r
+
+    def vector(self, row_id: int) -> np.ndarray:
+        """The stored (unit) vector for `row_id`."""
+        return self._x[self._row[row_id]].copy()
+
+    def search(self, vec, k: int = 1) -> List[Hit]:
+        if not self._row:
+            return []
+        scores = self._x[: self._n] @ _unit(vec)
+        scores[self._ids[: self._n] < 0] = -np.inf
+        return [h for h in _top_k(scores, self._ids[: self._n], k) if h[0] >= 0]
+
+    # -- persistence --
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        return {"x": self._x[: self._n], "ids": self._ids[: self._n]}
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {"kind": self.kind, "dim": self.dim}
+        meta.update(self._meta())
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **self._arrays())
+        os.replace(tmp, path)
+
+    def _meta(self) -> Dict:
+        return {}
+
+    def _restore(self, data, meta: Dict) -> None:
+        x, ids = data["x"], data["ids"]
+        n = len(ids)
+        self._x = np.zeros((max(1024, n), self.dim), dtype=np.float32)
+        self._ids = np.full(max(1024, n), -1, dtype=np.int64)
+        self._x[:n], self._ids[:n] = x, ids
+        self._n = n
+        self._row = {int(i): r for r, i in enumerate(ids) if i >= 0}
+        self._free = [r for r, i in enumerate(ids) if i < 0]
+
+
+# ---------- IVF-flat --------------------------------------------------------
+
+def _kmeans(x: np.ndarray, k: int, iters: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit rows; returns k unit centroids."""
+    rng = np.random.default_rng(seed)
+    if len(x) > KMEANS_SAMPLE:
+        x = x[rng.choice(len(x), KMEANS_SAMPLE, replace=False)]
+    cent = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ cent.T, axis=1)
+        sums = np.zeros_like(cent)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # re-seed empty lists from random points rather than leaving them dead
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        cent = sums / np.maximum(norms, 1e-12)
+    return cent.astype(np.float32)
+
+
+_trainer: Optional[ThreadPoolExecutor] = None
+
+
+def _train_pool() -> ThreadPoolExecutor:
+    global _trainer
+    if _trainer is None:
+        _trainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ann-train")
+    return _trainer
+
+
+class IVFFlatIndex(ExactIndex):
+    kind = "ivf"
+
+    def __init__(self, dim: int, nprobe: int = DEFAULT_NPROBE, nlist: Optional[int] = None, capacity: int = 1024,
+                 background: bool = BACKGROUND_TRAIN):
+        super().__init__(dim, capacity)
+        self.nprobe = nprobe
+        self.background = background
+        self._training: Optional[Future] = None         # k-means running off-thread → (centroids, trained_at)
+        self._nlist_fixed = nlist
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.full(capacity, -1, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}   # cached np.array of each list's rows
+        self._trained_at = 0
+
+    def _grow(self) -> None:
+        super()._grow()
+        a = np.full(self._x.shape[0], -1, dtype=np.int32)
+        a[: len(self._assign)] = self._assign
+        self._assign = a
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def _training_set(self) -> Tuple[np.ndarray, int, int]:
+        """(copy of at most KMEANS_SAMPLE live rows, nlist, live row count)."""
+        live = np.fromiter(self._row.values(), dtype=np.int64)
+        nlist = min(self._nlist_fixed or max(1, int(np.sqrt(len(live)))), len(live))
+        if len(live) > KMEANS_SAMPLE:
+            live = np.sort(np.random.default_rng(0).choice(live, KMEANS_SAMPLE, replace=False))
+        return self._x[live], nlist, len(self._row)
+
+    def train(self) -> None:
+        """Train the lists now, on this thread."""
+        if not self._row:
+            return
+        x, nlist, n = self._training_set()
+        self._install(_kmeans(x, nlist, KMEANS_ITERS), n)
+
+    def _install(self, centroids: np.ndarray, trained_at: int) -> None:
+        """Swap in new coarse centroids and reassign every live row to them."""
+        live = np.fromiter(self._row.values(), dtype=np.int64)
+        self._centroids = centroids
+        self._lists = [[] for _ in range(len(centroids))]
+        self._assign[:] = -1
+        assign = np.argmax(self._x[live] @ centroids.T, axis=1) if len(live) else []
+        for r, a in zip(live.tolist(), np.asarray(assign).tolist()):
+            self._assign[r] = a
+            self._lists[a].append(r)
+        self._list_arrays = {}
+        self._trained_at = trained_at
+
+    def _collect_training(self) -> None:
+        """Install background training results, if they've landed."""
+        job = self._training
+        if job is None or not job.done():
+            return
+        self._training = None
+        try:
+            centroids, trained_at = job.result()
+        except Exception as e:
+            print(f"(ANN.e) IVF training failed: {e}")
+            return
+        self._install(centroids, trained_at)
+
+    def _needs_training(self) -> bool:
+        n = len(self._row)
+        if not self.trained:
+            return n >= MIN_TRAIN
+        return n >= RETRAIN_GROWTH * self._trained_at
+
+    def _maybe_train(self) -> None:
+        self._collect_training()
+        if self._training is not None or not self._needs_training():
+            return
+        if not self.background:
+            self.train()
+            return
+        x, nlist, n = self._training_set()    # a copy: upserts keep writing self._x meanwhile
+        self._training = _train_pool().submit(lambda: (_kmeans(x, nlist, KMEANS_ITERS), n))
+
+    def wait_trained(self, timeout: Optional[float] = None) -> None:
+        """Block until a background training run (if any) is installed."""
+        job = self._training
+        if job is not None:
+            job.result(timeout)
+            self._collect_training()
+
+    def _unlist(self, r: int) -> None:
+        a = int(self._assign[r])
+        if a >= 0:
+            self._lists[a].remove(r)
+            self._list_arrays.pop(a, None)
+            self._assign[r] = -1
+
+    def upsert(self, row_id: int, vec) -> int:
+        self._collect_training()
+        r = super().upsert(row_id, vec)
+        if self.trained:
+            a = int(np.argmax(self._centroids @ self._x[r]))
+            if a != self._assign[r]:
+                self._unlist(r)
+                self._assign[r] = a
+                self._lists[a].append(r)
+                self._list_arrays.pop(a, None)
+        self._maybe_train()
+        return r
+
+    def remove(self, row_id: int) -> Optional[int]:
+        self._collect_training()
+        r = self._row.get(row_id)
+        if r is not None and self.trained:
+            self._unlist(r)
+        return super().remove(row_id)
+
+    def _rows_of(self, a: int) -> np.ndarray:
+        arr = self._list_arrays.get(a)
+        if arr is None:
+            arr = self._list_arrays[a] = np.asarray(self._lists[a], dtype=np.int64)
+        return arr
+
+    def search(self, vec, k: int = 1, nprobe: Optional[int] = None) -> List[Hit]:
+        self._collect_training()
+        if not self.trained:
+            return super().search(vec, k)
+        q = _unit(vec)
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+        coarse = self._centroids @ q
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self._rows_of(int(a)) for a in probe])
+        if rows.size == 0:
+            return []
+        return _top_k(self._x[rows] @ q, self._ids[rows], k)
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        arrays = super()._arrays()
+        arrays["assign"] = self._assign[: self._n]
+        if self.trained:
+            arrays["centroids"] = self._centroids
+        return arrays
+
+    def _meta(self) -> Dict:
+        return {"nprobe": self.nprobe, "nlist": self._nlist_fixed, "trained_at": self._trained_at}
+
+    def _restore(self, data, meta: Dict) -> None:
+        super()._restore(data, meta)
+        self.nprobe = meta.get("nprobe", DEFAULT_NPROBE)
+        self._nlist_fixed = meta.get("nlist")
+        self._trained_at = meta.get("trained_at", 0)
+        self._assign = np.full(self._x.shape[0], -1, dtype=np.int32)
+        if "centroids" in data:
+            self._centroids = data["centroids"]
+            self._assign[: self._n] = data["assign"]
+            self._lists = [[] for _ in range(len(self._centroids))]
+            for r in np.flatnonzero(self._assign[: self._n] >= 0).tolist():
+                self._lists[int(self._assign[r])].append(r)
+            self._list_arrays = {}
+
+
+# ---------- Auto ------------------------------------------------------------
+
+class AutoIndex(IVFFlatIndex):
+    """IVF that doesn't build lists until it's big enough for them to pay off."""
+
+    kind = "auto"
+
+    def _needs_training(self) -> bool:
+        return (self.trained or len(self._row) >= AUTO_IVF_THRESHOLD) and super()._needs_training()
+
+
+# ---------- HNSW ------------------------------------------------------------
+
+class HNSWIndex:
+    kind = "hnsw"
+
+    def __init__(self, dim: int, capacity: int = 1024, m: int = 16, ef_construction: int = 200, ef: int = 64):
+        if hnswlib is None:
+            raise RuntimeError("ANN backend 'hnsw' needs hnswlib (pip install hnswlib)")
+        self.dim = dim
+        self._m, self._efc, self.ef = m, ef_construction, ef
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(max_elements=capacity, M=m, ef_construction=ef_construction, allow_replace_deleted=True)
+        self._index.set_ef(ef)
+        self._ids = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, row_id: int) -> bool:
+        return row_id in self._ids
+
+    def upsert(self, row_id: int, vec) -> None:
+        if len(self._ids) >= self._index.get_max_elements():
+            self._index.resize_index(2 * self._index.get_max_elements())
+        # hnswlib overwrites the vector (and relinks it) when the label exists
+        self._index.add_items(_unit(vec)[None, :], [row_id], replace_deleted=True)
+        self._ids.add(row_id)
+
+    def remove(self, row_id: int) -> None:
+        if row_id in self._ids:
+            self._index.mark_deleted(row_id)
+            self._ids.discard(row_id)
+
+    def vector(self, row_id: int) -> np.ndarray:
+        return np.asarray(self._index.get_items([row_id])[0], dtype=np.float32)
+
+    def search(self, vec, k: int = 1) -> List[Hit]:
+        if not self._ids:
+            return []
+        labels, dists = self._index.knn_query(_unit(vec)[None, :], k=min(k, len(self._ids)))
+        # "ip" distance is 1 - dot
+        return [(int(l), float(1.0 - d)) for l, d in zip(labels[0], dists[0])]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._index.save_index(path + ".bin")
+        with open(path + ".json", "w") as f:
+            json.dump({"kind": self.kind, "dim": self.dim, "m": self._m, "efc": self._efc,
+                       "ef": self.ef, "ids": sorted(self._ids)}, f)
+        os.replace(path + ".json", path)
+
+    @classmethod
+    def _load(cls, path: str, meta: Dict) -> "HNSWIndex":
+        idx = cls(meta["dim"], m=meta["m"], ef_construction=meta["efc"], ef=meta["ef"])
+        idx._index.load_index(path + ".bin", allow_replace_deleted=True)
+        idx._index.set_ef(idx.ef)
+        idx._ids = set(meta["ids"])
+        return idx
+
+
+# ---------- Factory ---------------------------------------------------------
+
+_BACKENDS = {"exact": ExactIndex, "ivf": IVFFlatIndex, "auto": AutoIndex, "hnsw": HNSWIndex}
+
+
+def make_index(kind: str = ANN_BACKEND, dim: int = 1536, **kwargs):
+    if kind not in _BACKENDS:
+        raise ValueError(f"unknown ANN backend {kind!r}; expected one of {sorted(_BACKENDS)}")
+    return _BACKENDS[kind](dim, **kwargs)
+
+
+def load_index(path: str):
+    """Load an index written by .save(); the backend is recorded in the file."""
+    with open(path, "rb") as f:
+        is_npz = f.read(2) == b"PK"
+    if not is_npz:
+        with open(path) as f:
+            meta = json.load(f)
+        return HNSWIndex._load(path, meta)
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        idx = _BACKENDS[meta["kind"]](meta["dim"])
+        idx._restore(data, meta)
+    return idx
+
+
+def build_index(kind: str, ids: Sequence[int], vectors: Sequence[Sequence[float]], **kwargs):
+    """Bulk-load; IVF trains once at the end (inline) instead of as it grows."""
+    dim = len(vectors[0]) if len(vectors) else 1536
+    idx = make_index(kind, dim, capacity=max(1024, len(ids)), **kwargs)
+    if isinstance(idx, IVFFlatIndex):
+        for i, v in zip(ids, vectors):
+            ExactIndex.upsert(idx, int(i), v)
+        if idx._needs_training():
+            idx.train()
+    else:
+        for i, v in zip(ids, vectors):
+            idx.upsert(int(i), v)
+    return idx
@@ -0,0 +1,189 @@
+# descriptors.py
+"""
+Compact, token-budgeted text for the coherence prompt.
+
+The episoder still builds its full descriptor dicts (they are what gets
+logged to 'coherence_labels'); this module turns them into prompt text:
+
+  - minified JSON with null / "" / "unknown" fields dropped
+  - example summaries deduplicated (case/whitespace-insensitive), newest
+    first, each cut to SUMMARY_MAX_CHARS, added only while the episode
+    text stays within COHERENCE_TOKEN_BUDGET
+  - tokens counted locally (tiktoken if installed, else ~4 chars/token)
+
+The episode part is split into a prefix that only changes when the
+episode's dominant labels change or every PREFIX_REFRESH_SCREENS
+screenshots (start time, dominant fields, examples), and a short
+per-call suffix (current size and end time). Consecutive calls for the
+same episode therefore send a byte-identical prefix after the static
+system prompt, which is what provider prompt caching keys on.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from subfuncsChecks.rate_limiter import CHARS_PER_TOKEN
+
+try:
+    import tiktoken
+except ImportError:       # optional; token counts fall back to a char estimate
+    tiktoken = None
+
+COHERENCE_TOKEN_BUDGET = int(os.getenv("COHERENCE_TOKEN_BUDGET", "300"))   # episode prefix tokens
+SUMMARY_MAX_CHARS = 240
+PREFIX_REFRESH_SCREENS = 10
+PREFIX_CACHE_SIZE = 8      # episodes whose prefix is kept
+
+_EMPTY = (None, "", "unknown", [], {})
+_WS_RE = re.compile(r"\s+")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for `text` (o200k_base, the gpt-4o family's encoding, when available)."""
+    global _encoding
+    if tiktoken is not None and _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception:      # encoding file not cached and no network
+                    _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def compact(obj: Any) -> Any:
+    """`obj` with empty / unknown values removed, recursively."""
+    if isinstance(obj, dict):
+        out = {k: compact(v) for k, v in obj.items()}
+        return {k: v for k, v in out.items() if not any(v is e or v == e for e in _EMPTY)}
+    if isinstance(obj, list):
+        return [c for c in (compact(v) for v in obj) if not any(c is e or c == e for e in _EMPTY)]
+    return obj
+
+
+def dumps(obj: Any) -> str:
+    return json.dumps(compact(obj), ensure_ascii=False, separators=(",", ":"))
+
+
+def _shorten(text: str, limit: int = SUMMARY_MAX_CHARS) -> str:
+    text = _WS_RE.sub(" ", text).strip()
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+def unique_summaries(summaries: List[str]) -> List[str]:
+    """Newest first, without near-verbatim repeats."""
+    seen, out = set(), []
+    for s in reversed(summaries):
+        key = _WS_RE.sub(" ", (s or "").lower()).strip()
+        if key and key not in seen:
+            seen.add(key)
+            out.append(_shorten(s))
+    return out
+
+
+# ---------- Compilation -----------------------------------------------------
+
+def compile_episode_prefix(episode_desc: Dict[str, Any], budget: int = COHERENCE_TOKEN_BUDGET) -> str:
+    """The stable part of the episode: start, dominant labels, examples within `budget` tokens."""
+    base = {
+        "start": (episode_desc.get("time_span") or {}).get("start"),
+        "workstream": episode_desc.get("dominant_workstream_label"),
+        "deliverable": episode_desc.get("dominant_deliverable_label"),
+        "app": episode_desc.get("dominant_app_bucket"),
+        "work": episode_desc.get("dominant_work_type"),
+        "goal": episode_desc.get("dominant_goal_type"),
+    }
+    examples: List[str] = []
+    text = dumps(base)
+    for s in unique_summaries(episode_desc.get("example_summaries") or []):
+        candidate = dumps({**base, "examples": examples + [s]})
+        if count_tokens(candidate) > budget:
+            break
+        examples.append(s)
+        text = candidate
+    return text
+
+
+def compile_episode_suffix(episode_desc: Dict[str, Any]) -> str:
+    return dumps({
+        "screens": episode_desc.get("screenshot_count"),
+        "end": (episode_desc.get("time_span") or {}).get("end"),
+    })
+
+
+def compile_screenshot(shot_desc: Dict[str, Any]) -> str:
+    desc = dict(shot_desc)
+    if desc.get("semantic_summary"):
+        desc["semantic_summary"] = _shorten(desc["semantic_summary"])
+    return dumps(desc)
+
+
+class PrefixCache:
+    """
+    Compiled episode prefix per episode (keyed by start time), reused until
+    the dominant labels change or PREFIX_REFRESH_SCREENS more screenshots
+    have been added.
+    """
+
+    def __init__(self, size: int = PREFIX_CACHE_SIZE, refresh: int = PREFIX_REFRESH_SCREENS):
+        self.size = size
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Tuple, int, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _labels(desc: Dict[str, Any]) -> Tuple:
+        return tuple(desc.get(k) for k in (
+            "dominant_workstream_label", "dominant_deliverable_label", "dominant_app_bucket",
+            "dominant_work_type", "dominant_goal_type",
+        ))
+
+    def get(self, episode_desc: Dict[str, Any], budget: int = COHERENCE_TOKEN_BUDGET) -> str:
+        key = (episode_desc.get("time_span") or {}).get("start") or ""
+        labels = self._labels(episode_desc)
+        count = episode_desc.get("screenshot_count") or 0
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] == labels and count - hit[1] < self.refresh:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return hit[2]
+        text = compile_episode_prefix(episode_desc, budget)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (labels, count, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return text
+
+
+prefix_cache = PrefixCache()
+
+
+def compile_coherence_prompt(
+    episode_desc: Dict[str, Any],
+    shot_desc: Dict[str, Any],
+    cache: Optional[PrefixCache] = prefix_cache,
+    budget: int = COHERENCE_TOKEN_BUDGET,
+) -> Tuple[str, str]:
+    """
+    (episode prefix, per-call text) for the coherence user message. Send
+    them as separate content parts, prefix first.
+    """
+    prefix = cache.get(episode_desc, budget) if cache is not None else compile_episode_prefix(episode_desc, budget)
+    rest = f"Episode now: {compile_episode_suffix(episode_desc)}\nNew screenshot: {compile_screenshot(shot_desc)}"
+    return f"Episode: {prefix}", rest
@@ -0,0 +1,103 @@
+# embedding_codec.py
+"""
+Packed binary encoding for centroid embeddings.
+
+A JSON list of 1536 floats is ~30 KB on the wire and costs ~1536 float
+parses per row. The 'embedding_bin' column instead holds base64 of:
+
+    tag (1 byte) | [scale, float32 LE, int8 only] | values
+
+    "f32"  float32 LE, 6 KB raw / 8 KB base64, decoded zero-copy by np.frombuffer
+    "f16"  float16 LE, half that; |error| ~1e-4 relative
+    "i8"   int8 scaled by max|x|/127, a quarter; cosine error ~1e-3
+
+Base64 rather than bytea because PostgREST returns bytea as hex ("\\x…"),
+which is twice the size. The codec for new writes is EMBEDDING_CODEC, "json"
+(the legacy float-list column) unless set: the packed codecs need
+sql/add_embedding_bin.sql applied, and resolve_codec falls back to "json"
+where the column is missing. Decoding accepts any tag, so mixed rows read
+fine while a migration (subfuncEp/migrate_embeddings.py) is in flight.
+"""
+import base64
+import os
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+EMBEDDING_CODEC = os.getenv("EMBEDDING_CODEC", "json")
+CODECS = ("f32", "f16", "i8")
+
+_TAGS = {"f32": 1, "f16": 2, "i8": 3}
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2"), 3: np.dtype("i1")}
+
+
+def encode(vec: Sequence[float], codec: str = EMBEDDING_CODEC) -> str:
+    if codec not in _TAGS:
+        raise ValueError(f"unknown embedding codec {codec!r}; expected one of {CODECS}")
+    v = np.asarray(vec, dtype=np.float32).reshape(-1)
+    tag = _TAGS[codec]
+    if codec == "i8":
+        scale = float(np.max(np.abs(v))) / 127.0 if v.size else 0.0
+        q = np.round(v / scale).astype(np.int8) if scale > 0 else np.zeros(v.size, np.int8)
+        payload = bytes([tag]) + np.float32(scale).astype("<f4").tobytes() + q.tobytes()
+    else:
+        payload = bytes([tag]) + v.astype(_DTYPES[tag]).tobytes()
+    return base64.b64encode(payload).decode("ascii")
+
+
+def decode(text: str) -> np.ndarray:
+    """
+    float32 vector from an encoded string. For "f32" the result is a
+    read-only view over the decoded bytes (no per-element work).
+    """
+    raw = base64.b64decode(text)
+    tag = raw[0]
+    if tag == 1:
+        return np.frombuffer(raw, dtype=_DTYPES[1], offset=1)
+    if tag == 2:
+        return np.frombuffer(raw, dtype=_DTYPES[2], offset=1).astype(np.float32)
+    if tag == 3:
+        scale = np.frombuffer(raw, dtype="<f4", count=1, offset=1)[0]
+        return np.frombuffer(raw, dtype=_DTYPES[3], offset=5).astype(np.float32) * scale
+    raise ValueError(f"unknown embedding tag {tag}")
+
+
+def row_embedding(row: Dict[str, Any]) -> Optional[np.ndarray]:
+    """The row's embedding from 'embedding_bin' if set, else the legacy JSON list."""
+    packed = row.get("embedding_bin")
+    if packed:
+        return decode(packed)
+    emb = row.get("embedding")
+    if emb:
+        return np.asarray(emb, dtype=np.float32)
+    return None
+
+
+def embedding_columns(vec: Sequence[float], codec: str = EMBEDDING_CODEC) -> Dict[str, Any]:
+    """Column values to write for `vec` under `codec` (JSON column cleared when packing)."""
+    if codec == "json":
+        return {"embedding": np.asarray(vec, dtype=np.float64).tolist()}
+    return {"embedding_bin": encode(vec, codec), "embedding": None}
+
+
+def read_columns(codec: str = EMBEDDING_CODEC) -> str:
+    """Select list for the embedding, keeping the legacy column while rows may still use it."""
+    return "embedding" if codec == "json" else "embedding_bin, embedding"
+
+
+def resolve_codec(storage, codec: str = EMBEDDING_CODEC) -> str:
+    """
+    `codec` if the database can hold it, else "json": a packed codec is only
+    used once a read of 'embedding_bin' succeeds.
+    """
+    if codec == "json":
+        return codec
+    if codec not in _TAGS:
+        raise ValueError(f"unknown embedding codec {codec!r}; expected 'json' or one of {CODECS}")
+    try:
+        storage.centroid_rows("workstreams", "id, embedding_bin", limit=1)
+        return codec
+    except Exception as e:
+        print(f"(CAN.e) EMBEDDING_CODEC={codec} but 'embedding_bin' isn't readable ({e}); "
+              "using JSON embeddings (run sql/add_embedding_bin.sql).")
+        return "json"
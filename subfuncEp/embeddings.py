@@ -2,20 +2,42 @@
 import os
 from openai import OpenAI
 from typing import List
+from subfuncsChecks.rate_limiter import call_openai, estimate_tokens
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 EMBEDDING_MODEL = "text-embedding-3-small"
 
 def get_embedding(text: str) -> List[float]:
     text = (text or "").strip()
     if not text:
         return []
-    resp = client.embeddings.create(
+    resp = call_openai(
+        client.embeddings.create,
+        est_tokens=estimate_tokens(text, max_output=0),
+        stage="embedding",
         model=EMBEDDING_MODEL,
         input=text,
     )
     return resp.data[0].embedding
 
+def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """One request for several texts; [] in place of any empty text."""
+    idx = [i for i, t in enumerate(texts) if (t or "").strip()]
+    out: List[List[float]] = [[] for _ in texts]
+    if not idx:
+        return out
+    inputs = [texts[i].strip() for i in idx]
+    resp = call_openai(
+        client.embeddings.create,
+        est_tokens=estimate_tokens("".join(inputs), max_output=0),
+        stage="embedding",
+        model=EMBEDDING_MODEL,
+        input=inputs,
+    )
+    for d in resp.data:
+        out[idx[d.index]] = d.embedding
+    return out
+
 def cosine_similarity(a: List[float], b: List[float]) -> float:
     if not a or not b or len(a) != len(b):
         return 0.0
@@ -0,0 +1,29 @@
+# episode_rules.py
+"""
+The episode boundary rule, kept free of client imports so the offline
+sweep's worker processes (subfuncEp/episode_sweep.py) can load it cheaply.
+"""
+
+SAME_EPISODE_THRESHOLD = 0.7   # coherence score >= this → same episode
+MIN_SWITCH_SCREENS     = 3     # need this many consecutive low-coherence screens to declare a new episode
+
+
+def decide(
+    score: float,
+    n_pending: int,
+    threshold: float = SAME_EPISODE_THRESHOLD,
+    min_switch: int = MIN_SWITCH_SCREENS,
+) -> str:
+    """
+    What a screenshot with coherence `score` does, given `n_pending`
+    low-coherence screenshots already buffered:
+
+        "extend"  joins the current episode (the buffer was a detour and folds in)
+        "buffer"  waits in the buffer as possible evidence of a switch
+        "switch"  closes the episode; buffer + this screenshot start the next one
+    """
+    if score >= threshold:
+        return "extend"
+    if n_pending + 1 < min_switch:
+        return "buffer"
+    return "switch"
@@ -0,0 +1,263 @@
+# episode_sweep.py
+"""
+Offline re-episodization: replay stored screenshots through the episode
+boundary rule (episode_rules.decide) for a grid of thresholds, without
+calling the API, and compare each setting with the stored 'episodes'.
+
+    python -m subfuncEp.episode_sweep [--days 30] [--thresholds 0.5 0.6 0.7 0.8] [--min-switch 2 3 4]
+    python -m subfuncEp.episode_sweep --scorer local --json sweep.json
+
+Coherence for a (screenshot, episode) pair comes from:
+  - "cached": the GPT score logged in 'coherence_labels' for that
+    screenshot against an episode with the same start time (what the live
+    episoder asked when its episode matched the replayed one);
+  - "local": a proxy on the canonical ids — the share of the episode's
+    last LOCAL_WINDOW screenshots on the same deliverable (weight 0.6) and
+    workstream (0.4);
+  - "auto" (default): cached where available, else local.
+
+History is loaded once; each grid point replays it in a worker process.
+The replay is a pure function of (rows, scores, threshold, min_switch),
+so a month of screenshots runs in well under a second per grid point.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from subfuncEp.episode_rules import MIN_SWITCH_SCREENS, SAME_EPISODE_THRESHOLD, decide
+
+LOCAL_WINDOW = 20
+DELIVERABLE_WEIGHT = 0.6
+SCORERS = ("auto", "cached", "local")
+
+# one screenshot: (iso timestamp, deliverable_id, workstream_id)
+Shot = Tuple[str, int, int]
+
+
+def _iso(ts: str) -> str:
+    """'YYYY-MM-DD_HH-MM-SS' → 'YYYY-MM-DDTHH:MM:SS' (episode_start_time format)."""
+    return ts[:10] + "T" + ts[11:].replace("-", ":")
+
+
+def _id(v: Any) -> int:
+    return int(v) if isinstance(v, int) and v >= 0 else -1
+
+
+# ---------- Replay ----------------------------------------------------------
+
+class _Window:
+    """Last LOCAL_WINDOW screenshots of an episode, with id counts for the local proxy."""
+
+    def __init__(self):
+        self.shots: deque = deque()
+        self.deliverables: Dict[int, int] = {}
+        self.workstreams: Dict[int, int] = {}
+
+    def add(self, shot: Shot) -> None:
+        self.shots.append(shot)
+        self.deliverables[shot[1]] = self.deliverables.get(shot[1], 0) + 1
+        self.workstreams[shot[2]] = self.workstreams.get(shot[2], 0) + 1
+        if len(self.shots) > LOCAL_WINDOW:
+            old = self.shots.popleft()
+            self.deliverables[old[1]] -= 1
+            self.workstreams[old[2]] -= 1
+
+    def local_score(self, shot: Shot) -> float:
+        n = len(self.shots)
+        if not n:
+            return 1.0
+        same_dv = self.deliverables.get(shot[1], 0) if shot[1] >= 0 else 0
+        same_ws = self.workstreams.get(shot[2], 0) if shot[2] >= 0 else 0
+        return (DELIVERABLE_WEIGHT * same_dv + (1 - DELIVERABLE_WEIGHT) * same_ws) / n
+
+
+def replay(
+    shots: Sequence[Shot],
+    cached: Dict[Tuple[str, str], float],
+    threshold: float,
+    min_switch: int,
+    scorer: str = "auto",
+) -> Tuple[List[int], int]:
+    """
+    Run the episoder's boundary rule over `shots` (timestamp order).
+    Returns (index of each episode's first screenshot, number of scores
+    taken from the cache).
+    """
+    starts: List[int] = []
+    hits = 0
+    window: Optional[_Window] = None
+    ep_start = ""
+    pending: List[int] = []
+    for i, shot in enumerate(shots):
+        if window is None:
+            window, ep_start = _Window(), shot[0]
+            window.add(shot)
+            starts.append(i)
+            continue
+
+        score = cached.get((shot[0], ep_start)) if scorer != "local" else None
+        if score is not None:
+            hits += 1
+        elif scorer == "cached":
+            score = 1.0        # like the live fallback: no judgment → same episode
+        else:
+            score = window.local_score(shot)
+
+        action = decide(score, len(pending), threshold, min_switch)
+        if action == "extend":
+            for j in pending:
+                window.add(shots[j])
+            pending = []
+            window.add(shot)
+        elif action == "buffer":
+            pending.append(i)
+        else:
+            pending.append(i)
+            window, ep_start = _Window(), shots[pending[0]][0]
+            for j in pending:
+                window.add(shots[j])
+            starts.append(pending[0])
+            pending = []
+    return starts, hits
+
+
+# ---------- Metrics ---------------------------------------------------------
+
+def _summary(shots: Sequence[Shot], starts: List[int], stored_starts: set) -> Dict[str, Any]:
+    n = len(shots)
+    bounds = np.asarray(starts + [n])
+    lengths = np.diff(bounds) if len(starts) else np.zeros(0, int)
+    secs = np.array([
+        (datetime.fromisoformat(shots[e - 1][0]) - datetime.fromisoformat(shots[s][0])).total_seconds()
+        for s, e in zip(bounds[:-1], bounds[1:])
+    ]) if len(starts) else np.zeros(0)
+
+    # boundary agreement with the stored episodes (the first start is never a decision)
+    ours = {shots[s][0] for s in starts[1:]}
+    theirs = {t for t in stored_starts if t > shots[0][0]} if n else set()
+    tp = len(ours & theirs)
+    precision = tp / len(ours) if ours else 1.0
+    recall = tp / len(theirs) if theirs else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "episodes": len(starts),
+        "len_p50": float(np.percentile(lengths, 50)) if len(lengths) else 0.0,
+        "len_p90": float(np.percentile(lengths, 90)) if len(lengths) else 0.0,
+        "minutes_p50": float(np.percentile(secs, 50)) / 60 if len(secs) else 0.0,
+        "minutes_p90": float(np.percentile(secs, 90)) / 60 if len(secs) else 0.0,
+        "boundary_precision": precision,
+        "boundary_recall": recall,
+        "boundary_f1": f1,
+    }
+
+
+# ---------- Worker processes ------------------------------------------------
+
+_SHOTS: Sequence[Shot] = ()
+_CACHED: Dict[Tuple[str, str], float] = {}
+_STORED: set = set()
+
+
+def _init(shots, cached, stored) -> None:
+    global _SHOTS, _CACHED, _STORED
+    _SHOTS, _CACHED, _STORED = shots, cached, stored
+
+
+def _run_point(point: Tuple[float, int, str]) -> Dict[str, Any]:
+    threshold, min_switch, scorer = point
+    t0 = time.perf_counter()
+    starts, hits = replay(_SHOTS, _CACHED, threshold, min_switch, scorer)
+    out = {"threshold": threshold, "min_switch": min_switch, "cache_hits": hits}
+    out.update(_summary(_SHOTS, starts, _STORED))
+    out["seconds"] = time.perf_counter() - t0
+    return out
+
+
+def sweep(
+    shots: Sequence[Shot],
+    cached: Dict[Tuple[str, str], float],
+    stored_starts: set,
+    thresholds: Sequence[float],
+    min_switches: Sequence[int],
+    scorer: str = "auto",
+    workers: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    grid = [(t, m, scorer) for t in thresholds for m in min_switches]
+    workers = workers or min(len(grid), os.cpu_count() or 1)
+    if workers <= 1:
+        _init(shots, cached, stored_starts)
+        return [_run_point(p) for p in grid]
+    # history is shipped to each worker once, not per grid point
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(shots, cached, stored_starts)) as pool:
+        return list(pool.map(_run_point, grid))
+
+
+# ---------- Loading ---------------------------------------------------------
+
+def load_history(days: int) -> Tuple[List[Shot], Dict[Tuple[str, str], float], set]:
+    from storage import read_all
+    from storage_client import storage
+
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    rows = read_all(lambda limit, offset: storage.screenshots_since(since, limit=limit, offset=offset))
+    shots = [
+        (_iso(r["timestamp"]), _id(r.get("deliverable_id")), _id(r.get("workstream_id")))
+        for r in rows
+        if r.get("timestamp")
+    ]
+    shots.sort()
+    cached: Dict[Tuple[str, str], float] = {}
+    for lab in read_all(lambda limit, offset: storage.coherence_labels_since(since, limit=limit, offset=offset)):
+        ts, ep = lab.get("screenshot_timestamp"), lab.get("episode_start_time")
+        if ts and ep and lab.get("coherence_score") is not None:
+            cached[(_iso(ts), ep[:19])] = float(lab["coherence_score"])
+    episodes = read_all(lambda limit, offset: storage.episodes_since(since, limit=limit, offset=offset))
+    stored = {e["start_time"][:19] for e in episodes if e.get("start_time")}
+    return shots, cached, stored
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    ap.add_argument("--min-switch", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    ap.add_argument("--scorer", choices=SCORERS, default="auto")
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--json", help="write the results here")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    shots, cached, stored = load_history(args.days)
+    print(f"(SWP) {len(shots)} screenshots, {len(cached)} cached judgments, {len(stored)} stored episodes "
+          f"over {args.days} days (loaded in {time.perf_counter() - t0:.1f}s)")
+    if not shots:
+        return
+
+    t0 = time.perf_counter()
+    results = sweep(shots, cached, stored, args.thresholds, args.min_switch, args.scorer, args.workers)
+    print(f"(SWP) {len(results)} settings in {time.perf_counter() - t0:.1f}s\n")
+
+    print(f"  {'thresh':>6} {'min':>4} {'episodes':>9} {'len p50':>8} {'len p90':>8} "
+          f"{'min p50':>8} {'min p90':>8} {'prec':>6} {'recall':>6} {'f1':>6} {'cached':>7}")
+    for r in results:
+        live = r["threshold"] == SAME_EPISODE_THRESHOLD and r["min_switch"] == MIN_SWITCH_SCREENS
+        print(f"{'*' if live else ' '} {r['threshold']:>6.2f} {r['min_switch']:>4} {r['episodes']:>9} "
+              f"{r['len_p50']:>8.0f} {r['len_p90']:>8.0f} {r['minutes_p50']:>8.1f} {r['minutes_p90']:>8.1f} "
+              f"{r['boundary_precision']:>6.2f} {r['boundary_recall']:>6.2f} {r['boundary_f1']:>6.2f} "
+              f"{r['cache_hits']:>7}")
+    print("\n* = current SAME_EPISODE_THRESHOLD / MIN_SWITCH_SCREENS")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,52 @@
 # episoder.py
 from __future__ import annotations
-from dataclasses import dataclass, field
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Callable, Deque, Dict, Any, List, Optional, Tuple
 import json
 import os
+import threading
 from openai import OpenAI
 
 
-from supabase_client import supabase
+from storage_client import storage
+from subfuncEp.descriptors import compile_coherence_prompt, count_tokens
+from subfuncEp.episode_rules import MIN_SWITCH_SCREENS, SAME_EPISODE_THRESHOLD, decide
+from subfuncEp.transition_cache import get_transition_cache
+from subfuncsChecks.rate_limiter import call_openai
+import telemetry
 
 # ---------- Config ----------------------------------------------------------
 
-SAME_EPISODE_THRESHOLD = 0.7   # coherence score >= this → same episode
-MIN_SWITCH_SCREENS     = 3     # need this many consecutive low-coherence screens to declare a new episode
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# SAME_EPISODE_THRESHOLD / MIN_SWITCH_SCREENS and the decision rule live in episode_rules.py
+COHERENCE_WORKERS      = 4     # concurrent coherence requests (the shared rate limiter still applies)
+TRANSITION_CACHE       = True  # answer structurally repeated transitions from past verdicts (transition_cache.py)
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+COHERENCE_SYSTEM_PROMPT = (
+    "You judge whether a new computer activity belongs to the same work session as an ongoing episode: "
+    "a sustained attempt at one task or deliverable (one assignment, pitch deck, feature, bugfix, report). "
+    "Score 0-1: 1 = clearly the same task, even via a different app; 0 = clearly unrelated; "
+    "values in between express uncertainty. Use < 0.3 when the new activity obviously pursues a different "
+    "task/deliverable, > 0.7 when it clearly supports the same one. "
+    "Episode and screenshot are compact JSON; absent fields are unknown."
+)
+COHERENCE_SYSTEM_TOKENS = count_tokens(COHERENCE_SYSTEM_PROMPT)
+COHERENCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "coherence": {
+            "type": "number",
+            "minimum": 0.0,
+            "maximum": 1.0,
+            "description": "Coherence score between 0 and 1.",
+        }
+    },
+    "required": ["coherence"],
+    "additionalProperties": False,
+}
 
 
 # ---------- Helpers ---------------------------------------------------------
@@ -119,7 +151,7 @@ def _log_coherence_label(
         "screenshot_descriptor": screenshot_descriptor,
     }
     try:
-        resp = supabase.table("coherence_labels").insert(row).execute()
+        storage.insert_coherence_label(row)
         print(f"(COH.✓) Logged coherence label")
     except Exception as e:
         print(f"(COH.e) Failed to insert coherence label: {e}")
@@ -190,6 +222,9 @@ class EpisodeState:
 current_episode: Optional[EpisodeState] = None
 pending_buffer: List[Dict[str, Any]] = []   # low-coherence screenshots waiting to see if they form a new episode
 
+# called with each episode once it is stored (e.g. backfill checkpoints its rows)
+episode_flush_listeners: List[Callable[[EpisodeState], None]] = []
+
 
 # ---------- Coherence function placeholder ----------------------------------
 
@@ -199,29 +234,28 @@ def coherence_with_episode(episode: EpisodeState, shot_row: Dict[str, Any]) -> f
 
     1. Build an 'episode descriptor' (archetype) from EpisodeState.
     2. Build a screenshot descriptor from the new screenshot.
-    3. Ask GPT to judge coherence in [0,1].
-    4. Log the pair + score to 'coherence_labels' for future training.
+    3. If past verdicts on this transition are settled, return theirs.
+    4. Otherwise ask GPT to judge coherence in [0,1].
+    5. Log the pair + score to 'coherence_labels' for future training.
     """
     episode_desc = _build_episode_descriptor(episode)
     shot_desc = _build_screenshot_descriptor(shot_row)
 
-    # JSON schema for the response
-    json_schema = {
-        "type": "object",
-        "properties": {
-            "coherence": {
-                "type": "number",
-                "minimum": 0.0,
-                "maximum": 1.0,
-                "description": "Coherence score between 0 and 1.",
-            }
-        },
-        "required": ["coherence"],
-        "additionalProperties": False,
-    }
+    if TRANSITION_CACHE:
+        cached = get_transition_cache().lookup(episode_desc, shot_desc)
+        if cached is not None:
+            print(f"(COH) coherence_with_episode => {cached:.3f} (transition cache)")
+            return max(0.0, min(1.0, cached))
+
+    # compact, budgeted text; the episode prefix stays byte-identical across
+    # consecutive calls so it follows the static system prompt in the cache
+    episode_text, shot_text = compile_coherence_prompt(episode_desc, shot_desc)
 
     try:
-        resp = client.chat.completions.create(
+        resp = call_openai(
+            client.chat.completions.create,
+            est_tokens=count_tokens(episode_text + shot_text) + COHERENCE_SYSTEM_TOKENS + 20,
+            stage="coherence",
             model="gpt-4o-mini",
             temperature=0,
             seed=42,
@@ -229,40 +263,17 @@ def coherence_with_episode(episode: EpisodeState, shot_row: Dict[str, Any]) -> f
                 "type": "json_schema",
                 "json_schema": {
                     "name": "CoherenceJudgment",
-                    "schema": json_schema,
+                    "schema": COHERENCE_SCHEMA,
                     "strict": True,
                 },
             },
             messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You judge whether a new computer activity belongs to the same work session "
-                        "as an ongoing episode.\n"
-                        "A 'work session' means a sustained attempt to make progress on the same task or deliverable "
-                        "(e.g. one assignment, one pitch deck, one feature, one bugfix, one report).\n"
-                        "Return a coherence score in [0,1], where 1 means clearly the same work session/task, "
-                        "and 0 means clearly unrelated. Intermediate values (e.g. 0.3, 0.7) reflect uncertainty.\n"
-                        "Be conservative: if the new activity obviously pursues a different task/deliverable, "
-                        "use a low score (< 0.3). If it clearly supports the same task (even via a different app), "
-                        "use a high score (> 0.7)."
-                    ),
-                },
+                {"role": "system", "content": COHERENCE_SYSTEM_PROMPT},
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "text",
-                            "text": (
-                                "Ongoing episode (summary as JSON):\n"
-                                f"{json.dumps(episode_desc, ensure_ascii=False, indent=2)}\n\n"
-                                "New activity (screenshot summary as JSON):\n"
-                                f"{json.dumps(shot_desc, ensure_ascii=False, indent=2)}\n\n"
-                                "Question: On a scale from 0 to 1, how coherent is the new activity with the ongoing episode, "
-                                "interpreting 'coherent' as 'part of the same work session or task'?\n"
-                                "Return ONLY JSON of the form: {\"coherence\": number_between_0_and_1}."
-                            ),
-                        }
+                        {"type": "text", "text": episode_text},
+                        {"type": "text", "text": shot_text},
                     ],
                 },
             ],
@@ -272,14 +283,17 @@ def coherence_with_episode(episode: EpisodeState, shot_row: Dict[str, Any]) -> f
         data = json.loads(raw)
         score = float(data["coherence"])
 
-        # log for training
+        # log for training, and for the transition cache
         _log_coherence_label(episode, shot_row, score, episode_desc, shot_desc)
+        if TRANSITION_CACHE:
+            get_transition_cache().learn(episode_desc, shot_desc, score)
 
         print(f"(COH) coherence_with_episode => {score:.3f}")
         return max(0.0, min(1.0, score))
 
     except Exception as e:
         print(f"(COH.e) GPT coherence judgment failed: {e}")
+        telemetry.inc("coherence_fallbacks_total")
         # Fallback: treat as same episode to avoid oversplitting on errors
         return 1.0
 
@@ -293,10 +307,17 @@ def _flush_episode_to_db(ep: EpisodeState) -> None:
     """
     row = ep.to_db_row_format()
     try:
-        resp = supabase.table("episodes").insert(row).execute()
+        with telemetry.span("episode_flush"):
+            resp = storage.insert_episode(row)
         print(f"(EPI.✓) Flushed episode: {resp}")
     except Exception as e:
-        print(f"(EPI.e) Supabase insert to 'episodes' failed: {e}")
+        print(f"(EPI.e) insert to 'episodes' failed: {e}")
+        return
+    for listener in list(episode_flush_listeners):
+        try:
+            listener(ep)
+        except Exception as e:
+            print(f"(EPI.e) episode flush listener failed: {e}")
 
 
 def _start_new_episode_from_rows(rows: List[Dict[str, Any]]) -> EpisodeState:
@@ -314,19 +335,160 @@ def _start_new_episode_from_rows(rows: List[Dict[str, Any]]) -> EpisodeState:
 def advance_episoder(shot_row: Dict[str, Any]) -> None:
     """
     Main entrypoint. Call this once for each screenshot row you insert into 'screenshots'.
+    Blocks until the row is committed; see advance_episoder_async for the
+    non-blocking form the live loop uses.
 
     Expected keys in shot_row:
         - 'timestamp': 'YYYY-MM-DD_HH-MM-SS'
         - plus anything else your coherence model later needs (project_label, goal_type, etc.).
     """
-    global current_episode, pending_buffer
+    advance_episoder_async(shot_row).result()
+
+
+# ---------- Speculative scoring ---------------------------------------------
+#
+# Rows are scored as soon as they arrive, on a small pool, against the
+# episode as committed at that moment; while a switch is building up
+# (pending_buffer non-empty) they are also scored against the tentative
+# episode the buffer would become. Decisions are committed strictly in
+# submission (timestamp) order as results land. At commit the speculation
+# is checked: a score against the still-current episode or, after a
+# switch, against the tentative episode that became current is used as
+# is; anything else (e.g. the first row after an unforeseen switch) is
+# re-scored before the queue moves on.
+
+class _Job:
+    def __init__(self, row: Dict[str, Any], done: Future):
+        self.row = row
+        self.done = done
+        self.episode: Optional[EpisodeState] = None     # committed episode it was scored against
+        self.main: Optional[Future] = None
+        self.tentative_first: Optional[str] = None       # first timestamp of the tentative episode
+        self.tentative: Optional[Future] = None
+
+    def ready(self) -> bool:
+        return all(f is None or f.done() for f in (self.main, self.tentative))
+
+
+# guards current_episode / pending_buffer / the queue below; rows may be
+# submitted from any thread (see subfuncEp/reorder.py for putting
+# concurrent workers' rows back in order)
+_state_lock = threading.RLock()
+_inflight: Deque[_Job] = deque()
+_last_queued: Optional[str] = None    # timestamp of the newest row accepted
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=COHERENCE_WORKERS, thread_name_prefix="coherence")
+    return _executor
+
+
+def _snapshot(ep: EpisodeState) -> EpisodeState:
+    """Copy safe to read on a worker while the committed episode keeps growing."""
+    return replace(
+        ep,
+        screenshot_ids=list(ep.screenshot_ids),
+        screenshot_rows=list(ep.screenshot_rows),
+        workstream_labels=list(ep.workstream_labels),
+        deliverable_labels=list(ep.deliverable_labels),
+        goal_types=list(ep.goal_types),
+        work_types=list(ep.work_types),
+        apps=list(ep.apps),
+    )
 
-    ts_str = shot_row.get("timestamp")
-    if not ts_str:
+
+def _submit_main(job: _Job, ep: EpisodeState) -> None:
+    job.episode = ep
+    job.main = _pool().submit(coherence_with_episode, _snapshot(ep), job.row)
+    job.main.add_done_callback(lambda _f: _drain())
+
+
+def advance_episoder_async(shot_row: Dict[str, Any]) -> Future:
+    """
+    Queue a screenshot row for episoding and return at once. Coherence
+    requests start immediately; the returned future resolves once the row's
+    decision has been committed (rows commit in the order submitted).
+    """
+    done: Future = Future()
+    if not shot_row.get("timestamp"):
         print("(EPI.e) screenshot row missing 'timestamp'; skipping episoding.")
-        return
+        telemetry.inc("screenshot_skips_total", reason="missing_timestamp")
+        done.set_result(None)
+        return done
+
+    global _last_queued
+    with _state_lock:
+        ts = shot_row["timestamp"]
+        if _last_queued is not None and ts < _last_queued:
+            # the episode state machine can't go back in time
+            print(f"(EPI.e) row {ts} arrived after {_last_queued}; skipping episoding (out of order).")
+            telemetry.inc("screenshot_skips_total", reason="out_of_order")
+            done.set_result(None)
+            return done
+        _last_queued = ts
+        job = _Job(shot_row, done)
+        _inflight.append(job)
+        if current_episode is not None:
+            if pending_buffer:
+                tentative = _start_new_episode_from_rows(pending_buffer)
+                job.tentative_first = tentative.screenshot_rows[0]["timestamp"]
+                job.tentative = _pool().submit(coherence_with_episode, tentative, shot_row)
+                job.tentative.add_done_callback(lambda _f: _drain())
+            _submit_main(job, current_episode)
+        else:
+            _drain()
+    return done
+
+
+def _drain() -> None:
+    """Commit every finished job at the head of the queue."""
+    with _state_lock:
+        while _inflight and _inflight[0].ready():
+            job = _inflight[0]
+            try:
+                score = _speculated_score(job)
+            except Exception as e:
+                score = e
+            if score is None:
+                # speculation missed: score against the episode as it is now,
+                # and resume draining when that lands
+                telemetry.inc("coherence_speculation_total", result="miss")
+                job.tentative = None
+                _submit_main(job, current_episode)
+                return
+            _inflight.popleft()
+            try:
+                _commit(job.row, score)
+            except Exception as e:
+                print(f"(EPI.e) Episoding failed: {e}")
+            finally:
+                job.done.set_result(None)
+
+
+def _speculated_score(job: _Job):
+    """Score to commit `job` with, or None if it was computed against the wrong episode."""
+    if current_episode is None:
+        return 0.0          # unused: the row starts the first episode
+    if job.main is not None and job.episode is current_episode:
+        telemetry.inc("coherence_speculation_total", result="hit")
+        return job.main.result()
+    if job.tentative is not None and current_episode.screenshot_rows[0]["timestamp"] == job.tentative_first:
+        telemetry.inc("coherence_speculation_total", result="tentative_hit")
+        return job.tentative.result()
+    return None
+
+
+def _commit(shot_row: Dict[str, Any], score) -> None:
+    """
+    Apply one row's decision to the committed state. `score` is the
+    coherence with the current episode, or the exception scoring raised.
+    """
+    global current_episode, pending_buffer
 
-    shot_time = _parse_timestamp(ts_str)
+    shot_time = _parse_timestamp(shot_row["timestamp"])
 
     # Case 1: no current episode yet
     if current_episode is None:
@@ -336,22 +498,22 @@ def advance_episoder(shot_row: Dict[str, Any]) -> None:
         print(f"(EPI.1) Started first episode at {shot_time}")
         return
 
-    # Case 2: we have an episode; ask coherence model
-    try:
-        score = coherence_with_episode(current_episode, shot_row)
-    except NotImplementedError as e:
+    # Case 2: we have an episode; the coherence model's verdict is in
+    if isinstance(score, NotImplementedError):
         # For now, just attach everything to one long episode so the rest of the app works.
-        print(f"(EPI.warn) {e} – defaulting to single growing episode.")
+        print(f"(EPI.warn) {score} – defaulting to single growing episode.")
         current_episode.add_screenshot(shot_row)
         return
-    except Exception as e:
-        print(f"(EPI.e) coherence_with_episode failed: {e}")
+    if isinstance(score, Exception):
+        print(f"(EPI.e) coherence_with_episode failed: {score}")
         # Conservative fallback: treat as same episode
         current_episode.add_screenshot(shot_row)
         return
 
+    action = decide(score, len(pending_buffer))
+
     # High coherence: screenshot belongs to current episode
-    if score >= SAME_EPISODE_THRESHOLD:
+    if action == "extend":
         if pending_buffer:
             # brief detour → treat buffered screenshots as noise inside same episode
             print(
@@ -376,7 +538,7 @@ def advance_episoder(shot_row: Dict[str, Any]) -> None:
         f"(threshold={MIN_SWITCH_SCREENS})."
     )
 
-    if len(pending_buffer) < MIN_SWITCH_SCREENS:
+    if action == "buffer":
         # Not enough evidence to split; keep watching
         return
 
@@ -392,3 +554,40 @@ def advance_episoder(shot_row: Dict[str, Any]) -> None:
         f"(EPI.6) New episode started: start={current_episode.start_time}, "
         f"end={current_episode.end_time}, count={len(current_episode.screenshot_rows)}"
     )
+
+
+def wait_for_episoder(timeout: Optional[float] = None) -> None:
+    """Block until every queued row has been committed."""
+    with _state_lock:
+        last = _inflight[-1].done if _inflight else None
+    if last is not None:
+        last.result(timeout)
+
+
+def episode_stability() -> Tuple[int, int]:
+    """
+    (screenshots in the open episode, low-coherence screenshots buffered
+    toward a possible switch). The capture scheduler slows down on a long
+    stable episode and speeds up while a switch is being decided.
+    """
+    with _state_lock:
+        count = len(current_episode.screenshot_rows) if current_episode is not None else 0
+        return count, len(pending_buffer)
+
+
+def flush_current_episode() -> None:
+    """
+    Close and store whatever episode is open (pending screenshots are folded
+    into it). For batch runs that end, unlike the live loop.
+    """
+    global current_episode, pending_buffer
+
+    wait_for_episoder()
+    with _state_lock:
+        if current_episode is None:
+            return
+        for r in pending_buffer:
+            current_episode.add_screenshot(r)
+        _flush_episode_to_db(current_episode)
+        current_episode = None
+        pending_buffer = []
@@ -0,0 +1,70 @@
+# migrate_embeddings.py
+"""
+Convert workstream/deliverable embeddings from the JSON float column to the
+packed 'embedding_bin' column (run sql/add_embedding_bin.sql first).
+
+    python -m subfuncEp.migrate_embeddings [--codec f32] [--drop-json] [--dry-run]
+
+Rows are walked in id order in batches. Each update is guarded by the
+row's n_points, so a centroid merged by a live agent mid-migration is
+simply re-read and converted on the next pass instead of being clobbered.
+Safe to interrupt and re-run: rows that already have embedding_bin are skipped.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from subfuncEp.embedding_codec import CODECS, EMBEDDING_CODEC, encode
+from storage import CENTROID_TABLES
+from storage_client import storage
+
+
+
+def migrate_table(table: str, codec: str, batch: int, drop_json: bool, dry_run: bool):
+    last_id = 0
+    converted = skipped = raced = 0
+    json_bytes = packed_bytes = 0
+    while True:
+        rows = storage.centroid_rows(table, "id, embedding, embedding_bin, n_points", since_id=last_id, limit=batch)
+        if not rows:
+            break
+        for r in rows:
+            last_id = r["id"]
+            if r.get("embedding_bin") or not r.get("embedding"):
+                skipped += 1
+                continue
+            packed = encode(np.asarray(r["embedding"], dtype=np.float32), codec)
+            json_bytes += len(str(r["embedding"]))
+            packed_bytes += len(packed)
+            if dry_run:
+                converted += 1
+                continue
+            values = {"embedding_bin": packed}
+            if drop_json:
+                values["embedding"] = None
+            if storage.update_centroid_if(table, r["id"], r.get("n_points"), values):
+                converted += 1
+            else:
+                raced += 1
+    return converted, skipped, raced, json_bytes, packed_bytes
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--codec", choices=CODECS, default=EMBEDDING_CODEC if EMBEDDING_CODEC in CODECS else "f32")
+    ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument("--drop-json", action="store_true", help="null the legacy JSON column once packed")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    for table in CENTROID_TABLES:
+        t0 = time.perf_counter()
+        converted, skipped, raced, jb, pb = migrate_table(table, args.codec, args.batch, args.drop_json, args.dry_run)
+        ratio = f", {jb / 1e3:.0f} KB JSON → {pb / 1e3:.0f} KB {args.codec}" if converted else ""
+        print(f"(MIG) {table}: {converted} converted, {skipped} skipped, {raced} changed mid-run "
+              f"(re-run to pick up){ratio} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# reorder.py
+"""
+Reorder buffer between concurrent screenshot workers and the episoder.
+
+The episoder must see rows in timestamp order, but vision + canonicalize
++ insert finish in whatever order the API answers. The capture loop
+reserves a slot per capture (in capture order), workers complete or fail
+their slot from any thread, and rows are handed to the sink strictly in
+slot order as soon as every earlier slot is settled.
+
+A slot nobody settles within `timeout` seconds (a hung or crashed worker)
+is skipped so the rest aren't held back; if its row turns up later it is
+dropped rather than delivered out of order.
+
+    buffer = ReorderBuffer(advance_episoder_async)
+    slot = buffer.reserve(timestamp)          # capture thread, in order
+    ...
+    buffer.complete(slot, row)                # any worker thread
+    buffer.fail(slot)                         # ... or on failure
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import telemetry
+
+SLOT_TIMEOUT = 120.0   # seconds before an unsettled slot is skipped
+
+_FAILED = object()
+
+
+class ReorderBuffer:
+    def __init__(self, sink: Callable[[Dict[str, Any]], Any], timeout: float = SLOT_TIMEOUT):
+        self._sink = sink
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._next_slot = 0           # next slot to hand out
+        self._head = 0                # next slot to release
+        self._rows: Dict[int, Any] = {}            # settled slots: row or _FAILED
+        self._deadlines: Dict[int, float] = {}     # unsettled slots
+        self._labels: Dict[int, str] = {}
+        self._closed = False
+        self._watchdog = threading.Thread(target=self._watch, name="reorder-watchdog", daemon=True)
+        self._watchdog.start()
+        telemetry.gauge("reorder_buffer_depth", lambda: self._next_slot - self._head)
+
+    # -- producers --
+
+    def reserve(self, label: str = "") -> int:
+        """Claim the next slot. Call in timestamp order (the capture loop)."""
+        with self._cond:
+            slot = self._next_slot
+            self._next_slot += 1
+            self._deadlines[slot] = time.monotonic() + self.timeout
+            self._labels[slot] = label
+            self._cond.notify_all()
+            return slot
+
+    def complete(self, slot: int, row: Optional[Dict[str, Any]]) -> None:
+        """Settle `slot` with its row (None counts as a failure)."""
+        self._settle(slot, row if row is not None else _FAILED)
+
+    def fail(self, slot: int) -> None:
+        self._settle(slot, _FAILED)
+
+    def _settle(self, slot: int, value: Any) -> None:
+        with self._cond:
+            if slot < self._head or slot not in self._deadlines:
+                print(f"(ORD.e) slot {slot} {self._labels.get(slot, '')} settled after it was skipped; dropped")
+                telemetry.inc("reorder_late_total")
+                return
+            del self._deadlines[slot]
+            self._rows[slot] = value
+            self._release()
+
+    # -- release --
+
+    def _release(self) -> None:
+        # called with the lock held; the sink runs under it too, so rows
+        # reach it one at a time and in order
+        while self._head in self._rows:
+            value = self._rows.pop(self._head)
+            self._labels.pop(self._head, None)
+            self._head += 1
+            if value is _FAILED:
+                continue
+            try:
+                self._sink(value)
+            except Exception as e:
+                print(f"(EPI.e) Episoding failed: {e}")
+        self._cond.notify_all()
+
+    def _watch(self) -> None:
+        with self._cond:
+            while not self._closed:
+                deadline = self._deadlines.get(self._head)
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    print(f"(ORD.e) slot {self._head} {self._labels.get(self._head, '')} "
+                          f"not settled after {self.timeout:g}s; skipping it")
+                    telemetry.inc("reorder_timeouts_total")
+                    del self._deadlines[self._head]
+                    self._rows[self._head] = _FAILED
+                    self._release()
+                    continue
+                self._cond.wait(None if deadline is None else deadline - now)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every reserved slot is released. False on timeout."""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._head < self._next_slot:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
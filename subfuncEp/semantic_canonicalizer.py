@@ -1,62 +1,358 @@
 # subfuncEp/semantic_canonicalizer.py (embedding-based)
-from typing import Tuple, List
-from supabase_client import supabase
-from embeddings import get_embedding, cosine_similarity
+import atexit
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple, List
+
+import numpy as np
+
+from storage_client import storage
+from subfuncEp.ann_index import ANN_BACKEND, load_index, make_index
+from subfuncEp.embedding_codec import embedding_columns, read_columns, resolve_codec, row_embedding
+from subfuncEp.embeddings import get_embedding, get_embeddings
+import telemetry
 
 WORKSTREAM_SIM_THRESHOLD = 0.80
 DELIVERABLE_SIM_THRESHOLD = 0.85
 
-def _update_centroid(old_emb: List[float], old_n: int, new_emb: List[float]) -> List[float]:
-    if not old_emb or old_n <= 0:
-        return new_emb
-    if len(old_emb) != len(new_emb):
-        return new_emb
-    n = float(old_n)
-    return [(old_emb[i] * n + new_emb[i]) / (n + 1.0) for i in range(len(new_emb))]
+# write-behind centroid updates: matches accumulate locally and are merged
+# server-side by sql/merge_centroid_delta.sql (JSON embeddings), or by a
+# compare-and-set on n_points for packed ones (see embedding_codec.py)
+CENTROID_FLUSH_SECONDS = 60.0
+CENTROID_FLUSH_EVERY = 50       # pending matches that force an early flush
+DELTA_DECIMALS = 7              # rounding for the uploaded sum vectors
+CAS_RETRIES = 5                 # compare-and-set attempts per centroid per flush
 
-def canonicalize_workstream(raw_label: str, semantic_summary: str) -> Tuple[int, str]:
-    raw_label = raw_label or "unknown workstream"
-    text_for_embed = f"{semantic_summary} | workstream: {raw_label}"
-    emb = get_embedding(text_for_embed)
-
-    resp = supabase.table("workstreams").select(
-        "id, canonical_label, embedding, n_points"
-    ).execute()
-    rows = resp.data or []
-
-    best_id = None
-    best_label = None
-    best_score = 0.0
-    best_emb = None
-    best_n = 0
-
-    for r in rows:
-        existing_emb = r.get("embedding") or []
-        if not existing_emb:
-            continue
-        score = cosine_similarity(emb, existing_emb)
-        if score > best_score:
-            best_score = score
-            best_id = r["id"]
-            best_label = r["canonical_label"]
-            best_emb = existing_emb
-            best_n = r.get("n_points", 0) or 0
+# nearest-centroid lookups go through an in-process ANN index per table
+# (per workstream for deliverables), snapshotted under ANN_DIR
+ANN_DIR = "raw/ann"
+INDEX_RESYNC_SECONDS = 3600.0   # full re-read, to pick up other agents' centroid merges
+SYNC_PAGE = 500                 # centroid rows per read (PostgREST caps a response at 1000)
 
-    if best_id is not None and best_score >= WORKSTREAM_SIM_THRESHOLD:
-        new_centroid = _update_centroid(best_emb, best_n, emb)
+# sticky fast path (canonicalize): a screenshot whose workstream embedding is
+# within STICKY_RADIUS (cosine) of the previous one's reuses its ids
+STICKY_RADIUS = 0.95
+STICKY_MAX_RUN = 30             # full search at least this often; deferred updates apply then
+
+_codec: Optional[str] = None
+
+
+def codec() -> str:
+    """EMBEDDING_CODEC, or "json" if the database has no 'embedding_bin' column (checked once)."""
+    global _codec
+    if _codec is None:
+        _codec = resolve_codec(storage)
+    return _codec
+
+
+class CentroidDeltas:
+    """
+    Per-(table, id) running sum and count of matched embeddings that
+    haven't been merged into the DB centroid yet.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sums: Dict[Tuple[str, int], np.ndarray] = {}
+        self._counts: Dict[Tuple[str, int], int] = {}
+        self._n_pending = 0
+        self._last_flush = time.monotonic()
+        self._rpc_available = True
+
+    def add(self, table: str, row_id: int, emb: List[float]) -> None:
+        key = (table, row_id)
+        vec = np.asarray(emb, dtype=np.float64)
+        with self._lock:
+            if key in self._sums and self._sums[key].shape == vec.shape:
+                self._sums[key] += vec
+                self._counts[key] += 1
+            else:
+                self._sums[key] = vec.copy()
+                self._counts[key] = 1
+            self._n_pending += 1
+            due = (
+                self._n_pending >= CENTROID_FLUSH_EVERY
+                or time.monotonic() - self._last_flush >= CENTROID_FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def effective(self, table: str, row_id: int, emb: np.ndarray, n: int) -> Tuple[np.ndarray, int]:
+        """
+        The row's centroid and count with not-yet-flushed matches folded in,
+        so matching sees the same centroid it would after a flush.
+        """
+        with self._lock:
+            delta = self._sums.get((table, row_id))
+            count = self._counts.get((table, row_id), 0)
+            if delta is None:
+                return emb, n
+            delta = delta.copy()
+        if emb is None or n <= 0 or len(emb) != len(delta):
+            return delta / count, count
+        return (np.asarray(emb, dtype=np.float64) * n + delta) / (n + count), n + count
+
+    def flush(self) -> None:
+        with self._lock:
+            sums, counts = self._sums, self._counts
+            self._sums, self._counts = {}, {}
+            self._n_pending = 0
+            self._last_flush = time.monotonic()
+        failed = []
+        with telemetry.span("centroid_flush"):
+            for key, total in sums.items():
+                try:
+                    self._merge(key[0], key[1], total, counts[key])
+                except Exception as e:
+                    print(f"(CAN.e) centroid merge for {key[0]} #{key[1]} failed, will retry: {e}")
+                    failed.append(key)
+        telemetry.inc("centroid_merges_total", len(sums) - len(failed))
+        if failed:
+            # put them back, on top of anything that arrived meanwhile
+            with self._lock:
+                for key in failed:
+                    if key in self._sums:
+                        self._sums[key] += sums[key]
+                        self._counts[key] += counts[key]
+                    else:
+                        self._sums[key] = sums[key]
+                        self._counts[key] = counts[key]
+                    self._n_pending += counts[key]
+
+    def _merge(self, table: str, row_id: int, total: np.ndarray, count: int) -> None:
+        if codec() == "json" and self._rpc_available:
+            try:
+                storage.merge_centroid_delta(table, row_id, np.round(total, DELTA_DECIMALS).tolist(), count)
+                return
+            except NotImplementedError as e:
+                # no server-side merge (function not deployed, or a local backend)
+                print(f"(CAN.e) {e}; falling back to compare-and-set updates.")
+                self._rpc_available = False
+        self._merge_cas(table, row_id, total, count)
+
+    def _merge_cas(self, table: str, row_id: int, total: np.ndarray, count: int) -> None:
+        """
+        Read-merge-write guarded by n_points: the update only applies if
+        nobody merged since our read (n_points only ever grows), else retry.
+        """
+        for _ in range(CAS_RETRIES):
+            row = storage.get_centroid(table, row_id, f"{read_columns(codec())}, n_points")
+            if row is None:
+                return
+            emb = row_embedding(row)
+            n = row.get("n_points", 0) or 0
+            if emb is not None and n > 0 and len(emb) == len(total):
+                merged = (emb.astype(np.float64) * n + total) / (n + count)
+            else:
+                merged = total / count
+            values = embedding_columns(np.round(merged, DELTA_DECIMALS), codec())
+            values["n_points"] = n + count
+            if storage.update_centroid_if(table, row_id, row.get("n_points"), values):
+                return
+            telemetry.inc("centroid_merge_conflicts_total", table=table)
+        raise RuntimeError(f"centroid for {table} #{row_id} kept changing under us")
+
+
+centroid_deltas = CentroidDeltas()
+atexit.register(centroid_deltas.flush)
+
+
+def flush_centroids() -> None:
+    """Merge every pending centroid delta into the DB now."""
+    centroid_deltas.flush()
+
+
+class CanonicalIndex:
+    """
+    ANN view of one table's centroids. New rows (from this or any other
+    agent) are pulled incrementally by id; a full re-read every
+    INDEX_RESYNC_SECONDS picks up centroids merged elsewhere.
+
+    Each centroid is kept as a unit vector plus the norm of its unnormalized
+    sum (`mass`), so folding in a match is exact without the DB row.
+    """
+
+    def __init__(self, table: str, group_col: Optional[str] = None, backend: str = ANN_BACKEND):
+        self.table = table
+        self.group_col = group_col
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._indexes: Dict[Any, Any] = {}      # group → ANN index
+        self._labels: Dict[int, str] = {}
+        self._mass: Dict[int, float] = {}
+        self._group_of: Dict[int, Any] = {}
+        self._dirty = set()
+        self._max_id = 0
+        self._synced_at = 0.0                    # wall clock of the last full read
+        self._loaded = False
+
+    @property
+    def _dir(self) -> str:
+        return os.path.join(ANN_DIR, self.table)
+
+    # -- sync --
+
+    def _index_for(self, group, dim: int):
+        idx = self._indexes.get(group)
+        if idx is None:
+            idx = self._indexes[group] = make_index(self.backend, dim)
+        return idx
+
+    def _put(self, row_id: int, label: str, group, vec: np.ndarray) -> None:
+        mass = float(np.linalg.norm(vec))
+        if mass == 0.0:
+            return
+        self._index_for(group, len(vec)).upsert(row_id, vec)
+        self._labels[row_id] = label
+        self._mass[row_id] = mass
+        self._group_of[row_id] = group
+        self._dirty.add(group)
+
+    def _sync(self) -> None:
+        if not self._loaded:
+            self._loaded = True
+            self._load()
+        full = time.time() - self._synced_at >= INDEX_RESYNC_SECONDS
+        cols = f"id, canonical_label, {read_columns(codec())}, n_points" + (f", {self.group_col}" if self.group_col else "")
+        since = 0 if full else self._max_id
+        while True:
+            rows = storage.centroid_rows(self.table, cols, since_id=since, limit=SYNC_PAGE)
+            for r in rows:
+                since = r["id"]
+                emb = row_embedding(r)
+                if emb is None or emb.size == 0:
+                    continue
+                n = r.get("n_points", 0) or 0
+                # the index holds the sum of member embeddings, pending local deltas included
+                emb, n = centroid_deltas.effective(self.table, r["id"], emb, n)
+                group = r.get(self.group_col) if self.group_col else None
+                self._put(r["id"], r["canonical_label"], group, np.asarray(emb, dtype=np.float32) * max(n, 1))
+                # only advanced by what we read, so rows other agents insert in
+                # between our own inserts still get picked up
+                self._max_id = max(self._max_id, r["id"])
+            if len(rows) < SYNC_PAGE:
+                break
+        if full:
+            self._synced_at = time.time()
+            telemetry.inc("ann_full_syncs_total", table=self.table)
+
+    # -- lookups --
+
+    def nearest(self, emb: List[float], group=None) -> Tuple[Optional[int], Optional[str], float]:
+        with self._lock:
+            self._sync()
+            idx = self._indexes.get(group)
+            hits = idx.search(emb, k=1) if idx is not None else []
+        if not hits:
+            return None, None, 0.0
+        row_id, score = hits[0]
+        return row_id, self._labels[row_id], score
+
+    def add(self, row_id: int, label: str, emb: List[float], group=None) -> None:
+        with self._lock:
+            self._put(row_id, label, group, np.asarray(emb, dtype=np.float32))
+
+    def absorb(self, row_id: int, emb: List[float]) -> None:
+        """Fold a matched embedding into the row's centroid."""
+        with self._lock:
+            group = self._group_of.get(row_id)
+            idx = self._indexes.get(group)
+            if idx is None or row_id not in idx:
+                return
+            total = idx.vector(row_id) * self._mass[row_id] + np.asarray(emb, dtype=np.float32)
+            self._put(row_id, self._labels[row_id], group, total)
+
+    # -- persistence --
+
+    def _group_file(self, group) -> str:
+        return os.path.join(self._dir, f"{'all' if group is None else group}.npz")
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self._dir, exist_ok=True)
+            for group in self._dirty:
+                self._indexes[group].save(self._group_file(group))
+            meta = {
+                "max_id": self._max_id,
+                "synced_at": self._synced_at,
+                "rows": {str(i): [self._labels[i], self._mass[i], self._group_of[i]] for i in self._labels},
+                "groups": [g for g in self._indexes],
+            }
+            tmp = os.path.join(self._dir, "meta.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, os.path.join(self._dir, "meta.json"))
+            self._dirty.clear()
+
+    def _load(self) -> None:
+        path = os.path.join(self._dir, "meta.json")
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+            indexes = {g: load_index(self._group_file(g)) for g in meta["groups"]}
+        except Exception as e:
+            print(f"(CAN.e) ignoring unreadable ANN snapshot in {self._dir}: {e}")
+            return
+        self._indexes = indexes
+        for i, (label, mass, group) in meta["rows"].items():
+            self._labels[int(i)] = label
+            self._mass[int(i)] = mass
+            self._group_of[int(i)] = group
+        self._max_id = meta["max_id"]
+        self._synced_at = meta["synced_at"]
+
+
+workstream_index = CanonicalIndex("workstreams")
+deliverable_index = CanonicalIndex("deliverables", group_col="workstream_id")
+
+
+def _save_indexes() -> None:
+    for idx in (workstream_index, deliverable_index):
         try:
-            supabase.table("workstreams").update(
-                {"embedding": new_centroid, "n_points": best_n + 1}
-            ).eq("id", best_id).execute()
+            idx.save()
         except Exception as e:
-            print(f"(WS.e) Failed to update workstream centroid: {e}")
+            print(f"(CAN.e) saving ANN index for {idx.table} failed: {e}")
+
+
+atexit.register(_save_indexes)
+
+
+def _workstream_text(raw_label: str, semantic_summary: str) -> str:
+    return f"{semantic_summary} | workstream: {raw_label or 'unknown workstream'}"
+
+
+def _deliverable_text(workstream_label: str, raw_label: str, semantic_summary: str) -> str:
+    return f"{semantic_summary} | workstream: {workstream_label} | deliverable: {raw_label or 'unspecified deliverable'}"
+
+
+def canonicalize_workstream(raw_label: str, semantic_summary: str, emb: Optional[List[float]] = None) -> Tuple[int, str]:
+    raw_label = raw_label or "unknown workstream"
+    if emb is None:
+        emb = get_embedding(_workstream_text(raw_label, semantic_summary))
+
+    with telemetry.span("ann_search"):
+        best_id, best_label, best_score = workstream_index.nearest(emb)
+
+    if best_id is not None and best_score >= WORKSTREAM_SIM_THRESHOLD:
+        telemetry.inc("canonical_matches_total", kind="workstream", result="existing")
+        centroid_deltas.add("workstreams", best_id, emb)
+        workstream_index.absorb(best_id, emb)
         return best_id, best_label
 
+    telemetry.inc("canonical_matches_total", kind="workstream", result="new")
     try:
-        ins = supabase.table("workstreams").insert(
-            {"canonical_label": raw_label, "embedding": emb, "n_points": 1}
-        ).execute()
-        new_id = ins.data[0]["id"]
+        ins = storage.insert_centroid(
+            "workstreams", {"canonical_label": raw_label, **embedding_columns(emb, codec()), "n_points": 1}
+        )
+        new_id = ins["id"]
+        workstream_index.add(new_id, raw_label, emb)
         return new_id, raw_label
     except Exception as e:
         print(f"(WS.e) Failed to insert new workstream: {e}")
@@ -69,58 +365,145 @@ def canonicalize_deliverable(
     semantic_summary: str,
 ) -> Tuple[int, str]:
     raw_label = raw_label or "unspecified deliverable"
-    text_for_embed = (
-        f"{semantic_summary} | workstream: {workstream_label} | deliverable: {raw_label}"
-    )
-    emb = get_embedding(text_for_embed)
-
-    resp = (
-        supabase.table("deliverables")
-        .select("id, canonical_label, embedding, n_points")
-        .eq("workstream_id", workstream_id)
-        .execute()
-    )
-    rows = resp.data or []
-
-    best_id = None
-    best_label = None
-    best_score = 0.0
-    best_emb = None
-    best_n = 0
-
-    for r in rows:
-        existing_emb = r.get("embedding") or []
-        if not existing_emb:
-            continue
-        score = cosine_similarity(emb, existing_emb)
-        if score > best_score:
-            best_score = score
-            best_id = r["id"]
-            best_label = r["canonical_label"]
-            best_emb = existing_emb
-            best_n = r.get("n_points", 0) or 0
+    emb = get_embedding(_deliverable_text(workstream_label, raw_label, semantic_summary))
+
+    with telemetry.span("ann_search"):
+        best_id, best_label, best_score = deliverable_index.nearest(emb, group=workstream_id)
 
     if best_id is not None and best_score >= DELIVERABLE_SIM_THRESHOLD:
-        new_centroid = _update_centroid(best_emb, best_n, emb)
-        try:
-            supabase.table("deliverables").update(
-                {"embedding": new_centroid, "n_points": best_n + 1}
-            ).eq("id", best_id).execute()
-        except Exception as e:
-            print(f"(DV.e) Failed to update deliverable centroid: {e}")
+        telemetry.inc("canonical_matches_total", kind="deliverable", result="existing")
+        centroid_deltas.add("deliverables", best_id, emb)
+        deliverable_index.absorb(best_id, emb)
         return best_id, best_label
 
+    telemetry.inc("canonical_matches_total", kind="deliverable", result="new")
     try:
-        ins = supabase.table("deliverables").insert(
+        ins = storage.insert_centroid(
+            "deliverables",
             {
                 "workstream_id": workstream_id,
                 "canonical_label": raw_label,
-                "embedding": emb,
+                **embedding_columns(emb, codec()),
                 "n_points": 1,
-            }
-        ).execute()
-        new_id = ins.data[0]["id"]
+            },
+        )
+        new_id = ins["id"]
+        deliverable_index.add(new_id, raw_label, emb, group=workstream_id)
         return new_id, raw_label
     except Exception as e:
         print(f"(DV.e) Failed to insert deliverable: {e}")
         return -1, raw_label
+
+
+def _sticky_key(raw_label: str) -> str:
+    return " ".join((raw_label or "").split()).casefold()
+
+
+class StickyCanonicalizer:
+    """
+    Fast path for runs of screenshots on one task: when a screenshot names
+    the same deliverable as the previous one and its workstream embedding is
+    within STICKY_RADIUS of the previous screenshot's, it gets the previous
+    workstream/deliverable ids without the deliverable embedding or either
+    ANN search. A new deliverable inside the same workstream always takes
+    the full search, so its embedding never lands in another centroid.
+
+    Centroid updates for those hits are deferred: workstream embeddings are
+    kept, deliverable texts are embedded in one batched request, and both
+    are folded in (centroid_deltas + index) when the run ends, every
+    STICKY_MAX_RUN hits, or at exit. The fold runs on a background thread,
+    off the screenshot's path.
+    """
+
+    def __init__(self, radius: float = STICKY_RADIUS, max_run: int = STICKY_MAX_RUN):
+        self.radius = radius
+        self.max_run = max_run
+        self._lock = threading.Lock()
+        self._prev: Optional[np.ndarray] = None
+        self._ids: Optional[Tuple[int, str, int, str]] = None
+        self._prev_deliverable: Optional[str] = None
+        self._run = 0
+        self._deferred: List[Tuple[int, List[float], int, str]] = []
+        self._flusher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sticky-flush")
+        self.hits = 0
+        self.misses = 0
+
+    def canonicalize(self, raw_workstream: str, raw_deliverable: str, semantic_summary: str) -> Tuple[int, str, int, str]:
+        """(workstream_id, workstream_label, deliverable_id, deliverable_label)."""
+        emb = get_embedding(_workstream_text(raw_workstream, semantic_summary))
+        vec = np.asarray(emb, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        deliverable = _sticky_key(raw_deliverable)
+        with self._lock:
+            prev, ids = self._prev, self._ids
+            sticky = (
+                ids is not None and prev is not None and norm > 0 and len(prev) == len(vec)
+                and deliverable == self._prev_deliverable
+                and self._run < self.max_run
+                and float(vec @ prev) / norm >= self.radius
+            )
+            if sticky:
+                ws_id, ws_label, dv_id, dv_label = ids
+                self._prev = vec / norm
+                self._run += 1
+                self.hits += 1
+                self._deferred.append(
+                    (ws_id, emb, dv_id, _deliverable_text(ws_label, raw_deliverable, semantic_summary))
+                )
+        if sticky:
+            telemetry.inc("canonical_sticky_total", result="hit")
+            return ids
+
+        telemetry.inc("canonical_sticky_total", result="miss")
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        if deferred:
+            self._flusher.submit(self._apply, deferred)
+        ws_id, ws_label = canonicalize_workstream(raw_workstream, semantic_summary, emb=emb)
+        dv_id, dv_label = canonicalize_deliverable(ws_id, ws_label, raw_deliverable, semantic_summary)
+        with self._lock:
+            self.misses += 1
+            self._run = 0
+            # a failed insert (-1) is never reused
+            ok = norm > 0 and ws_id >= 0 and dv_id >= 0
+            self._prev = vec / norm if ok else None
+            self._ids = (ws_id, ws_label, dv_id, dv_label) if ok else None
+            self._prev_deliverable = deliverable if ok else None
+        return ws_id, ws_label, dv_id, dv_label
+
+    def flush(self) -> None:
+        """Apply the updates deferred by the current run now, on this thread."""
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        if deferred:
+            self._apply(deferred)
+
+    def _apply(self, deferred: List[Tuple[int, List[float], int, str]]) -> None:
+        for ws_id, emb, _, _ in deferred:
+            centroid_deltas.add("workstreams", ws_id, emb)
+            workstream_index.absorb(ws_id, emb)
+        try:
+            dv_embs = get_embeddings([text for _, _, _, text in deferred])
+        except Exception as e:
+            print(f"(CAN.e) deferred deliverable embeddings failed; skipping {len(deferred)} updates: {e}")
+            return
+        for (_, _, dv_id, _), emb in zip(deferred, dv_embs):
+            if emb:
+                centroid_deltas.add("deliverables", dv_id, emb)
+                deliverable_index.absorb(dv_id, emb)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / n if n else 0.0,
+                    "deferred": len(self._deferred)}
+
+
+sticky = StickyCanonicalizer()
+# registered last so it runs first: deferred updates reach the deltas and indexes before they're saved
+atexit.register(sticky.flush)
+
+
+def canonicalize(raw_workstream: str, raw_deliverable: str, semantic_summary: str) -> Tuple[int, str, int, str]:
+    """Workstream and deliverable ids/labels for one screenshot, via the sticky fast path."""
+    return sticky.canonicalize(raw_workstream, raw_deliverable, semantic_summary)
@@ -0,0 +1,298 @@
+# transition_cache.py
+"""
+Coherence verdicts remembered per transition, so structurally repeated
+decisions skip the GPT call.
+
+A transition is the episode's dominant (workstream, deliverable,
+app_bucket, work_type) → the new screenshot's, all canonical labels as the
+episoder's descriptors carry them. Verdicts are learned at two levels:
+
+  - exact:      the two 4-tuples as they are ("pitch deck v3 in ide/coding"
+                → "pitch deck v3 in browser/reading");
+  - relational: same/other workstream, same/other deliverable and the two
+                (app_bucket, work_type) pairs, which carries what was
+                learned on one deliverable over to the next ("same
+                deliverable, ide → browser" is almost always coherent,
+                "→ media_player/entertainment" almost never).
+
+Each key keeps exponentially decayed counts (half-life HALF_LIFE_HOURS of
+screenshot time) of verdicts on either side of SAME_EPISODE_THRESHOLD and
+of their scores. A lookup answers when a key has at least MIN_SUPPORT of
+decayed weight with a MIN_AGREE share on one side, exact level first, and
+returns that side's mean score, so episode_rules.decide sees what GPT
+would most likely have said. Keys whose weight decays below EVICT_WEIGHT
+are dropped, and the table is capped at MAX_KEYS (least recently used out),
+so stale patterns expire. AUDIT_RATE of answerable lookups go to GPT
+anyway and keep the table meeting fresh verdicts; answered calls are not
+learned from, nor logged to 'coherence_labels'.
+
+    score = get_transition_cache().lookup(episode_desc, shot_desc)   # float or None
+    get_transition_cache().learn(episode_desc, shot_desc, gpt_score)
+"""
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import telemetry
+from subfuncEp.episode_rules import SAME_EPISODE_THRESHOLD
+
+MIN_SUPPORT = 4.0        # decayed verdicts needed on a key
+MIN_AGREE = 0.9          # share of them on one side of the threshold
+HALF_LIFE_HOURS = 72.0   # a verdict's weight halves over this much screenshot time
+EVICT_WEIGHT = 0.25      # keys lighter than this are forgotten
+MAX_KEYS = 20000
+AUDIT_RATE = 0.05        # share of answerable lookups still sent to GPT
+LEARN_DAYS = 14          # logged verdicts loaded on first use
+SWEEP_EVERY = 500        # learns between eviction sweeps
+
+Key = Tuple[Any, ...]
+
+
+def _norm(v: Any) -> str:
+    return (v or "unknown").strip().lower() if isinstance(v, str) else "unknown"
+
+
+def _side(episode_desc: Dict[str, Any], shot_desc: Dict[str, Any]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    ep = (
+        _norm(episode_desc.get("dominant_workstream_label")),
+        _norm(episode_desc.get("dominant_deliverable_label")),
+        _norm(episode_desc.get("dominant_app_bucket")),
+        _norm(episode_desc.get("dominant_work_type")),
+    )
+    shot = (
+        _norm(shot_desc.get("workstream_label")),
+        _norm(shot_desc.get("deliverable_label")),
+        _norm(shot_desc.get("app_bucket")),
+        _norm(shot_desc.get("work_type")),
+    )
+    return ep, shot
+
+
+def transition_keys(episode_desc: Dict[str, Any], shot_desc: Dict[str, Any]) -> List[Key]:
+    """
+    [exact, relational] keys for an (episode, screenshot) descriptor pair,
+    most specific first. A side whose workstream or deliverable is unknown
+    has no exact key, and the relational one only if the other is known too.
+    """
+    (ews, edv, eapp, ework), (sws, sdv, sapp, swork) = _side(episode_desc, shot_desc)
+    keys: List[Key] = []
+    if "unknown" not in (ews, edv, sws, sdv):
+        keys.append(("x", ews, edv, eapp, ework, sws, sdv, sapp, swork))
+    if "unknown" not in (ews, sws):
+        same_ws = ews == sws
+        same_dv = same_ws and "unknown" not in (edv, sdv) and edv == sdv
+        rel_dv = "same" if same_dv else ("unknown" if "unknown" in (edv, sdv) else "other")
+        keys.append(("r", "same" if same_ws else "other", rel_dv, eapp, ework, sapp, swork))
+    return keys
+
+
+def _hours(ts: Optional[str]) -> Optional[float]:
+    """Hours since the epoch for a 'YYYY-MM-DD_HH-MM-SS' or ISO timestamp."""
+    if not ts:
+        return None
+    for fmt in ("%Y-%m-%d_%H-%M-%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(ts[:19], fmt).timestamp() / 3600.0
+        except ValueError:
+            continue
+    return None
+
+
+class _Entry:
+    __slots__ = ("t", "coh_w", "coh_s", "inc_w", "inc_s")
+
+    def __init__(self, t: float):
+        self.t = t                      # hours, time of the last update
+        self.coh_w = self.coh_s = 0.0   # decayed weight / score sum of coherent verdicts
+        self.inc_w = self.inc_s = 0.0   # ... and of incoherent ones
+
+    def decay_to(self, t: float, half_life: float) -> None:
+        if t > self.t:
+            f = 0.5 ** ((t - self.t) / half_life)
+            self.coh_w *= f
+            self.coh_s *= f
+            self.inc_w *= f
+            self.inc_s *= f
+            self.t = t
+
+    @property
+    def weight(self) -> float:
+        return self.coh_w + self.inc_w
+
+
+class TransitionCache:
+    def __init__(
+        self,
+        min_support: float = MIN_SUPPORT,
+        min_agree: float = MIN_AGREE,
+        half_life_hours: float = HALF_LIFE_HOURS,
+        max_keys: int = MAX_KEYS,
+        audit_rate: float = AUDIT_RATE,
+        threshold: float = SAME_EPISODE_THRESHOLD,
+    ):
+        self.min_support = min_support
+        self.min_agree = min_agree
+        self.half_life = half_life_hours
+        self.max_keys = max_keys
+        self.audit_rate = audit_rate
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._table: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._now = 0.0                 # newest screenshot time seen, hours
+        self._since_sweep = 0
+        self.hits = 0
+        self.misses = 0
+        self.audits = 0
+        self.evicted = 0
+
+    def _clock(self, ts: Optional[str]) -> float:
+        t = _hours(ts)
+        if t is not None and t > self._now:
+            self._now = t
+        return self._now
+
+    # -- learning --
+
+    def learn(self, episode_desc: Dict[str, Any], shot_desc: Dict[str, Any], score: float,
+              timestamp: Optional[str] = None) -> None:
+        """Count one GPT verdict under the pair's keys."""
+        keys = transition_keys(episode_desc, shot_desc)
+        if not keys:
+            return
+        coherent = score >= self.threshold
+        with self._lock:
+            now = self._clock(timestamp or shot_desc.get("timestamp"))
+            for k in keys:
+                e = self._table.get(k)
+                if e is None:
+                    e = self._table[k] = _Entry(now)
+                else:
+                    self._table.move_to_end(k)
+                    e.decay_to(now, self.half_life)
+                if coherent:
+                    e.coh_w += 1.0
+                    e.coh_s += score
+                else:
+                    e.inc_w += 1.0
+                    e.inc_s += score
+            while len(self._table) > self.max_keys:
+                self._table.popitem(last=False)
+                self.evicted += 1
+            self._since_sweep += 1
+            if self._since_sweep >= SWEEP_EVERY:
+                self._sweep()
+
+    def learn_rows(self, labels: Iterable[Dict[str, Any]]) -> int:
+        """Learn from logged 'coherence_labels' rows (with descriptors), oldest first."""
+        import json
+
+        n = 0
+        for lab in labels:
+            if not str(lab.get("label_source") or "").startswith("gpt"):
+                continue
+            ep, shot = lab.get("episode_descriptor"), lab.get("screenshot_descriptor")
+            try:
+                if isinstance(ep, str):
+                    ep = json.loads(ep)
+                if isinstance(shot, str):
+                    shot = json.loads(shot)
+                score = float(lab["coherence_score"])
+            except (ValueError, TypeError, KeyError):
+                continue
+            if ep and shot:
+                self.learn(ep, shot, score, timestamp=lab.get("screenshot_timestamp"))
+                n += 1
+        return n
+
+    def _sweep(self) -> None:
+        """Drop keys whose decayed weight fell below EVICT_WEIGHT. Caller holds the lock."""
+        self._since_sweep = 0
+        stale = []
+        for k, e in self._table.items():
+            e.decay_to(self._now, self.half_life)
+            if e.weight < EVICT_WEIGHT:
+                stale.append(k)
+        for k in stale:
+            del self._table[k]
+        self.evicted += len(stale)
+
+    # -- lookup --
+
+    def _answer(self, k: Key, now: float) -> Optional[float]:
+        e = self._table.get(k)
+        if e is None:
+            return None
+        e.decay_to(now, self.half_life)
+        w = e.weight
+        if w < EVICT_WEIGHT:
+            del self._table[k]
+            self.evicted += 1
+            return None
+        self._table.move_to_end(k)
+        if w < self.min_support:
+            return None
+        if e.coh_w / w >= self.min_agree:
+            return e.coh_s / e.coh_w
+        if e.inc_w / w >= self.min_agree:
+            return e.inc_s / e.inc_w
+        return None
+
+    def lookup(self, episode_desc: Dict[str, Any], shot_desc: Dict[str, Any]) -> Optional[float]:
+        """
+        The remembered coherence for this transition, or None if no key is
+        settled (or the call was picked for audit) and GPT should judge it.
+        """
+        keys = transition_keys(episode_desc, shot_desc)
+        score, level = None, None
+        with self._lock:
+            now = self._clock(shot_desc.get("timestamp"))
+            for k in keys:
+                score = self._answer(k, now)
+                if score is not None:
+                    level = "exact" if k[0] == "x" else "relational"
+                    break
+            if score is not None and random.random() < self.audit_rate:
+                score, level = None, "audit"
+            if level == "audit":
+                self.audits += 1
+            if score is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        telemetry.inc("coherence_transition_total", result=level or "miss")
+        return score
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.hits + self.misses
+            return {"keys": len(self._table), "hits": self.hits, "misses": self.misses,
+                    "audits": self.audits, "evicted": self.evicted,
+                    "hit_rate": self.hits / n if n else 0.0}
+
+
+_cache: Optional[TransitionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_transition_cache() -> TransitionCache:
+    """The shared cache, warmed from the last LEARN_DAYS of logged GPT verdicts on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = TransitionCache()
+                try:
+                    from storage import read_all
+                    from storage_client import storage
+
+                    since = (datetime.now() - timedelta(days=LEARN_DAYS)).strftime("%Y-%m-%d")
+                    n = cache.learn_rows(read_all(lambda limit, offset: storage.coherence_labels_since(
+                        since, descriptors=True, limit=limit, offset=offset
+                    )))
+                    print(f"(COH) learned transitions from {n} coherence labels ({cache.stats()['keys']} keys)")
+                except Exception as e:
+                    print(f"(COH.e) could not load coherence labels: {e}")
+                _cache = cache
+    return _cache
@@ -0,0 +1,267 @@
+# rate_limiter.py
+"""
+Shared request/token budget for every OpenAI call the pipeline makes
+(vision, embeddings, coherence).
+
+Two token buckets (requests/min and tokens/min) gate admission, and an AIMD
+window caps how many calls are in flight at once. The window grows while
+calls come back fast and clean, and is halved on a 429 or cut gently when
+latency climbs well above its baseline. Baselines are kept per stage, since
+a vision call is normally far slower than an embedding. A 429's Retry-After
+pauses every caller, not just the one that got it, and a call that fails
+gives its token reservation back.
+
+Usage:
+    from subfuncsChecks.rate_limiter import call_openai
+    resp = call_openai(client.chat.completions.create, est_tokens=1500, stage="vision", model=..., messages=...)
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import openai
+
+import telemetry
+
+# ---------- Config ----------------------------------------------------------
+
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+HEADROOM = 0.9            # budget against 90% of the account limits
+BURST_SECONDS = 10        # bucket capacity = this many seconds of budget
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+INITIAL_CONCURRENCY = 4
+LATENCY_SLOWDOWN = 2.0    # latency > this × baseline → shrink the window
+MAX_RETRIES = 6
+
+# rough token costs used to reserve budget before a call; reconciled with
+# resp.usage afterwards, so these only need to be in the right ballpark
+IMAGE_TOKENS_EST = 1500
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str = "", images: int = 0, max_output: int = 300) -> int:
+    return len(text) // CHARS_PER_TOKEN + images * IMAGE_TOKENS_EST + max_output
+
+
+def _backoff_delay(attempt: int) -> float:
+    return min(30, 2**attempt + random.random() * 0.5)
+
+
+# ---------- Buckets ---------------------------------------------------------
+
+class TokenBucket:
+    """
+    Token bucket that may go into debt: a reservation is always granted and
+    the caller is told how long to wait before using it. That lets a single
+    request larger than the bucket still go through once the debt is repaid.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` and return the seconds to wait until it is covered."""
+        self._refill(now)
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    def adjust(self, delta: float, now: float) -> None:
+        """Give back (delta > 0) or take more (delta < 0) after the fact."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + delta)
+
+
+# ---------- Limiter ---------------------------------------------------------
+
+class RateLimiter:
+    def __init__(self, rpm: int = OPENAI_RPM, tpm: int = OPENAI_TPM):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._requests = TokenBucket(rpm * HEADROOM)
+        self._tokens = TokenBucket(tpm * HEADROOM)
+
+        self._limit = float(INITIAL_CONCURRENCY)
+        self._inflight = 0
+        self._waiting = 0
+        self._paused_until = 0.0
+        self._latency_baseline: Dict[str, float] = {}     # stage → smoothed latency (s)
+
+        self.n_calls = 0
+        self.n_throttled = 0
+        self.tokens_used = 0
+
+    # -- admission --
+
+    def acquire(self, est_tokens: int) -> float:
+        """
+        Block until a call estimated at `est_tokens` may start.
+        Returns the start timestamp to pass back to `release`.
+        """
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now < self._paused_until:
+                        self._cond.wait(self._paused_until - now)
+                        continue
+                    if self._inflight >= int(self._limit):
+                        self._cond.wait()
+                        continue
+                    break
+                self._inflight += 1
+                wait = max(
+                    self._requests.reserve(1, now),
+                    self._tokens.reserve(est_tokens, now),
+                )
+            finally:
+                self._waiting -= 1
+
+        if wait > 0:
+            time.sleep(wait)
+        return time.monotonic()
+
+    def release(
+        self,
+        started: float,
+        est_tokens: int,
+        used_tokens: Optional[int] = None,
+        throttled: bool = False,
+        retry_after: Optional[float] = None,
+        stage: str = "openai",
+        failed: bool = False,
+    ) -> None:
+        """
+        End a call started by `acquire`. A throttled or `failed` call refunds
+        its whole token reservation and leaves the latency baseline alone;
+        `stage` selects which baseline a successful call is judged against.
+        """
+        now = time.monotonic()
+        latency = now - started
+        with self._cond:
+            self._inflight -= 1
+            self.n_calls += 1
+
+            if used_tokens is not None:
+                self.tokens_used += used_tokens
+                self._tokens.adjust(est_tokens - used_tokens, now)
+            elif throttled or failed:
+                self._tokens.adjust(est_tokens, now)
+
+            baseline = self._latency_baseline.get(stage)
+            if throttled:
+                self.n_throttled += 1
+                self._limit = max(MIN_CONCURRENCY, self._limit / 2)
+                pause = retry_after if retry_after is not None else _backoff_delay(0)
+                self._paused_until = max(self._paused_until, now + pause)
+            elif failed:
+                pass
+            elif baseline is None:
+                self._latency_baseline[stage] = latency
+            elif latency > LATENCY_SLOWDOWN * baseline:
+                self._limit = max(MIN_CONCURRENCY, self._limit * 0.9)
+            else:
+                # additive increase: roughly +1 per window of successful calls
+                self._limit = min(MAX_CONCURRENCY, self._limit + 1.0 / self._limit)
+                self._latency_baseline[stage] = 0.9 * baseline + 0.1 * latency
+
+            self._cond.notify_all()
+
+    # -- introspection --
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._waiting
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self._waiting,
+                "inflight": self._inflight,
+                "concurrency_limit": int(self._limit),
+                "calls": self.n_calls,
+                "throttled": self.n_throttled,
+                "tokens_used": self.tokens_used,
+                "latency_baseline_s": dict(self._latency_baseline),
+            }
+
+
+limiter = RateLimiter()
+telemetry.gauge("openai_queue_depth", lambda: limiter.stats()["queue_depth"])
+telemetry.gauge("openai_inflight", lambda: limiter.stats()["inflight"])
+telemetry.gauge("openai_concurrency_limit", lambda: limiter.stats()["concurrency_limit"])
+
+
+# ---------- Call wrapper ----------------------------------------------------
+
+def _retry_after(err: Exception) -> Optional[float]:
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _used_tokens(resp: Any) -> Optional[int]:
+    usage = getattr(resp, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def call_openai(fn: Callable[..., Any], est_tokens: int, stage: str = "openai", **kwargs) -> Any:
+    """
+    Run `fn(**kwargs)` under the shared limiter. 429s are retried after the
+    server's Retry-After; connection errors and 5xx with exponential backoff.
+    Clients should be built with max_retries=0 so 429s surface here.
+    The whole call, retries included, is timed as telemetry span `stage`.
+    """
+    with telemetry.span(stage):
+        return _call_with_retries(fn, est_tokens, stage, kwargs)
+
+
+def _call_with_retries(fn: Callable[..., Any], est_tokens: int, stage: str, kwargs: Dict[str, Any]) -> Any:
+    for attempt in range(MAX_RETRIES + 1):
+        t_wait = time.perf_counter()
+        started = limiter.acquire(est_tokens)
+        telemetry.observe("openai_limiter_wait", time.perf_counter() - t_wait)
+        try:
+            resp = fn(**kwargs)
+        except openai.RateLimitError as e:
+            limiter.release(started, est_tokens, throttled=True, retry_after=_retry_after(e), stage=stage)
+            telemetry.inc("openai_retries_total", stage=stage, reason="rate_limited")
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"(RL.429) rate limited; retry {attempt + 1}/{MAX_RETRIES}")
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            limiter.release(started, est_tokens, stage=stage, failed=True)
+            telemetry.inc("openai_retries_total", stage=stage, reason="transient")
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"(RL.e) transient OpenAI error: {e}; retry {attempt + 1}/{MAX_RETRIES}")
+            time.sleep(_backoff_delay(attempt))
+            continue
+        except Exception:
+            limiter.release(started, est_tokens, stage=stage, failed=True)
+            raise
+
+        limiter.release(started, est_tokens, used_tokens=_used_tokens(resp), stage=stage)
+        return resp
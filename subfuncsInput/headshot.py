@@ -3,6 +3,7 @@ import os
 from datetime import datetime
 import time as pytime
 import cv2 as cv
+from encryption.at_rest import ENC_SUFFIX, ENCRYPT_AT_REST, write_bytes_encrypted
 
 def capture_headshot(
     dir_path="raw/headshots", 
@@ -35,7 +36,12 @@ def capture_headshot(
     while pytime.time() - t0 < warmup_seconds:
         ret, frame = cam.read()
 
-    if ret and frame is not None:
+    if ret and frame is not None and ENCRYPT_AT_REST:
+        ok, buf = cv.imencode(".png", frame)
+        full_path = write_bytes_encrypted(buf, full_path + ENC_SUFFIX) if ok else None
+        print(f"Saved Headhost at: {full_path}")
+        result = full_path
+    elif ret and frame is not None:
         cv.imwrite(full_path, frame)
         print(f"Saved Headhost at: {full_path}")
         result = full_path
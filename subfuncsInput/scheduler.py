@@ -0,0 +1,175 @@
+# scheduler.py
+"""
+Adaptive capture cadence for the screenshot loop.
+
+Instead of a fixed sleep between captures, the interval moves between
+MIN_INTERVAL and MAX_INTERVAL based on what the last capture showed:
+
+  - the screen changed (screenshot._change_score): halve the interval; a
+    large change starts a burst of BURST_CAPTURES at MIN_INTERVAL
+  - nothing changed: grow the interval by GROWTH
+  - the episoder is buffering low-coherence screenshots toward a possible
+    task switch: stay at MIN_INTERVAL until it decides
+  - a short/unsettled episode caps the interval at UNSETTLED_MAX_INTERVAL;
+    only an episode of STABLE_EPISODE_SCREENS or more may back off to the max
+
+While waiting, the focused window is probed every PROBE_SECONDS, and a
+switch of app or title cuts the wait short (never below MIN_INTERVAL since
+the last capture), so quick task switches aren't missed. After
+IDLE_PAUSE_SECONDS without keyboard/mouse input (which also covers a locked
+screen) capture pauses entirely; the first input afterwards triggers an
+immediate capture and a burst.
+
+    scheduler = AdaptiveScheduler()
+    while True:
+        scheduler.wait()
+        pending = capture_screenshot_async(...)
+        ...
+        scheduler.observe(pending.change_score, *episode_stability())
+        # or, when the capture failed: scheduler.observe_failure()
+
+A failed capture backs off like an unchanged one (GROWTH, up to
+MAX_INTERVAL), so a grab that keeps failing (Wayland, a locked display)
+is retried at a slowing cadence instead of in a tight loop.
+"""
+import time
+from typing import Callable, Optional, Tuple
+
+from subfuncsInput.screenshot import CHANGE_THRESHOLD
+from subfuncsInput.window_info import get_active_window, get_idle_seconds
+import telemetry
+
+MIN_INTERVAL = 3.0             # seconds; floor between captures
+BASE_INTERVAL = 10.0           # starting cadence (the old fixed interval)
+MAX_INTERVAL = 60.0            # ceiling while the screen is static
+UNSETTLED_MAX_INTERVAL = 20.0  # ceiling while the current episode is young
+GROWTH = 1.5                   # interval multiplier per unchanged capture
+BURST_SCORE = 20.0             # change score that starts a burst
+BURST_CAPTURES = 3
+STABLE_EPISODE_SCREENS = 6
+IDLE_PAUSE_SECONDS = 120.0
+IDLE_POLL_SECONDS = 5.0
+PROBE_SECONDS = 2.0
+
+
+def _window_key(window) -> Optional[Tuple[str, str]]:
+    if not window:
+        return None
+    return window.get("app") or "", window.get("title") or ""
+
+
+class AdaptiveScheduler:
+    def __init__(
+        self,
+        min_interval: float = MIN_INTERVAL,
+        base_interval: float = BASE_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        idle_pause: float = IDLE_PAUSE_SECONDS,
+        idle_fn: Callable[[], Optional[float]] = get_idle_seconds,
+        window_fn: Callable[[], Optional[dict]] = get_active_window,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_pause = idle_pause
+        self.interval = base_interval
+        self.paused = False
+        self._idle_fn = idle_fn
+        self._window_fn = window_fn
+        self._clock = clock
+        self._sleep = sleep
+        self._burst = 0
+        self._last_capture = clock()
+        telemetry.gauge("capture_interval_seconds", lambda: self.interval)
+
+    # -- after a capture --
+
+    def observe(self, change_score: Optional[float], episode_screens: int = 0, switch_pending: int = 0) -> float:
+        """
+        Update the cadence from the capture just taken. `change_score` is
+        None for the first capture of a region (treated as changed).
+        Returns the next interval.
+        """
+        self._last_capture = self._clock()
+        changed = change_score is None or change_score >= CHANGE_THRESHOLD
+
+        if change_score is not None and change_score >= BURST_SCORE:
+            self._burst = BURST_CAPTURES
+        if self._burst > 0:
+            self._burst -= 1
+            interval = self.min_interval
+        elif changed:
+            interval = self.interval / 2
+        else:
+            interval = self.interval * GROWTH
+
+        if switch_pending:
+            interval = self.min_interval
+        ceiling = self.max_interval if episode_screens >= STABLE_EPISODE_SCREENS else min(
+            self.max_interval, UNSETTLED_MAX_INTERVAL
+        )
+        self.interval = max(self.min_interval, min(ceiling, interval))
+        return self.interval
+
+    def observe_failure(self) -> float:
+        """
+        The capture just attempted produced nothing. Counts as a capture for
+        spacing and backs the interval off; returns the next interval.
+        """
+        self._last_capture = self._clock()
+        self._burst = 0
+        self.interval = max(self.min_interval, min(self.max_interval, self.interval * GROWTH))
+        telemetry.inc("scheduler_capture_failures_total")
+        return self.interval
+
+    # -- before the next one --
+
+    def _idle(self) -> Optional[float]:
+        if self._idle_fn is None:
+            return None
+        idle = self._idle_fn()
+        if idle is None:
+            # no idle source on this machine (e.g. xprintidle missing); stop asking
+            print("(SCH) input idle time unavailable; idle pausing disabled")
+            self._idle_fn = None
+        return idle
+
+    def wait(self) -> str:
+        """
+        Block until the next capture is due. Returns why: "due",
+        "window_change" or "resumed" (input after an idle pause).
+        """
+        baseline = _window_key(self._window_fn())
+        while True:
+            idle = self._idle()
+            if idle is not None and idle >= self.idle_pause:
+                if not self.paused:
+                    self.paused = True
+                    print(f"(SCH) no input for {idle:.0f}s; pausing capture")
+                    telemetry.inc("scheduler_pauses_total")
+                self._sleep(IDLE_POLL_SECONDS)
+                continue
+            if self.paused:
+                self.paused = False
+                self._burst = BURST_CAPTURES
+                self.interval = self.min_interval
+                print("(SCH) input resumed; capturing")
+                return self._wake("resumed")
+
+            since = self._clock() - self._last_capture
+            if since >= self.interval:
+                return self._wake("due")
+            if since >= self.min_interval:
+                key = _window_key(self._window_fn())
+                if key is not None and baseline is not None and key != baseline:
+                    self._burst = max(self._burst, 1)
+                    return self._wake("window_change")
+            # wake for the earliest of: due, min spacing (to start probing), next probe
+            remaining = self.interval - since
+            until_min = self.min_interval - since
+            self._sleep(max(0.05, min(remaining, PROBE_SECONDS if until_min <= 0 else until_min)))
+
+    def _wake(self, reason: str) -> str:
+        telemetry.inc("scheduler_wakeups_total", reason=reason)
+        return reason
@@ -1,33 +1,273 @@
 # screenshot.py
+import json
 import os
 from datetime import datetime
-from PIL import ImageGrab
+from typing import Any, Dict, List, Optional
+from PIL import ImageChops, ImageGrab, ImageStat
 
-def capture_screenshot(folder_path="raw/screenshots"):
+from encryption.at_rest import ENC_SUFFIX, ENCRYPT_AT_REST, open_capture, write_bytes_encrypted
+from subfuncsInput.encoder import EncodePool, PendingCapture, default_pool
+from subfuncsInput.window_info import clip_rect, get_active_window, get_monitors, monitor_for_rect
+import telemetry
+
+# Capture modes:
+#   "full"           - entire virtual desktop (all monitors)
+#   "active_monitor" - only the monitor holding the focused window
+#   "active_window"  - only the focused window's rectangle
+CAPTURE_MODES = ("full", "active_monitor", "active_window")
+
+CHANGE_THUMB_SIZE = (64, 36)
+CHANGE_THRESHOLD = 2.0   # mean abs grey-level diff (0-255) on the thumbnail
+
+# last fingerprint per region key ("full", "monitor_0", ...)
+_last_fingerprints: Dict[str, Any] = {}
+
+
+def _change_score(key: str, image) -> Optional[float]:
+    """
+    Mean grey-level difference between this capture and the previous one of
+    the same region, on a tiny thumbnail. None for the first capture.
+    """
+    thumb = image.convert("L").resize(CHANGE_THUMB_SIZE)
+    prev = _last_fingerprints.get(key)
+    _last_fingerprints[key] = thumb
+    if prev is None:
+        return None
+    return ImageStat.Stat(ImageChops.difference(thumb, prev)).mean[0]
+
+
+_TS_FORMAT = "%Y-%m-%d_%H-%M-%S"
+_TS_LEN = len("YYYY-MM-DD_HH-MM-SS")
+
+
+def capture_name(now: datetime) -> str:
+    """
+    'YYYY-MM-DD_HH-MM-SS_mmm': the capture's file stem. The millisecond
+    suffix keeps two captures in the same second from overwriting each other.
+    """
+    return f"{now.strftime(_TS_FORMAT)}_{now.microsecond // 1000:03d}"
+
+
+def capture_stem(image_path: str) -> str:
+    """
+    File stem of a capture path, whatever suffixes it carries
+    ('.png', '.png.enc', '.png.pending', ...).
+    """
+    return os.path.basename(image_path).split(".", 1)[0]
+
+
+def capture_timestamp(image_path: str) -> str:
+    """
+    'YYYY-MM-DD_HH-MM-SS' from a capture path: the screenshot row's timestamp,
+    without the millisecond suffix newer captures carry.
+    """
+    return capture_stem(image_path)[:_TS_LEN]
+
+
+def capture_ms(image_path: str) -> int:
+    """
+    Epoch milliseconds of a capture, from its name (to the second for names
+    without a millisecond suffix). Raises ValueError for other names.
+    """
+    stem = capture_stem(image_path)
+    ms = stem[_TS_LEN + 1:]
+    base = int(datetime.strptime(stem[:_TS_LEN], _TS_FORMAT).timestamp() * 1000)
+    if len(stem) == _TS_LEN:
+        return base
+    if stem[_TS_LEN] != "_" or not (ms.isdigit() and len(ms) == 3):
+        raise ValueError(f"not a capture name: {stem!r}")
+    return base + int(ms)
+
+
+def _metadata_path(image_path: str) -> str:
+    return os.path.join(os.path.dirname(image_path), capture_stem(image_path) + ".json")
+
+
+def _write_metadata(image_path: str, meta: Dict[str, Any]) -> None:
+    # window titles are as sensitive as the pixels, so follow the image
+    if ENCRYPT_AT_REST:
+        write_bytes_encrypted(json.dumps(meta).encode("utf-8"), _metadata_path(image_path) + ENC_SUFFIX)
+        return
+    with open(_metadata_path(image_path), "w") as f:
+        json.dump(meta, f)
+
+
+def metadata_paths(image_path: str) -> List[str]:
     """
-    Captures a full-screen screenshot and saves it as a PNG file, returns fullpath of file
+    Possible sidecar locations for a capture (plain, then encrypted).
+    """
+    base = _metadata_path(image_path)
+    return [base, base + ENC_SUFFIX]
+
+
+def read_capture_metadata(image_path: str) -> Dict[str, Any]:
+    """
+    Window/monitor metadata saved next to a capture ({} if there is none).
+    Accepts any capture path, encrypted or not, with or without '.pending'.
+    """
+    for path in metadata_paths(image_path):
+        if not os.path.exists(path):
+            continue
+        try:
+            with open_capture(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+
+def _resolve_region(mode: str, monitors: List[Dict[str, Any]], window: Optional[Dict[str, Any]]):
+    """
+    Returns (bbox or None for the whole desktop, region key, monitor dict).
+    Falls back from window → monitor → full when the OS can't tell us more.
+    """
+    win_rect = tuple(window["rect"]) if window and window.get("rect") else None
+    monitor = monitor_for_rect(monitors, win_rect)
+
+    if mode == "active_window" and win_rect and monitor:
+        bbox = clip_rect(win_rect, tuple(monitor["rect"]))
+        if bbox:
+            return bbox, "window", monitor
+    if mode in ("active_monitor", "active_window") and monitor:
+        return tuple(monitor["rect"]), f"monitor_{monitor['index']}", monitor
+    return None, "full", None
+
+
+def capture_screenshot_async(folder_path="raw/screenshots", mode="full", pool: Optional[EncodePool] = None):
+    """
+    Grabs the requested region and hands the image to the encode pool.
+    Files are named by capture_name ('YYYY-MM-DD_HH-MM-SS_mmm.png'), and
+    focused-window and monitor metadata is written next to it as '<name>.json'.
+    With ENCRYPT_AT_REST both are written encrypted ('.png.enc' / '.json.enc').
 
     Args:
         folder_path (str): Directory where the screenshot will be saved.
+        mode (str): One of CAPTURE_MODES.
+        pool (EncodePool | None): Encoder to use; the shared default if None.
 
     Returns:
-        str | None: The path of the saved image, or None if capture failed.
+        PendingCapture | None: Handle to the file being encoded, or None if capture failed.
     """
+    if mode not in CAPTURE_MODES:
+        raise ValueError(f"unknown capture mode {mode!r}; expected one of {CAPTURE_MODES}")
     os.makedirs(folder_path, exist_ok=True)
+    pool = pool or default_pool()
 
-    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    full_path = os.path.join(folder_path, f"{ts}.png")
+    now = datetime.now()
+    ts, name = now.strftime(_TS_FORMAT), capture_name(now)
 
     try:
-        screenshot = ImageGrab.grab()
-        screenshot.save(full_path, "PNG")
-        #print(f"Screenshot saved successfully as: {full_path}")
-        return full_path
+        window = get_active_window()
+        monitors = get_monitors()
+        bbox, key, monitor = _resolve_region(mode, monitors, window)
+
+        # all_screens lets Windows address monitors other than the primary
+        with telemetry.span("capture"):
+            screenshot = ImageGrab.grab(bbox=bbox, all_screens=True)
+        score = _change_score(key, screenshot)
+        if score is not None and score < CHANGE_THRESHOLD:
+            telemetry.inc("captures_unchanged_total")
+        pending = pool.submit(screenshot, os.path.join(folder_path, name))
+        pending.change_score = score
+        _write_metadata(pending.path, {
+            "timestamp": ts,
+            "mode": mode,
+            "region": key,
+            "bbox": list(bbox) if bbox else None,
+            "size": list(screenshot.size),
+            "monitor": monitor,
+            "monitor_count": len(monitors),
+            "window": window,
+            "change_score": score,
+            "changed": score is None or score >= CHANGE_THRESHOLD,
+        })
+        return pending
     except Exception as e:
         print(f"Failed to capture screenshot: {e}")
         return None
 
 
+def capture_screenshot(folder_path="raw/screenshots", mode="full"):
+    """
+    Captures a screenshot of the requested region and saves it, returns fullpath of file.
+    Blocking wrapper around capture_screenshot_async.
+
+    Args:
+        folder_path (str): Directory where the screenshot will be saved.
+        mode (str): One of CAPTURE_MODES.
+
+    Returns:
+        str | None: The path of the saved image, or None if capture failed.
+    """
+    pending = capture_screenshot_async(folder_path, mode)
+    if pending is None:
+        return None
+    try:
+        return pending.result()
+    except Exception as e:
+        print(f"Failed to save screenshot: {e}")
+        return None
+
+
+def capture_changed_monitors(folder_path="raw/screenshots"):
+    """
+    Grabs every monitor separately and saves only the ones whose content
+    changed since the previous call, under '<folder_path>/monitor_<i>/'.
+
+    Returns:
+        list[str]: Paths of the images that were saved (may be empty).
+    """
+    monitors = get_monitors()
+    if not monitors:
+        path = capture_screenshot(folder_path, mode="full")
+        return [path] if path else []
+
+    now = datetime.now()
+    ts, name = now.strftime(_TS_FORMAT), capture_name(now)
+    window = get_active_window()
+    active = monitor_for_rect(monitors, tuple(window["rect"]) if window and window.get("rect") else None)
+
+    pool = default_pool()
+    pending: List[PendingCapture] = []
+    for m in monitors:
+        key = f"monitor_{m['index']}"
+        try:
+            with telemetry.span("capture"):
+                shot = ImageGrab.grab(bbox=tuple(m["rect"]), all_screens=True)
+        except Exception as e:
+            print(f"Failed to capture {key}: {e}")
+            continue
+        score = _change_score(key, shot)
+        if score is not None and score < CHANGE_THRESHOLD:
+            telemetry.inc("screenshot_skips_total", reason="unchanged")
+            continue
+
+        out_dir = os.path.join(folder_path, key)
+        os.makedirs(out_dir, exist_ok=True)
+        handle = pool.submit(shot, os.path.join(out_dir, name))
+        _write_metadata(handle.path, {
+            "timestamp": ts,
+            "mode": "per_monitor",
+            "region": key,
+            "bbox": list(m["rect"]),
+            "size": list(shot.size),
+            "monitor": m,
+            "monitor_count": len(monitors),
+            "window": window if active is m else None,
+            "change_score": score,
+            "changed": True,
+        })
+        pending.append(handle)
+
+    saved = []
+    for handle in pending:
+        try:
+            saved.append(handle.result())
+        except Exception as e:
+            print(f"Failed to save {handle.path}: {e}")
+    return saved
+
+
 # Optional: allow running directly
 if __name__ == "__main__":
     capture_screenshot()
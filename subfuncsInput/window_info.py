@@ -0,0 +1,298 @@
+# window_info.py
+"""
+OS queries for the monitor layout and the focused window.
+
+All rectangles are (left, top, right, bottom) in the same coordinate space
+ImageGrab.grab(bbox=...) expects on that platform (points on macOS, virtual
+screen pixels on Windows, X11 root pixels on Linux).
+
+Every function degrades to an empty result instead of raising, so capture
+can always fall back to a full-desktop grab.
+"""
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+Rect = Tuple[int, int, int, int]
+
+
+# ---------- macOS -----------------------------------------------------------
+
+def _mac_monitors() -> List[Dict[str, Any]]:
+    import Quartz
+
+    err, ids, count = Quartz.CGGetActiveDisplayList(16, None, None)
+    if err:
+        return []
+    main_id = Quartz.CGMainDisplayID()
+    monitors = []
+    for i, did in enumerate(ids[:count]):
+        b = Quartz.CGDisplayBounds(did)
+        left, top = int(b.origin.x), int(b.origin.y)
+        monitors.append({
+            "index": i,
+            "rect": (left, top, left + int(b.size.width), top + int(b.size.height)),
+            "primary": did == main_id,
+        })
+    return monitors
+
+
+def _mac_active_window() -> Optional[Dict[str, Any]]:
+    import Quartz
+    from AppKit import NSWorkspace
+
+    front = NSWorkspace.sharedWorkspace().frontmostApplication()
+    pid = front.processIdentifier()
+    windows = Quartz.CGWindowListCopyWindowInfo(
+        Quartz.kCGWindowListOptionOnScreenOnly | Quartz.kCGWindowListExcludeDesktopElements,
+        Quartz.kCGNullWindowID,
+    )
+    # front-to-back order: first normal-layer window owned by the frontmost app
+    for w in windows:
+        if w.get("kCGWindowOwnerPID") != pid or w.get("kCGWindowLayer", 0) != 0:
+            continue
+        b = w.get("kCGWindowBounds", {})
+        left, top = int(b.get("X", 0)), int(b.get("Y", 0))
+        return {
+            "app": str(front.localizedName() or w.get("kCGWindowOwnerName") or ""),
+            "title": str(w.get("kCGWindowName") or ""),
+            "pid": int(pid),
+            "rect": (left, top, left + int(b.get("Width", 0)), top + int(b.get("Height", 0))),
+        }
+    return {"app": str(front.localizedName() or ""), "title": "", "pid": int(pid), "rect": None}
+
+
+def _mac_idle_seconds() -> Optional[float]:
+    import Quartz
+
+    return float(Quartz.CGEventSourceSecondsSinceLastEventType(
+        Quartz.kCGEventSourceStateCombinedSessionState, Quartz.kCGAnyInputEventType
+    ))
+
+
+# ---------- Windows ---------------------------------------------------------
+
+def _win_user32():
+    import ctypes
+
+    user32 = ctypes.windll.user32
+    try:
+        # otherwise rects come back in scaled (96-dpi) coordinates
+        ctypes.windll.shcore.SetProcessDpiAwareness(2)
+    except Exception:
+        user32.SetProcessDPIAware()
+    return user32
+
+
+def _win_monitors() -> List[Dict[str, Any]]:
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = _win_user32()
+
+    class MONITORINFO(ctypes.Structure):
+        _fields_ = [
+            ("cbSize", wintypes.DWORD),
+            ("rcMonitor", wintypes.RECT),
+            ("rcWork", wintypes.RECT),
+            ("dwFlags", wintypes.DWORD),
+        ]
+
+    monitors: List[Dict[str, Any]] = []
+    MonitorEnumProc = ctypes.WINFUNCTYPE(
+        wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC, ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+    )
+
+    def _cb(hmon, hdc, lprect, lparam):
+        info = MONITORINFO()
+        info.cbSize = ctypes.sizeof(MONITORINFO)
+        user32.GetMonitorInfoW(hmon, ctypes.byref(info))
+        r = info.rcMonitor
+        monitors.append({
+            "index": len(monitors),
+            "rect": (r.left, r.top, r.right, r.bottom),
+            "primary": bool(info.dwFlags & 1),
+        })
+        return True
+
+    user32.EnumDisplayMonitors(None, None, MonitorEnumProc(_cb), 0)
+    return monitors
+
+
+def _win_active_window() -> Optional[Dict[str, Any]]:
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = _win_user32()
+    hwnd = user32.GetForegroundWindow()
+    if not hwnd:
+        return None
+
+    length = user32.GetWindowTextLengthW(hwnd)
+    buf = ctypes.create_unicode_buffer(length + 1)
+    user32.GetWindowTextW(hwnd, buf, length + 1)
+
+    rect = wintypes.RECT()
+    user32.GetWindowRect(hwnd, ctypes.byref(rect))
+
+    pid = wintypes.DWORD()
+    user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+
+    app = ""
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(0x1000, False, pid.value)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if handle:
+        size = wintypes.DWORD(260)
+        exe = ctypes.create_unicode_buffer(size.value)
+        if kernel32.QueryFullProcessImageNameW(handle, 0, exe, ctypes.byref(size)):
+            app = os.path.splitext(os.path.basename(exe.value))[0]
+        kernel32.CloseHandle(handle)
+
+    return {
+        "app": app,
+        "title": buf.value,
+        "pid": int(pid.value),
+        "rect": (rect.left, rect.top, rect.right, rect.bottom),
+    }
+
+
+def _win_idle_seconds() -> Optional[float]:
+    import ctypes
+    from ctypes import wintypes
+
+    class LASTINPUTINFO(ctypes.Structure):
+        _fields_ = [("cbSize", wintypes.UINT), ("dwTime", wintypes.DWORD)]
+
+    info = LASTINPUTINFO()
+    info.cbSize = ctypes.sizeof(LASTINPUTINFO)
+    if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+        return None
+    # both are 32-bit millisecond tick counts; mask the wrap-around
+    return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000.0
+
+
+# ---------- Linux (X11) -----------------------------------------------------
+
+def _run(args: List[str]) -> str:
+    return subprocess.run(args, capture_output=True, text=True, timeout=2, check=True).stdout
+
+
+def _x11_monitors() -> List[Dict[str, Any]]:
+    # " 0: +*DP-1 2560/597x1440/336+0+0  DP-1"
+    pattern = re.compile(r"^\s*(\d+):\s+\+(\*?)\S+\s+(\d+)/\d+x(\d+)/\d+\+(-?\d+)\+(-?\d+)")
+    monitors = []
+    for line in _run(["xrandr", "--listactivemonitors"]).splitlines():
+        m = pattern.match(line)
+        if not m:
+            continue
+        idx, star, w, h, x, y = m.groups()
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        monitors.append({"index": int(idx), "rect": (x, y, x + w, y + h), "primary": star == "*"})
+    return monitors
+
+
+def _x11_active_window() -> Optional[Dict[str, Any]]:
+    wid = _run(["xdotool", "getactivewindow"]).strip()
+    if not wid:
+        return None
+    title = _run(["xdotool", "getwindowname", wid]).strip()
+    geo = dict(
+        line.split("=", 1)
+        for line in _run(["xdotool", "getwindowgeometry", "--shell", wid]).splitlines()
+        if "=" in line
+    )
+    x, y = int(geo.get("X", 0)), int(geo.get("Y", 0))
+    w, h = int(geo.get("WIDTH", 0)), int(geo.get("HEIGHT", 0))
+
+    app, pid = "", 0
+    try:
+        props = _run(["xprop", "-id", wid, "WM_CLASS", "_NET_WM_PID"])
+        m = re.search(r'WM_CLASS\(STRING\) = "[^"]*", "([^"]*)"', props)
+        app = m.group(1) if m else ""
+        m = re.search(r"_NET_WM_PID\(CARDINAL\) = (\d+)", props)
+        pid = int(m.group(1)) if m else 0
+    except Exception:
+        pass
+
+    return {"app": app, "title": title, "pid": pid, "rect": (x, y, x + w, y + h)}
+
+
+def _x11_idle_seconds() -> Optional[float]:
+    # xprintidle reports milliseconds since the last input event
+    return int(_run(["xprintidle"]).strip()) / 1000.0
+
+
+# ---------- Public ----------------------------------------------------------
+
+def get_monitors() -> List[Dict[str, Any]]:
+    """
+    List of {"index", "rect", "primary"} for every active display, or [] if
+    the layout can't be queried.
+    """
+    try:
+        if sys.platform == "darwin":
+            return _mac_monitors()
+        if sys.platform == "win32":
+            return _win_monitors()
+        return _x11_monitors()
+    except Exception as e:
+        print(f"(WIN.e) monitor query failed: {e}")
+        return []
+
+
+def get_active_window() -> Optional[Dict[str, Any]]:
+    """
+    {"app", "title", "pid", "rect"} for the focused window, or None.
+    """
+    try:
+        if sys.platform == "darwin":
+            return _mac_active_window()
+        if sys.platform == "win32":
+            return _win_active_window()
+        return _x11_active_window()
+    except Exception as e:
+        print(f"(WIN.e) active window query failed: {e}")
+        return None
+
+
+def get_idle_seconds() -> Optional[float]:
+    """
+    Seconds since the last keyboard/mouse input, or None if unknown
+    (callers should then assume the user is active).
+    """
+    try:
+        if sys.platform == "darwin":
+            return _mac_idle_seconds()
+        if sys.platform == "win32":
+            return _win_idle_seconds()
+        return _x11_idle_seconds()
+    except Exception as e:
+        print(f"(WIN.e) idle time query failed: {e}")
+        return None
+
+
+def monitor_for_rect(monitors: List[Dict[str, Any]], rect: Optional[Rect]) -> Optional[Dict[str, Any]]:
+    """
+    Monitor containing the centre of `rect`; the primary monitor if `rect` is
+    unknown or off-screen.
+    """
+    if rect:
+        cx, cy = (rect[0] + rect[2]) // 2, (rect[1] + rect[3]) // 2
+        for m in monitors:
+            l, t, r, b = m["rect"]
+            if l <= cx < r and t <= cy < b:
+                return m
+    for m in monitors:
+        if m.get("primary"):
+            return m
+    return monitors[0] if monitors else None
+
+
+def clip_rect(rect: Rect, bounds: Rect) -> Optional[Rect]:
+    l, t = max(rect[0], bounds[0]), max(rect[1], bounds[1])
+    r, b = min(rect[2], bounds[2]), min(rect[3], bounds[3])
+    if r - l < 16 or b - t < 16:
+        return None
+    return (l, t, r, b)
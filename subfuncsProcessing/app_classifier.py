@@ -0,0 +1,220 @@
+# app_classifier.py
+"""
+Local app_bucket / work_type labels from the focused window, so the vision
+call only has to produce the semantic fields.
+
+Both fields are mostly a function of the foreground app (and, in a
+browser, the site). The classifier keeps, per app or site key, counts of
+the (app_bucket, work_type) the vision model assigned, learned from
+recent 'screenshots' rows and from every full vision answer afterwards.
+A capture is labelled locally when its window's keys have at least
+MIN_SUPPORT past labels with a top share of MIN_SHARE or more; otherwise
+(new app, mixed-use site) it returns None and the full schema is asked.
+AUDIT_RATE of the captures it could label are asked in full anyway, so a
+mapping that has gone wrong (history includes locally labelled rows)
+keeps meeting fresh model labels.
+
+Keys are normalized names: the OS app ("Code", "chrome", "Google-chrome")
+goes through APP_ALIASES, and in browsers each title segment ("Watch
+later - YouTube" → "watch later", "youtube") is a candidate site key. The
+model's app_or_website ("Google Chrome – Canvas") splits the same way,
+so history and live windows share one key space.
+
+    labels = get_classifier().classify(window)   # {"app_or_website", "app_bucket", "work_type"} or None
+"""
+import random
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import telemetry
+
+MIN_SUPPORT = 3        # past labels needed for a key
+MIN_SHARE = 0.85       # top label's share of them
+LEARN_DAYS = 30        # history loaded on first use
+AUDIT_RATE = 0.05      # share of known-app captures still sent to the full schema
+
+# OS / model spellings → one name
+APP_ALIASES = {
+    "code": "vs code",
+    "visual studio code": "vs code",
+    "google chrome": "chrome",
+    "google-chrome": "chrome",
+    "chromium-browser": "chrome",
+    "msedge": "edge",
+    "microsoft edge": "edge",
+    "firefox": "firefox",
+    "mozilla firefox": "firefox",
+    "safari": "safari",
+    "arc": "arc",
+    "brave browser": "brave",
+    "brave-browser": "brave",
+    "iterm2": "iterm",
+    "gnome-terminal-server": "terminal",
+    "windowsterminal": "terminal",
+    "cmd": "terminal",
+    "powershell": "terminal",
+    "explorer": "file explorer",
+    "nautilus": "file explorer",
+    "microsoft word": "word",
+    "winword": "word",
+    "microsoft powerpoint": "powerpoint",
+    "powerpnt": "powerpoint",
+    "microsoft excel": "excel",
+    "microsoft outlook": "outlook",
+    "acrobat": "adobe acrobat",
+    "acrord32": "adobe acrobat",
+}
+
+BROWSERS = {"chrome", "edge", "firefox", "safari", "arc", "brave", "opera"}
+
+# fallback app_bucket for well-known apps with no history yet
+KNOWN_BUCKETS = {
+    **{b: "browser" for b in BROWSERS},
+    "vs code": "ide", "pycharm": "ide", "intellij idea": "ide", "xcode": "ide", "cursor": "ide",
+    "terminal": "terminal", "iterm": "terminal", "warp": "terminal", "alacritty": "terminal",
+    "preview": "pdf_viewer", "adobe acrobat": "pdf_viewer", "skim": "pdf_viewer",
+    "notion": "notes", "obsidian": "notes", "notes": "notes", "onenote": "notes",
+    "mail": "email", "outlook": "email", "thunderbird": "email",
+    "finder": "file_explorer", "file explorer": "file_explorer",
+    "slack": "messaging", "discord": "messaging", "messages": "messaging", "whatsapp": "messaging",
+    "teams": "messaging", "telegram": "messaging",
+    "vlc": "media_player", "spotify": "media_player", "music": "media_player", "quicktime player": "media_player",
+}
+
+_SPLIT_RE = re.compile(r"\s+[-–—|·:]\s+")
+_BADGE_RE = re.compile(r"^\(\d+\)\s*|\s*[●•*]$")    # "(3) Inbox", unsaved-file markers
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize(name: str) -> str:
+    name = _WS_RE.sub(" ", _BADGE_RE.sub("", (name or "").strip().lower()))
+    if name.endswith(".exe") or name.endswith(".app"):
+        name = name[:-4]
+    return APP_ALIASES.get(name, name)
+
+
+def segments(text: str) -> List[str]:
+    return [s for s in (normalize(p) for p in _SPLIT_RE.split(text or "")) if s]
+
+
+class AppClassifier:
+    def __init__(self, min_support: int = MIN_SUPPORT, min_share: float = MIN_SHARE, audit_rate: float = AUDIT_RATE):
+        self.min_support = min_support
+        self.min_share = min_share
+        self.audit_rate = audit_rate
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Counter] = {}
+        self._work: Dict[str, Counter] = {}
+        self.hits = 0
+        self.misses = 0
+
+    # -- learning --
+
+    def learn(self, app_or_website: str, app_bucket: str, work_type: str, window: Optional[Dict[str, Any]] = None) -> None:
+        """Count one vision-model label under the keys of its app name (and the OS app, if known)."""
+        keys = set(segments(app_or_website))
+        if window and window.get("app"):
+            keys.add(normalize(window["app"]))
+        with self._lock:
+            for k in keys:
+                self._buckets.setdefault(k, Counter())[app_bucket] += 1
+                self._work.setdefault(k, Counter())[work_type] += 1
+
+    def learn_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        n = 0
+        for r in rows:
+            if r.get("app_or_website") and r.get("app_bucket") and r.get("work_type"):
+                self.learn(r["app_or_website"], r["app_bucket"], r["work_type"])
+                n += 1
+        return n
+
+    # -- lookup --
+
+    def _confident(self, table: Dict[str, Counter], key: str) -> Optional[str]:
+        counts = table.get(key)
+        if not counts:
+            return None
+        label, top = counts.most_common(1)[0]
+        total = sum(counts.values())
+        if total >= self.min_support and top / total >= self.min_share and label != "unknown":
+            return label
+        return None
+
+    def classify(self, window: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        """
+        {"app_or_website", "app_bucket", "work_type"} for the focused
+        window, or None if either label isn't settled for it.
+        """
+        labels = self._classify(window)
+        result = "hit" if labels else "miss"
+        if labels and random.random() < self.audit_rate:
+            labels, result = None, "audit"
+        with self._lock:
+            if labels is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        telemetry.inc("app_classifier_total", result=result)
+        return labels
+
+    def _classify(self, window: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        if not window or not window.get("app"):
+            return None
+        app = normalize(window["app"])
+        title = window.get("title") or ""
+        with self._lock:
+            bucket = self._confident(self._buckets, app) or KNOWN_BUCKETS.get(app)
+            work, site = None, None
+            if bucket == "browser" or app in BROWSERS:
+                # site first (the browser alone says little about the work), last segment first
+                for seg in reversed(segments(title)):
+                    if seg in BROWSERS:
+                        continue
+                    work = self._confident(self._work, seg)
+                    if work:
+                        site = seg
+                        break
+            else:
+                work = self._confident(self._work, app)
+        if not bucket or not work:
+            return None
+        name = window["app"].strip()
+        if site:
+            original = next((p for p in _SPLIT_RE.split(title) if normalize(p) == site), site)
+            name = f"{name} – {original.strip()}"
+        return {"app_or_website": name, "app_bucket": bucket, "work_type": work}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.hits + self.misses
+            return {"keys": len(self._buckets), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / n if n else 0.0}
+
+
+_classifier: Optional[AppClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> AppClassifier:
+    """The shared classifier, warmed from the last LEARN_DAYS of screenshots on first use."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                clf = AppClassifier()
+                try:
+                    from storage import read_all
+                    from storage_client import storage
+
+                    since = (datetime.now() - timedelta(days=LEARN_DAYS)).strftime("%Y-%m-%d")
+                    n = clf.learn_rows(read_all(
+                        lambda limit, offset: storage.screenshots_since(since, limit=limit, offset=offset)
+                    ))
+                    print(f"(APP) learned app labels from {n} screenshots ({len(clf._buckets)} keys)")
+                except Exception as e:
+                    print(f"(APP.e) could not load screenshot history: {e}")
+                _classifier = clf
+    return _classifier
@@ -0,0 +1,253 @@
+# engagement.py
+"""
+Face samples ('facevals': state, drowsy, engaged every EVAL_INTERVAL
+seconds) joined onto episodes, for engagement-weighted analytics.
+
+Episodes are turned into a sorted interval index (start/end as int64
+seconds); each face sample finds its episode with one np.searchsorted
+over the starts plus an end check, and per-episode / per-workstream
+aggregates are np.bincount sums over the joined indexes. Both sides are
+sorted once, so a join is O((E + F) log E) with no Python loop over pairs;
+a year of 2-minute samples joins in about a second, most of it parsing
+timestamps.
+
+Episodes are sequential by construction; overlapping ones (e.g. a
+re-episodized range stored twice) are clipped at the next start, so every
+sample belongs to at most one episode. A sample is matched if it falls in
+[start, end + slack_s]: the end is the last screenshot's time, and the
+face window closing just after it still describes the episode.
+
+Face timestamps are stored by the database default (UTC); naive ones are
+read as UTC and everything is converted to local wall time, like the
+screenshot timestamps the episodes come from.
+
+    python -m subfuncsProcessing.engagement [--days 30] [--slack 60]
+"""
+import argparse
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+JOIN_SLACK_S = 60          # seconds after an episode's last screenshot a face sample still counts
+FACE_STATES = ("engaged", "neutral", "fatigued")   # face_analysis.analyze_window states
+
+
+_TS_RE = re.compile(r"^(\d{4}-\d\d-\d\d)[T _](\d\d)[:-](\d\d)[:-](\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$")
+
+
+def _utc_offsets(seconds: np.ndarray) -> np.ndarray:
+    """Local UTC offset (seconds) at each UTC instant, computed once per distinct hour."""
+    hours, inv = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.asarray([
+        int(datetime.fromtimestamp(int(h) * 3600, timezone.utc).astimezone().utcoffset().total_seconds())
+        for h in hours
+    ], dtype=np.int64)
+    return offsets[inv]
+
+
+def to_seconds(values: Iterable[Any], utc: bool = False) -> np.ndarray:
+    """
+    int64 local wall-clock seconds per timestamp (ISO or screenshot style;
+    -1 where it can't be parsed). Zoned timestamps, and naive ones when
+    `utc`, are converted to local time.
+    """
+    heads, zoned, shift = [], [], []
+    for v in values:
+        if isinstance(v, datetime):
+            v = v.isoformat()
+        m = _TS_RE.match(v.strip()) if isinstance(v, str) else None
+        if m is None:
+            heads.append("NaT")
+            zoned.append(False)
+            shift.append(0)
+            continue
+        day, hh, mm, ss, tz = m.groups()
+        heads.append(f"{day}T{hh}:{mm}:{ss}")
+        zoned.append(utc or tz is not None)
+        if tz and tz != "Z":
+            sign = -1 if tz[0] == "-" else 1
+            tz = tz[1:].replace(":", "")
+            shift.append(sign * (int(tz[:2]) * 3600 + int(tz[2:]) * 60))
+        else:
+            shift.append(0)
+    parsed = np.asarray(heads, dtype="datetime64[s]")
+    bad = np.isnat(parsed)
+    secs = parsed.astype(np.int64) - np.asarray(shift, dtype=np.int64)
+    conv = np.asarray(zoned, dtype=bool) & ~bad
+    if conv.any():
+        secs[conv] += _utc_offsets(secs[conv])
+    secs[bad] = -1
+    return secs
+
+
+class IntervalIndex:
+    """
+    Disjoint [start, end] intervals sorted by start; `lookup` maps points
+    to the interval containing them (or -1), in the caller's original order.
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, slack: int = 0):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.maximum(np.asarray(ends, dtype=np.int64), starts) + slack
+        self.order = np.argsort(starts, kind="stable")
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+        if len(self.starts) > 1:
+            # clip overlaps at the next start (minus a second: intervals are closed)
+            self.ends[:-1] = np.minimum(self.ends[:-1], self.starts[1:] - 1)
+            self.ends = np.maximum(self.ends, self.starts)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def lookup(self, points: np.ndarray) -> np.ndarray:
+        points = np.asarray(points, dtype=np.int64)
+        if not len(self.starts):
+            return np.full(len(points), -1, dtype=np.int64)
+        pos = np.searchsorted(self.starts, points, side="right") - 1
+        hit = (pos >= 0) & (points <= self.ends[np.maximum(pos, 0)])
+        return np.where(hit, self.order[np.maximum(pos, 0)], -1)
+
+
+def join_facevals(episodes: Sequence[Dict[str, Any]], facevals: Sequence[Dict[str, Any]],
+                  slack_s: int = JOIN_SLACK_S) -> np.ndarray:
+    """Index into `episodes` for each face sample (-1 if it falls in none)."""
+    starts = to_seconds(e.get("start_time") for e in episodes)
+    ends = to_seconds(e.get("end_time") for e in episodes)
+    ok = (starts >= 0) & (ends >= 0)
+    index = IntervalIndex(starts[ok], ends[ok], slack=slack_s)
+    kept = np.flatnonzero(ok)
+    points = to_seconds((f.get("created_at") for f in facevals), utc=True)   # -1 (unparsed) matches nothing
+    if not len(kept):
+        return np.full(len(points), -1, dtype=np.int64)
+    idx = index.lookup(points)
+    return np.where(idx >= 0, kept[np.maximum(idx, 0)], -1)
+
+
+def _column(rows: Sequence[Dict[str, Any]], key: str) -> np.ndarray:
+    return np.asarray([r.get(key) if isinstance(r.get(key), (int, float)) else np.nan for r in rows], dtype=float)
+
+
+def episode_engagement(episodes: Sequence[Dict[str, Any]], facevals: Sequence[Dict[str, Any]],
+                       slack_s: int = JOIN_SLACK_S) -> List[Dict[str, Any]]:
+    """
+    Per episode (same order): minutes, face samples joined, mean engaged /
+    drowsy and the share of samples per face state (None without samples).
+    """
+    n = len(episodes)
+    idx = join_facevals(episodes, facevals, slack_s)
+    m = idx >= 0
+    joined = idx[m]
+    engaged, drowsy = _column(facevals, "engaged")[m], _column(facevals, "drowsy")[m]
+    states = np.asarray([f.get("state") for f in facevals], dtype=object)[m]
+
+    count = np.bincount(joined, minlength=n)
+    e_ok, d_ok = ~np.isnan(engaged), ~np.isnan(drowsy)
+    e_n = np.bincount(joined[e_ok], minlength=n)
+    e_sum = np.bincount(joined[e_ok], weights=engaged[e_ok], minlength=n)
+    d_n = np.bincount(joined[d_ok], minlength=n)
+    d_sum = np.bincount(joined[d_ok], weights=drowsy[d_ok], minlength=n)
+    state_n = {s: np.bincount(joined[states == s], minlength=n) for s in FACE_STATES}
+
+    starts = to_seconds(e.get("start_time") for e in episodes)
+    ends = to_seconds(e.get("end_time") for e in episodes)
+    minutes = np.where((starts >= 0) & (ends >= 0), ends - starts, 0) / 60.0
+    out = []
+    for i, e in enumerate(episodes):
+        c = int(count[i])
+        out.append({
+            "start_time": e.get("start_time"),
+            "end_time": e.get("end_time"),
+            "workstream_label": e.get("workstream_label") or "unknown",
+            "minutes": max(0.0, float(minutes[i])),
+            "face_samples": c,
+            "engaged": float(e_sum[i] / e_n[i]) if e_n[i] else None,
+            "drowsy": float(d_sum[i] / d_n[i]) if d_n[i] else None,
+            **{f"{s}_share": (float(state_n[s][i] / c) if c else None) for s in FACE_STATES},
+        })
+    return out
+
+
+def workstream_engagement(stats: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Per workstream: episodes, minutes, minutes with face coverage, samples,
+    sample-weighted mean engaged / drowsy, and engaged minutes (each covered
+    episode's minutes times its mean engaged).
+    """
+    labels = np.asarray([s["workstream_label"] for s in stats], dtype=object)
+    if not len(labels):
+        return {}
+    names, inv = np.unique(labels, return_inverse=True)
+    k = len(names)
+    minutes = np.asarray([s["minutes"] for s in stats], dtype=float)
+    samples = np.asarray([s["face_samples"] for s in stats], dtype=float)
+    engaged = np.asarray([np.nan if s["engaged"] is None else s["engaged"] for s in stats], dtype=float)
+    drowsy = np.asarray([np.nan if s["drowsy"] is None else s["drowsy"] for s in stats], dtype=float)
+    covered = ~np.isnan(engaged)
+
+    tot_min = np.bincount(inv, weights=minutes, minlength=k)
+    cov_min = np.bincount(inv[covered], weights=minutes[covered], minlength=k)
+    n_samples = np.bincount(inv, weights=samples, minlength=k)
+    e_w = np.bincount(inv[covered], weights=samples[covered], minlength=k)
+    e_sum = np.bincount(inv[covered], weights=(engaged * samples)[covered], minlength=k)
+    d_ok = ~np.isnan(drowsy)
+    d_w = np.bincount(inv[d_ok], weights=samples[d_ok], minlength=k)
+    d_sum = np.bincount(inv[d_ok], weights=(drowsy * samples)[d_ok], minlength=k)
+    eng_min = np.bincount(inv[covered], weights=(minutes * engaged)[covered], minlength=k)
+    n_eps = np.bincount(inv, minlength=k)
+
+    return {
+        str(names[j]): {
+            "episodes": int(n_eps[j]),
+            "minutes": float(tot_min[j]),
+            "covered_minutes": float(cov_min[j]),
+            "face_samples": int(n_samples[j]),
+            "engaged": float(e_sum[j] / e_w[j]) if e_w[j] else None,
+            "drowsy": float(d_sum[j] / d_w[j]) if d_w[j] else None,
+            "engaged_minutes": float(eng_min[j]),
+        }
+        for j in range(k)
+    }
+
+
+def load(days: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(episodes, facevals) of the last `days` days from storage."""
+    from storage import read_all
+    from storage_client import storage
+
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    # face samples are UTC; start a day early so the local-time edge is covered
+    face_since = (datetime.now() - timedelta(days=days + 1)).strftime("%Y-%m-%d")
+    return (
+        read_all(lambda limit, offset: storage.episodes_since(since, limit=limit, offset=offset)),
+        read_all(lambda limit, offset: storage.facevals_since(face_since, limit=limit, offset=offset)),
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--slack", type=int, default=JOIN_SLACK_S, help="seconds after an episode's end still joined")
+    args = ap.parse_args()
+
+    episodes, facevals = load(args.days)
+    t0 = time.perf_counter()
+    stats = episode_engagement(episodes, facevals, args.slack)
+    per_ws = workstream_engagement(stats)
+    dt = time.perf_counter() - t0
+
+    joined = sum(s["face_samples"] for s in stats)
+    print(f"{len(episodes)} episodes, {len(facevals)} face samples over {args.days} days; "
+          f"{joined} samples joined ({joined / max(1, len(facevals)):.0%}) in {1000 * dt:.1f} ms\n")
+    fmt = lambda v: f"{v:.2f}" if v is not None else "-"
+    print(f"{'workstream':<40} {'eps':>4} {'min':>7} {'covered':>8} {'samples':>8} {'engaged':>8} {'drowsy':>7} {'eng. min':>9}")
+    for name, w in sorted(per_ws.items(), key=lambda kv: -kv[1]["minutes"]):
+        print(f"{name[:40]:<40} {w['episodes']:>4} {w['minutes']:>7.0f} {w['covered_minutes']:>8.0f} "
+              f"{w['face_samples']:>8} {fmt(w['engaged']):>8} {fmt(w['drowsy']):>7} {w['engaged_minutes']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# telemetry.py
+"""
+Per-stage timing spans and counters, exported in Prometheus text format.
+
+    from telemetry import span, inc
+    with span("vision"):
+        summary = analyze_screenshot_with_openai(path)
+    inc("capture_skips_total", reason="unchanged")
+
+Spans feed a `stage_seconds{stage=...}` histogram (and `stage_errors_total`
+when the block raises); counters and callback gauges cover cache hits,
+skips, retries and queue depths. Export is either an HTTP endpoint
+(TELEMETRY_PORT, scrape http://localhost:<port>/metrics) or a file
+rewritten every TELEMETRY_FLUSH_SECONDS (TELEMETRY_FILE), or both.
+
+Disabled unless TELEMETRY=1: span() then hands back one shared no-op
+context manager and inc()/observe() return on the first line, so the
+instrumentation costs a function call per site.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+ENABLED = os.getenv("TELEMETRY") == "1"
+TELEMETRY_PORT = int(os.getenv("TELEMETRY_PORT", "0"))           # 0 = no HTTP endpoint
+TELEMETRY_FILE = os.getenv("TELEMETRY_FILE")                      # e.g. metrics.prom
+TELEMETRY_FLUSH_SECONDS = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "15"))
+
+# seconds; spans run from sub-ms DB calls to multi-second vision calls
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+# ---------- Registry --------------------------------------------------------
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)    # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, LabelKey], _Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], Callable[[], float]] = {}
+
+    def observe(self, name: str, value: float, labels: LabelKey) -> None:
+        with self._lock:
+            h = self._hist.get((name, labels))
+            if h is None:
+                h = self._hist[(name, labels)] = _Histogram()
+            h.observe(value)
+
+    def inc(self, name: str, n: float, labels: LabelKey) -> None:
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0.0) + n
+
+    def gauge(self, name: str, fn: Callable[[], float], labels: LabelKey) -> None:
+        with self._lock:
+            self._gauges[(name, labels)] = fn
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            hists = sorted((k, (list(h.counts), h.sum, h.count)) for k, h in self._hist.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items(), key=lambda kv: kv[0])
+
+        out: List[str] = []
+        typed = set()
+
+        def _type(name: str, kind: str) -> None:
+            if name not in typed:
+                typed.add(name)
+                out.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), (counts, total, count) in hists:
+            _type(name, "histogram")
+            cumulative = 0
+            for bound, c in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append(f"{name}_bucket{_fmt_labels(labels + (('le', le),))} {cumulative}")
+            out.append(f"{name}_sum{_fmt_labels(labels)} {total}")
+            out.append(f"{name}_count{_fmt_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            _type(name, "counter")
+            out.append(f"{name}{_fmt_labels(labels)} {value:g}")
+        for (name, labels), fn in gauges:
+            try:
+                value = float(fn())
+            except Exception:
+                continue     # a gauge whose owner went away shouldn't break the scrape
+            _type(name, "gauge")
+            out.append(f"{name}{_fmt_labels(labels)} {value:g}")
+        return "\n".join(out) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """{'stage': {'count', 'sum'}} per span, for quick printing."""
+        with self._lock:
+            return {
+                dict(labels).get("stage", name): {"count": h.count, "sum": h.sum}
+                for (name, labels), h in self._hist.items()
+                if name == "stage_seconds"
+            }
+
+
+def _labels(kw: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in kw.items()))
+
+
+def _fmt_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+registry = Registry()
+
+
+# ---------- Instrumentation API ---------------------------------------------
+
+class _Span:
+    __slots__ = ("_labels", "_t0")
+
+    def __init__(self, labels: LabelKey):
+        self._labels = labels
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe("stage_seconds", time.perf_counter() - self._t0, self._labels)
+        if exc_type is not None:
+            registry.inc("stage_errors_total", 1, self._labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str):
+    """Time the enclosed block into stage_seconds{stage=...}."""
+    if not ENABLED:
+        return _NOOP
+    return _Span((("stage", stage),))
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a duration measured elsewhere (e.g. on a worker's done-callback)."""
+    if ENABLED:
+        registry.observe("stage_seconds", seconds, (("stage", stage),))
+
+
+def inc(name: str, n: float = 1, **labels) -> None:
+    if ENABLED:
+        registry.inc(name, n, _labels(labels))
+
+
+def gauge(name: str, fn: Callable[[], float], **labels) -> None:
+    """Register a callback read at export time (queue depths and the like)."""
+    if ENABLED:
+        registry.gauge(name, fn, _labels(labels))
+
+
+# ---------- Exporters -------------------------------------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def write_file(path: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+def _file_loop(path: str, every: float) -> None:
+    while True:
+        time.sleep(every)
+        try:
+            write_file(path)
+        except Exception as e:
+            print(f"(TEL.e) writing {path} failed: {e}")
+
+
+_started = False
+
+
+def start(port: Optional[int] = None, path: Optional[str] = None) -> None:
+    """
+    Start the configured exporters (idempotent; no-op when disabled).
+    Arguments override TELEMETRY_PORT / TELEMETRY_FILE.
+    """
+    global _started
+    if not ENABLED or _started:
+        return
+    _started = True
+    port = TELEMETRY_PORT if port is None else port
+    path = TELEMETRY_FILE if path is None else path
+    if port:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="telemetry-http", daemon=True).start()
+        print(f"(TEL) metrics on http://127.0.0.1:{port}/metrics")
+    if path:
+        threading.Thread(target=_file_loop, args=(path, TELEMETRY_FLUSH_SECONDS),
+                         name="telemetry-file", daemon=True).start()
+        print(f"(TEL) metrics written to {path} every {TELEMETRY_FLUSH_SECONDS:g}s")
@@ -0,0 +1,60 @@
+# conftest.py
+"""
+Shared fixtures. The pipeline modules are driven offline through
+benchmarks.fakes (installed once, before anything imports storage_client),
+and coherence is replaced per test by a deterministic stub.
+"""
+import os
+import sys
+import threading
+from typing import Any, Dict, List
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import install_fakes
+
+install_fakes(seed=0)
+
+from subfuncEp import episoder  # noqa: E402  (after the fakes)
+import telemetry  # noqa: E402
+from episode_helpers import GatedCoherence  # noqa: E402
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    """Telemetry counters incremented during the test: (name, sorted labels) → total."""
+    seen: Dict[Any, float] = {}
+    lock = threading.Lock()
+
+    def inc(name, n=1, **labels):
+        with lock:
+            key = (name, tuple(sorted(labels.items())))
+            seen[key] = seen.get(key, 0) + n
+
+    monkeypatch.setattr(telemetry, "inc", inc)
+    return seen
+
+
+@pytest.fixture
+def episodes(monkeypatch):
+    """
+    Fresh episoder state with the gated coherence stub; yields (stub,
+    stored) where `stored` collects each flushed episode's timestamps.
+    """
+    stub = GatedCoherence()
+    stored: List[List[str]] = []
+    monkeypatch.setattr(episoder, "coherence_with_episode", stub)
+    monkeypatch.setattr(episoder, "current_episode", None)
+    monkeypatch.setattr(episoder, "pending_buffer", [])
+    monkeypatch.setattr(episoder, "_last_queued", None)
+    episoder._inflight.clear()
+
+    def listener(ep):
+        stored.append([r["timestamp"] for r in ep.screenshot_rows])
+
+    episoder.episode_flush_listeners.append(listener)
+    yield stub, stored
+    episoder.episode_flush_listeners.remove(listener)
+    episoder._inflight.clear()
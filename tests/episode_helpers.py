@@ -0,0 +1,73 @@
+# episode_helpers.py
+"""Rows, a controllable coherence stub and the sequential baseline for the episoder tests."""
+import threading
+from typing import Any, Dict, List
+
+from subfuncEp import episoder
+
+
+def shot(ts: str, label: str) -> Dict[str, Any]:
+    return {
+        "timestamp": ts,
+        "workstream_label": label,
+        "deliverable_label": f"{label} deliverable",
+        "app_or_website": "VS Code",
+        "work_type": "coding",
+        "goal_type": "telic",
+    }
+
+
+def rows_from(labels: str, minute: int = 9) -> List[Dict[str, Any]]:
+    """One row per character of `labels`, ten seconds apart."""
+    return [shot(f"2025-03-03_{minute:02d}-{i // 6:02d}-{i % 6 * 10:02d}", c) for i, c in enumerate(labels)]
+
+
+class GatedCoherence:
+    """
+    coherence_with_episode stand-in: 0.9 if the row's label matches the
+    episode's first row, else 0.1 (so a score never depends on how far
+    the episode has grown). Calls for a row block until `release(ts)`;
+    rows not gated answer at once.
+    """
+
+    def __init__(self):
+        self._events: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.calls: List[str] = []
+
+    def gate(self, *timestamps: str) -> None:
+        with self._lock:
+            for ts in timestamps:
+                self._events[ts] = threading.Event()
+
+    def release(self, *timestamps: str) -> None:
+        for ts in timestamps:
+            self._events[ts].set()
+
+    def __call__(self, episode, row) -> float:
+        with self._lock:
+            self.calls.append(row["timestamp"])
+            event = self._events.get(row["timestamp"])
+        if event is not None:
+            assert event.wait(10), f"coherence for {row['timestamp']} never released"
+        return 0.9 if row["workstream_label"] == episode.screenshot_rows[0]["workstream_label"] else 0.1
+
+
+def sequential_episodes(rows: List[Dict[str, Any]]) -> List[List[str]]:
+    """Episodes the blocking advance_episoder makes of `rows`, one at a time."""
+    stored: List[List[str]] = []
+    saved = (episoder.current_episode, episoder.pending_buffer, episoder._last_queued)
+    coherence = episoder.coherence_with_episode
+    episoder.current_episode, episoder.pending_buffer, episoder._last_queued = None, [], None
+    episoder.coherence_with_episode = GatedCoherence()
+    listeners = episoder.episode_flush_listeners[:]
+    episoder.episode_flush_listeners[:] = [lambda ep: stored.append([r["timestamp"] for r in ep.screenshot_rows])]
+    try:
+        for r in rows:
+            episoder.advance_episoder(r)
+        episoder.flush_current_episode()
+    finally:
+        episoder.episode_flush_listeners[:] = listeners
+        episoder.coherence_with_episode = coherence
+        episoder.current_episode, episoder.pending_buffer, episoder._last_queued = saved
+    return stored
@@ -0,0 +1,106 @@
+# test_episoder.py
+"""
+Speculative coherence scoring in subfuncEp.episoder: every way a row's
+score can be taken (hit, tentative hit, miss and re-score) must commit the
+same episodes as feeding the rows one at a time through advance_episoder.
+"""
+import random
+
+import pytest
+
+from episode_helpers import rows_from, sequential_episodes
+from subfuncEp import episoder
+
+
+def _speculation(counters, result):
+    return counters.get(("coherence_speculation_total", (("result", result),)), 0)
+
+
+def _stamps(rows, labels):
+    return [r["timestamp"] for r in rows if r["workstream_label"] in labels]
+
+
+def test_hit_tentative_hit_and_miss_match_sequential(episodes, counters):
+    stub, stored = episodes
+    rows = rows_from("AAABBBBCCCC")
+    a, b, c = rows[:3], rows[3:7], rows[7:]
+    expected = sequential_episodes(rows)
+    assert expected == [_stamps(rows, "A"), _stamps(rows, "B"), _stamps(rows, "C")]
+    counters.clear()
+
+    # A1-A3 extend, B1-B2 wait in the buffer: each scored against the episode it commits to
+    for r in a + b[:2]:
+        episoder.advance_episoder_async(r).result(5)
+
+    # B3 and B4 are both scored while B1-B2 are buffered; B3 makes the
+    # switch, so B4's score against the old episode is stale and its
+    # score against the tentative episode (B1, B2) is the one to use
+    stub.gate(b[2]["timestamp"], b[3]["timestamp"])
+    done = [episoder.advance_episoder_async(r) for r in b[2:]]
+    stub.release(b[2]["timestamp"])
+    done[0].result(5)
+    stub.release(b[3]["timestamp"])
+    done[1].result(5)
+    assert _speculation(counters, "tentative_hit") == 1
+
+    # C1-C4 are all scored against the B episode with nothing buffered;
+    # C3 switches, so C4 has no usable speculation and is scored again
+    stub.gate(*(r["timestamp"] for r in c))
+    done = [episoder.advance_episoder_async(r) for r in c]
+    stub.release(*(r["timestamp"] for r in c))
+    for f in done:
+        f.result(5)
+    assert _speculation(counters, "miss") == 1
+    assert stub.calls.count(c[3]["timestamp"]) == 2
+
+    episoder.flush_current_episode()
+    assert stored == expected
+    # A2, A3, B1, B2, B3, C1, C2, C3, and C4 after its re-score
+    assert _speculation(counters, "hit") == 9
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_any_completion_order_matches_sequential(episodes, seed):
+    stub, stored = episodes
+    rows = rows_from("AAAAABBAAAACCCCCDDADDDDDEEFEEEEAAA")
+    expected = sequential_episodes(rows)
+
+    rng = random.Random(seed)
+    stub.gate(*(r["timestamp"] for r in rows))
+    unreleased = [r["timestamp"] for r in rows]
+    done = []
+    for r in rows:
+        done.append(episoder.advance_episoder_async(r))
+        # answer a random handful of outstanding calls, in random order
+        rng.shuffle(unreleased)
+        k = rng.randint(0, len(unreleased))
+        stub.release(*unreleased[:k])
+        del unreleased[:k]
+    stub.release(*unreleased)
+    for f in done:
+        f.result(5)
+    episoder.flush_current_episode()
+
+    assert stored == expected
+
+
+def test_out_of_order_row_is_skipped(episodes, counters):
+    stub, stored = episodes
+    rows = rows_from("AAAA")
+    for r in rows[:3]:
+        episoder.advance_episoder_async(r)
+    late = episoder.advance_episoder_async(dict(rows[0], workstream_label="B"))
+    assert late.done() and late.result() is None
+    episoder.advance_episoder_async(rows[3])
+    episoder.flush_current_episode()
+
+    assert stored == [_stamps(rows, "A")]
+    assert counters[("screenshot_skips_total", (("reason", "out_of_order"),))] == 1
+
+
+def test_row_without_timestamp_is_skipped(episodes):
+    stub, stored = episodes
+    done = episoder.advance_episoder_async({"workstream_label": "A"})
+    assert done.done() and done.result() is None
+    episoder.flush_current_episode()
+    assert stored == []
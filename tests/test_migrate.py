@@ -0,0 +1,39 @@
+# test_migrate.py
+"""archive.migrate: running it again, or after a partial run, adds nothing twice."""
+import io
+import os
+
+from PIL import Image
+
+from archive.migrate import migrate
+from archive.segments import Archive
+
+
+def _png(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _capture(src, name, color):
+    with open(os.path.join(src, name), "wb") as f:
+        f.write(_png(color))
+
+
+def test_rerun_does_not_duplicate_captures(tmp_path):
+    src, dst = tmp_path / "shots", tmp_path / "archive"
+    src.mkdir()
+    _capture(src, "2025-03-03_10-00-00_000.png", "red")
+    _capture(src, "2025-03-03_10-00-00_500.png", "blue")
+    assert migrate(str(src), str(dst)) == 2
+
+    _capture(src, "2025-03-03_10-00-10_000.png", "green")     # arrived since the first run
+    migrate(str(src), str(dst))
+    migrate(str(src), str(dst), delete=True)
+
+    archive = Archive(str(dst))
+    ts = [e.ts_ms for e in archive.range()]
+    assert [t - ts[0] for t in ts] == [0, 500, 10000]
+    assert len(archive) == 3
+    assert os.listdir(src) == []
+    archive.close()
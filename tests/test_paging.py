@@ -0,0 +1,92 @@
+# test_paging.py
+"""
+storage.read_all against the fake Supabase, which like PostgREST returns at
+most 1000 rows per select: readers of long histories must page.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import storage_client
+from benchmarks.fakes import FakeSupabase
+from storage import read_all
+from storage.supabase_store import SupabaseStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    s = SupabaseStore(FakeSupabase())
+    monkeypatch.setattr(storage_client, "storage", s)
+    return s
+
+
+def _ago(seconds: float, fmt: str) -> str:
+    return (datetime.now() - timedelta(seconds=seconds)).strftime(fmt)
+
+
+def test_read_all_reads_past_the_response_cap(store):
+    # 7 rows per timestamp, so ties straddle every page boundary
+    for i in range(2500):
+        store.insert_screenshot({"timestamp": f"2025-03-03_10-{i // 7 // 60:02d}-{i // 7 % 60:02d}"})
+    assert len(store.screenshots_since("2025-03-03")) == 1000
+
+    rows = read_all(lambda limit, offset: store.screenshots_since("2025-03-03", limit=limit, offset=offset))
+    assert [r["id"] for r in rows] == list(range(1, 2501))
+
+
+def test_sweep_history_is_not_truncated(store):
+    from subfuncEp.episode_sweep import load_history
+
+    for i in range(2300, 0, -1):
+        ts = _ago(10 * i, "%Y-%m-%d_%H-%M-%S")
+        store.insert_screenshot({"timestamp": ts, "deliverable_id": 1, "workstream_id": 1})
+        store.insert_coherence_label({"screenshot_timestamp": ts, "episode_start_time": f"{i // 2}",
+                                      "coherence_score": 0.5, "label_source": "gpt"})
+        if i % 2 == 0:
+            store.insert_episode({"start_time": _ago(10 * i, "%Y-%m-%dT%H:%M:%S")})
+
+    shots, cached, stored = load_history(days=1)
+    assert (len(shots), len(cached), len(stored)) == (2300, 2300, 1150)
+
+
+def test_engagement_load_reads_every_face_sample(store):
+    from subfuncsProcessing.engagement import load
+
+    for i in range(2200, 0, -1):
+        store.insert_faceval({"created_at": _ago(i, "%Y-%m-%dT%H:%M:%S"), "state": "engaged",
+                              "drowsy": 0.1, "engaged": 0.8})
+    for i in range(1100, 0, -1):
+        store.insert_episode({"start_time": _ago(2 * i, "%Y-%m-%dT%H:%M:%S")})
+
+    episodes, facevals = load(days=1)
+    assert (len(episodes), len(facevals)) == (1100, 2200)
+
+
+def test_app_classifier_warms_up_on_recent_apps(store, monkeypatch):
+    from subfuncsProcessing import app_classifier
+
+    monkeypatch.setattr(app_classifier, "_classifier", None)
+    for i in range(1500, 0, -1):
+        app = ("VS Code", "ide", "coding") if i > 10 else ("Figma", "design", "designing")
+        store.insert_screenshot({"timestamp": _ago(10 * i, "%Y-%m-%d_%H-%M-%S"), "app_or_website": app[0],
+                                 "app_bucket": app[1], "work_type": app[2]})
+
+    labels = app_classifier.get_classifier().classify({"app": "Figma", "title": ""})
+    assert labels is not None and labels["app_bucket"] == "design"
+
+
+def test_transition_cache_warms_up_on_every_label(store, monkeypatch, capsys):
+    from subfuncEp import transition_cache
+
+    monkeypatch.setattr(transition_cache, "_cache", None)
+    ep = {"dominant_workstream_label": "AI Mirror product", "dominant_deliverable_label": "Prepare pitch deck v3",
+          "dominant_app_bucket": "ide", "dominant_work_type": "coding"}
+    shot = {"workstream_label": "AI Mirror product", "deliverable_label": "Prepare pitch deck v3",
+            "app_bucket": "browser", "work_type": "reading"}
+    for i in range(1700, 0, -1):
+        store.insert_coherence_label({"screenshot_timestamp": _ago(10 * i, "%Y-%m-%d_%H-%M-%S"),
+                                      "coherence_score": 0.9, "label_source": "gpt",
+                                      "episode_descriptor": ep, "screenshot_descriptor": shot})
+
+    transition_cache.get_transition_cache()
+    assert "learned transitions from 1700 coherence labels" in capsys.readouterr().out
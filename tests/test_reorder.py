@@ -0,0 +1,116 @@
+# test_reorder.py
+"""
+subfuncEp.reorder.ReorderBuffer: rows settled in any order, from any
+thread, reach the sink in slot order; a slot left unsettled past its
+timeout is skipped, and its row is dropped if it turns up later.
+"""
+import random
+import threading
+
+import pytest
+
+from episode_helpers import rows_from, sequential_episodes
+from subfuncEp import episoder
+from subfuncEp.reorder import ReorderBuffer
+
+
+@pytest.fixture
+def make_buffer():
+    buffers = []
+
+    def make(sink, timeout=30.0):
+        buf = ReorderBuffer(sink, timeout=timeout)
+        buffers.append(buf)
+        return buf
+
+    yield make
+    for buf in buffers:
+        buf.close()
+
+
+def test_rows_released_in_slot_order(make_buffer):
+    got = []
+    buf = make_buffer(got.append)
+    slots = [buf.reserve(str(i)) for i in range(6)]
+
+    buf.complete(slots[3], {"n": 3})
+    buf.complete(slots[1], {"n": 1})
+    assert got == []                       # slot 0 still open
+    buf.fail(slots[2])
+    buf.complete(slots[0], {"n": 0})
+    assert got == [{"n": 0}, {"n": 1}, {"n": 3}]
+    buf.complete(slots[5], {"n": 5})
+    buf.complete(slots[4], None)           # None counts as a failure
+    assert buf.drain(timeout=1)
+    assert got == [{"n": 0}, {"n": 1}, {"n": 3}, {"n": 5}]
+
+
+def test_sink_error_does_not_stall_the_queue(make_buffer):
+    got = []
+
+    def sink(row):
+        if row["n"] == 1:
+            raise RuntimeError("boom")
+        got.append(row)
+
+    buf = make_buffer(sink)
+    slots = [buf.reserve() for _ in range(3)]
+    for i in reversed(slots):
+        buf.complete(i, {"n": i})
+    assert buf.drain(timeout=1)
+    assert got == [{"n": 0}, {"n": 2}]
+
+
+def test_unsettled_slot_times_out_and_late_row_is_dropped(make_buffer, counters):
+    got = []
+    buf = make_buffer(got.append, timeout=0.2)
+    slots = [buf.reserve(str(i)) for i in range(3)]
+    buf.complete(slots[1], {"n": 1})
+    buf.complete(slots[2], {"n": 2})
+
+    assert buf.drain(timeout=5)            # the watchdog skips slot 0
+    assert got == [{"n": 1}, {"n": 2}]
+    assert counters[("reorder_timeouts_total", ())] == 1
+
+    buf.complete(slots[0], {"n": 0})       # the hung worker finally answers
+    assert got == [{"n": 1}, {"n": 2}]
+    assert counters[("reorder_late_total", ())] == 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_concurrent_workers_feed_episoder_like_sequential(episodes, make_buffer, seed):
+    stub, stored = episodes
+    rows = rows_from("AAAABBBBBAACCCCDCCCCEEEE")
+    expected = sequential_episodes(rows)
+
+    buf = make_buffer(episoder.advance_episoder_async)
+    slots = [buf.reserve(r["timestamp"]) for r in rows]
+    order = list(range(len(rows)))
+    random.Random(seed).shuffle(order)
+    workers = [threading.Thread(target=buf.complete, args=(slots[i], rows[i])) for i in order]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(5)
+    assert buf.drain(timeout=5)
+    episoder.flush_current_episode()
+
+    assert stored == expected
+
+
+def test_skipped_slot_leaves_episodes_of_the_rest(episodes, make_buffer):
+    stub, stored = episodes
+    rows = rows_from("AAAABBBBCCCC")
+    lost = 5
+    expected = sequential_episodes(rows[:lost] + rows[lost + 1:])
+
+    buf = make_buffer(episoder.advance_episoder_async, timeout=0.2)
+    slots = [buf.reserve(r["timestamp"]) for r in rows]
+    for i in reversed(range(len(rows))):
+        if i != lost:
+            buf.complete(slots[i], rows[i])
+    assert buf.drain(timeout=5)
+    buf.complete(slots[lost], rows[lost])  # too late: must not reach the episoder
+    episoder.flush_current_episode()
+
+    assert stored == expected
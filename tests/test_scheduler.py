@@ -0,0 +1,50 @@
+# test_scheduler.py
+"""
+subfuncsInput.scheduler.AdaptiveScheduler, on an injected clock: failed
+captures still space the loop out and back the cadence off.
+"""
+from subfuncsInput.scheduler import GROWTH, AdaptiveScheduler
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.now += s
+
+
+def _scheduler(clock):
+    return AdaptiveScheduler(
+        min_interval=3, base_interval=10, max_interval=60,
+        idle_fn=None, window_fn=lambda: None, clock=clock, sleep=clock.sleep,
+    )
+
+
+def test_persistent_capture_failure_backs_off_instead_of_spinning():
+    clock = _Clock()
+    sch = _scheduler(clock)
+    waits = []
+    for _ in range(8):
+        start = clock.now
+        assert sch.wait() == "due"
+        waits.append(clock.now - start)
+        sch.observe_failure()
+    assert all(w >= 3 for w in waits)
+    assert waits[1] == 10 * GROWTH and waits[2] == 10 * GROWTH ** 2
+    assert waits[-1] == 60
+    assert sch.interval == 60
+
+
+def test_capture_after_failures_resets_to_the_normal_cadence():
+    clock = _Clock()
+    sch = _scheduler(clock)
+    sch.wait()
+    sch.observe_failure()
+    sch.observe_failure()
+    assert sch.observe(None) == 10 * GROWTH ** 2 / 2
@@ -0,0 +1,21 @@
+# test_sticky.py
+"""
+subfuncEp.semantic_canonicalizer.StickyCanonicalizer: a screenshot reuses
+the previous ids only while it names the same deliverable.
+"""
+from subfuncEp import semantic_canonicalizer as sc
+
+SUMMARY = "Working on BIOG 1500 course in Notion, step {}."
+
+
+def test_new_deliverable_in_same_workstream_is_not_sticky():
+    sticky = sc.StickyCanonicalizer(radius=0.9)
+    first = sticky.canonicalize("BIOG 1500 course", "Study for BIOG Exam 2", SUMMARY.format(1))
+    again = sticky.canonicalize("BIOG 1500 course", "study for  BIOG exam 2", SUMMARY.format(2))
+    assert again == first and sticky.hits == 1
+
+    other = sticky.canonicalize("BIOG 1500 course", "Finish lab report section 3", SUMMARY.format(3))
+    assert sticky.hits == 1 and sticky.misses == 2
+    assert other[:2] == first[:2]
+    assert other[2] != first[2] and other[3] == "Finish lab report section 3"
+    sticky.flush()
@@ -1,10 +1,34 @@
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
-import supabase
 import os
 
-# Assuming supabase_client.py contains the initialized Supabase client
-from supabase_client import supabase
+# storage_client.py holds the configured backend (Supabase or local SQLite)
+from storage import read_all
+from storage_client import storage
+from subfuncsProcessing.engagement import episode_engagement, workstream_engagement
+
+# face_analysis.analyze_window caps 'engaged' at 1 - 0.2, so that's full engagement
+MAX_ENGAGED = 0.8
+
+# read through the local columnar mirror (storage/mirror.py, needs pyarrow),
+# delta-synced once per run, instead of re-downloading the whole window
+USE_MIRROR = True
+_mirror = None
+
+def get_mirror():
+    """The synced mirror, or None if it is off or unavailable (reads then go to storage)."""
+    global _mirror
+    if _mirror is None and USE_MIRROR:
+        try:
+            from storage.mirror import Mirror
+
+            m = Mirror()
+            fetched = m.sync(("screenshots", "facevals"))
+            print(f"Synced local mirror: {fetched}")
+            _mirror = m
+        except Exception as e:
+            print(f"Local mirror unavailable ({e}); reading from storage.")
+    return _mirror
 
 class Episode:
     def __init__(self, start_time: datetime, end_time: datetime, app_or_website: str, topic: str, work_type: str, screenshot_count: int):
@@ -15,10 +39,13 @@ class Episode:
         self.topic = topic
         self.work_type = work_type
         self.screenshot_count = screenshot_count
+        self.engaged = None       # mean face 'engaged' over the episode, set by attach_engagement
+        self.face_samples = 0
 
     def __repr__(self):
+        engaged = f", engaged={self.engaged:.2f}" if self.engaged is not None else ""
         return (f"Episode(start='{self.start_time}', end='{self.end_time}', duration={self.duration:.2f}m, "
-                f"app='{self.app_or_website}', topic='{self.topic}', work_type='{self.work_type}', count={self.screenshot_count})")
+                f"app='{self.app_or_website}', topic='{self.topic}', work_type='{self.work_type}', count={self.screenshot_count}{engaged})")
 
 def parse_timestamp(ts: str) -> datetime:
     """
@@ -35,23 +62,52 @@ def parse_timestamp(ts: str) -> datetime:
 
 def fetch_screenshots(days_ago: int = 7) -> List[Dict[str, Any]]:
     """
-    Fetches screenshot records from the Supabase 'screenshots' table from the last `days_ago` days.
+    Fetches screenshot records from the 'screenshots' table from the last `days_ago` days
+    (from the local mirror when available).
     """
-    print("Fetching screenshot data from Supabase...")
     # The 'timestamp' is a string like '2025-12-01_21-03-46'
     # We need to query based on this string format.
     start_date = datetime.now() - timedelta(days=days_ago)
     start_date_str = start_date.strftime('%Y-%m-%d')
     
-    response = supabase.table('screenshots').select("*").gt('timestamp', start_date_str).order('timestamp', desc=False).execute()
+    mirror = get_mirror()
+    if mirror is not None:
+        rows = mirror.read("screenshots", start=start_date_str).sort_by("timestamp").to_pylist()
+    else:
+        print("Fetching screenshot data from Supabase...")
+        rows = read_all(lambda limit, offset: storage.screenshots_since(start_date_str, limit=limit, offset=offset))
     
-    if response.data:
-        print(f"Successfully fetched {len(response.data)} records.")
-        return response.data
+    if rows:
+        print(f"Successfully fetched {len(rows)} records.")
+        return rows
     else:
         print("No data found or there was an error.")
         return []
 
+def fetch_facevals(days_ago: int = 7) -> List[Dict[str, Any]]:
+    """
+    Fetches face samples ('facevals') from the last `days_ago` days (one extra
+    day back, since they are stamped in UTC).
+    """
+    start_date_str = (datetime.now() - timedelta(days=days_ago + 1)).strftime('%Y-%m-%d')
+    mirror = get_mirror()
+    if mirror is not None:
+        rows = mirror.read("facevals", start=start_date_str).sort_by("created_at").to_pylist()
+    else:
+        rows = read_all(lambda limit, offset: storage.facevals_since(start_date_str, limit=limit, offset=offset))
+    print(f"Fetched {len(rows)} face samples.")
+    return rows
+
+def attach_engagement(episodes: List[Episode], facevals: List[Dict[str, Any]]) -> None:
+    """
+    Sets each episode's mean face engagement and sample count, joining the
+    samples onto the episodes' time spans (subfuncsProcessing/engagement.py).
+    """
+    spans = [{"start_time": e.start_time, "end_time": e.end_time} for e in episodes]
+    for e, stats in zip(episodes, episode_engagement(spans, facevals)):
+        e.engaged = stats["engaged"]
+        e.face_samples = stats["face_samples"]
+
 def group_into_episodes(screenshots: List[Dict[str, Any]], max_gap_minutes: int = 5) -> List[Episode]:
     """
     Groups a time-sorted list of screenshots into contiguous episodes of activity.
@@ -146,7 +202,9 @@ def calculate_discipline_score(episodes: List[Episode], today: datetime) -> floa
 
     for e in episodes:
         if e.work_type == 'deep_work':
-            total_deep_work_minutes += e.duration
+            # minutes count in proportion to measured engagement (in full if no face data)
+            weight = 1.0 if e.engaged is None else min(e.engaged / MAX_ENGAGED, 1.0)
+            total_deep_work_minutes += e.duration * weight
             work_start_times.append(e.start_time)
 
     # Rule from user prompt: c_Discipline(e) = gamma1 * norm_deep_minutes_today + gamma2 * norm_streak_length
@@ -175,12 +233,23 @@ if __name__ == "__main__":
     screenshot_data = fetch_screenshots(days_ago=7)
     
     if screenshot_data:
-        # 2. Group into episodes
+        # 2. Group into episodes, with face engagement joined on
         episodes = group_into_episodes(screenshot_data)
+        facevals = fetch_facevals(days_ago=7)
+        attach_engagement(episodes, facevals)
         
         for ep in episodes:
             print(ep)
 
+        # Engagement per workstream, over the episoder's stored episodes
+        week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+        stored = read_all(lambda limit, offset: storage.episodes_since(week_ago, limit=limit, offset=offset))
+        for name, w in sorted(workstream_engagement(episode_engagement(stored, facevals)).items(),
+                              key=lambda kv: -kv[1]["minutes"]):
+            engaged = f"{w['engaged']:.2f}" if w["engaged"] is not None else "n/a"
+            print(f"Workstream '{name}': {w['minutes']:.0f} min over {w['episodes']} episodes, "
+                  f"engaged {engaged} ({w['face_samples']} face samples)")
+
         # 3. Calculate Discipline score
         today = datetime.now()
         discipline_score = calculate_discipline_score(episodes, today)